@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/3.2/ref/settings/
 """
 import os
+import tempfile
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -59,6 +60,153 @@ REST_FRAMEWORK = {
     ),
 }
 
+# Per-process cache of verified JWTs (see tlc.core.auth.TokenCache)
+JWT_CACHE_MAXSIZE = int(os.environ.get('JWT_CACHE_MAXSIZE', 10000))
+JWT_CACHE_TTL = int(os.environ.get('JWT_CACHE_TTL', 300))
+
+# Bounded pool for password hashing (see tlc.core.hashing.PasswordHasherPool)
+PASSWORD_HASHING_WORKERS = int(os.environ.get('PASSWORD_HASHING_WORKERS', os.cpu_count() or 1))
+PASSWORD_HASHING_QUEUE = int(os.environ.get('PASSWORD_HASHING_QUEUE', 32))
+
+# Outgoing email (see tlc.core.outbox)
+EMAIL_HOST = os.environ.get('EMAIL_HOST', 'smtp.yandex.ru')
+EMAIL_PORT = int(os.environ.get('EMAIL_PORT', 587))
+EMAIL_USE_TLS = os.environ.get('EMAIL_USE_TLS', '1') == '1'
+EMAIL_HOST_USER = os.environ.get('EMAIL_LOGIN')
+EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_PASSWORD')
+EMAIL_TIMEOUT = 30
+EMAIL_OUTBOX_AUTOSTART = os.environ.get('EMAIL_OUTBOX_AUTOSTART', '1') == '1'
+EMAIL_OUTBOX_POOL_SIZE = 2
+EMAIL_OUTBOX_BATCH_SIZE = 20
+EMAIL_OUTBOX_MAX_ATTEMPTS = 6
+EMAIL_OUTBOX_BACKOFF = 30
+EMAIL_OUTBOX_MAX_BACKOFF = 3600
+EMAIL_OUTBOX_LEASE = 300
+EMAIL_OUTBOX_POLL_INTERVAL = 10
+
+# "shared" is the cache seen by every worker (memcached at SHARED_CACHE_LOCATION,
+# e.g. "memcached:11211"). Without it a per-process cache is used, which is only
+# correct with a single worker process.
+SHARED_CACHE_LOCATION = os.environ.get('SHARED_CACHE_LOCATION', '')
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+        'LOCATION': SHARED_CACHE_LOCATION,
+    } if SHARED_CACHE_LOCATION else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'shared',
+    },
+}
+
+# Password reset codes (see tlc.core.codes), kept in the shared cache so a code
+# issued by one worker can be checked by another.
+CONFIRM_CODE_STORE = os.environ.get('CONFIRM_CODE_STORE', 'tlc.core.codes.CacheCodeStore')
+CONFIRM_CODE_CACHE = os.environ.get('CONFIRM_CODE_CACHE', 'shared')
+CONFIRM_CODE_TTL = 15 * 60
+CONFIRM_CODE_MAX_ATTEMPTS = 5
+# At most CONFIRM_CODE_MAX_ISSUES codes per user per CONFIRM_CODE_WINDOW seconds;
+# wrong attempts are counted per window, so re-requesting a code does not reset them.
+CONFIRM_CODE_MAX_ISSUES = 3
+CONFIRM_CODE_WINDOW = 60 * 60
+
+# Push notifications on new content (see tlc.core.push). FIREBASE_CREDENTIALS is
+# the path to the service account JSON; without it pushes are off and stubbed.
+FIREBASE_CREDENTIALS = os.environ.get('FIREBASE_CREDENTIALS', '')
+PUSH_ON_PUBLISH = os.environ.get('PUSH_ON_PUBLISH', '1' if FIREBASE_CREDENTIALS else '0') == '1'
+PUSH_TRANSPORT = os.environ.get(
+    'PUSH_TRANSPORT', 'tlc.core.push.FirebaseTransport' if FIREBASE_CREDENTIALS else 'tlc.core.push.StubTransport',
+)
+PUSH_CHUNK_SIZE = 500
+PUSH_DB_BATCH_SIZE = 5000
+
+# Rendered responses of catalog endpoints (see tlc.core.response_cache).
+# DjangoCacheBackend keeps entries and model generations in RESPONSE_CACHE_ALIAS, so a
+# write in any worker or management command invalidates them for every process.
+# LocMemBackend is per process and only fits a single worker.
+RESPONSE_CACHE_BACKEND = os.environ.get('RESPONSE_CACHE_BACKEND', 'tlc.core.response_cache.DjangoCacheBackend')
+RESPONSE_CACHE_ALIAS = 'shared'
+RESPONSE_CACHE_TTL = 60 * 60
+RESPONSE_CACHE_MAX_ENTRIES = 1000
+# Streamed responses larger than this are served from the DB every time
+RESPONSE_CACHE_MAX_STREAM_BYTES = 1024 * 1024
+
+# Streaming JSON lists (see tlc.core.streaming): rows per server-side cursor
+# fetch and bytes buffered before a chunk is written out
+STREAMING_CHUNK_SIZE = 2000
+STREAMING_BUFFER_SIZE = 64 * 1024
+
+# Cursor pagination for long lists (see tlc.core.pagination.KeysetPagination)
+KEYSET_PAGE_SIZE = 20
+KEYSET_MAX_PAGE_SIZE = 100
+
+# Prerendered JSON of reference collections (see tlc.core.snapshots).
+# Must be shared by all workers of a host: files there are the source of truth.
+# Kept out of BASE_DIR so the (mounted) source tree is never written to.
+SNAPSHOT_DIR = os.environ.get('SNAPSHOT_DIR', os.path.join(tempfile.gettempdir(), 'tlc-snapshots'))
+
+# Full-text search (see tlc.core.search). PostgreSQL uses tsvector + GIN with
+# this text search config; other databases fall back to icontains.
+SEARCH_CONFIG = 'russian'
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 50
+SEARCH_MAX_OFFSET = 1000
+SEARCH_SNIPPET_WORDS = 30
+SEARCH_SIMPLE_MAX_CANDIDATES = 1000
+
+# Materialized top products (see tlc.core.leaderboard), kept in RESPONSE_CACHE_ALIAS
+# and updated there by the signals of whichever process writes a product.
+LEADERBOARD_MAX_ROWS = 1000
+LEADERBOARD_MAX_LIMIT = 50
+LEADERBOARD_TTL = 5 * 60
+
+# Resized WebP/JPEG copies and blur placeholders of uploaded photos (see tlc.core.images)
+IMAGE_VARIANTS_ON_SAVE = os.environ.get('IMAGE_VARIANTS_ON_SAVE', '1') == '1'
+IMAGE_VARIANT_WORKERS = int(os.environ.get('IMAGE_VARIANT_WORKERS', 2))
+IMAGE_VARIANT_WIDTHS = (160, 320, 640, 1280)
+IMAGE_PLACEHOLDER_WIDTH = 16
+
+# Checks for uploaded images before they reach an ImageField (see tlc.core.ingest).
+# Larger files are downscaled to INGEST_MAX_SIDE and re-encoded, the rest only lose
+# metadata. At most INGEST_CONCURRENCY decodes of up to INGEST_MAX_MEMORY run at once.
+INGEST_MAX_BYTES = 20 * 1024 * 1024
+INGEST_MAX_PIXELS = 40 * 1000 * 1000
+INGEST_MAX_MEMORY = 128 * 1024 * 1024
+INGEST_MAX_SIDE = 2560
+INGEST_REENCODE_BYTES = 2 * 1024 * 1024
+INGEST_CONCURRENCY = int(os.environ.get('INGEST_CONCURRENCY', 2))
+INGEST_SPOOL_SIZE = 2 * 1024 * 1024
+
+# Media files are served by tlc.core.media: Range/If-Range, validators and an access
+# check for the listed MEDIA_ROOT subdirectories (e.g. "documents,video" - JWT required).
+# Prefixes are upload_to directories: content-addressed files keep them (documents/cas/...).
+# With MEDIA_ACCEL_REDIRECT set (nginx internal location) the file body is sent by nginx.
+MEDIA_PROTECTED_PREFIXES = tuple(filter(None, os.environ.get('MEDIA_PROTECTED_PREFIXES', '').split(',')))
+MEDIA_ACCEL_REDIRECT = os.environ.get('MEDIA_ACCEL_REDIRECT', '')
+MEDIA_MAX_AGE = 24 * 60 * 60
+# Files under <upload_to>/cas/ are named by content hash (tlc.core.storage) and never change
+MEDIA_IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+MEDIA_CHUNK_SIZE = 256 * 1024
+
+# Chunked resumable uploads (see tlc.core.uploads). Parts are kept under a hidden
+# MEDIA_ROOT folder so the assembled file is moved into place without a copy.
+UPLOAD_DIR = os.environ.get('UPLOAD_DIR', os.path.join(MEDIA_ROOT, '.uploads'))
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+UPLOAD_MIN_CHUNK_SIZE = 256 * 1024
+UPLOAD_MAX_CHUNK_SIZE = 32 * 1024 * 1024
+UPLOAD_MAX_SIZE = 4 * 1024 * 1024 * 1024
+UPLOAD_SESSION_TTL = 24 * 60 * 60
+UPLOAD_BUFFER_SIZE = 64 * 1024
+
+# ZIP bundles of education documents built on the fly (see tlc.core.bundles).
+# The archive layout is cached in RESPONSE_CACHE_ALIAS so Range requests can resume.
+BUNDLE_CHUNK_SIZE = 64 * 1024
+BUNDLE_COMPRESS_LEVEL = 6
+BUNDLE_LAYOUT_TTL = 24 * 60 * 60
+BUNDLE_MAX_FILES = 500
+
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -67,8 +215,47 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'tlc.core.budgets.QueryBudgetMiddleware',
 ]
 
+# Max DB queries per endpoint (see tlc.core.budgets). Exceeding logs a warning,
+# or fails the request when QUERY_BUDGET_STRICT is on (tests). Routes behind
+# ClaimsJWTAuthentication (and protected media) include one user check on a token cache miss.
+QUERY_BUDGET_STRICT = os.environ.get('QUERY_BUDGET_STRICT', '0') == '1'
+QUERY_BUDGETS = {
+    'AuthView.signup': 4,
+    'AuthView.signin': 2,
+    'AuthView.send_reset_code': 3,
+    'AuthView.reset_password': 3,
+    'async_signin': 2,
+    'UserView.edit_user': 2,
+    'UserView.about_user': 1,
+    'NewsView.all_news': 3,
+    'NewsView.get_article': 3,
+    'DocumentsView.all_docs': 3,
+    'VideoView.all_videos': 3,
+    'ChatView.all_chats': 3,
+    'SocialView.all_socials': 3,
+    'ProductView.get_categories': 3,
+    'ProductView.get_products_cat': 3,
+    'ProductView.get_results': 3,
+    'ProductView.get_top': 3,
+    'EducationView.all_edu_docs': 3,
+    'EducationView.all_edu_videos': 3,
+    'EducationView.all_edu_faq': 3,
+    'EducationView.edu_docs_bundle': 2,
+    'get_about': 3,
+    'bootstrap': 9,
+    'search': 7,
+    'support': 2,
+    'metrics': 2,
+    'serve_media': 1,
+    'UploadView.start_upload': 4,
+    'UploadView.upload_status': 2,
+    'UploadView.upload_chunk': 3,
+    'UploadView.finalize_upload': 15,
+}
+
 ROOT_URLCONF = 'configs.urls'
 
 TEMPLATES = [
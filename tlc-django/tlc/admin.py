@@ -1,7 +1,42 @@
+from django import forms
 from django.contrib import admin
 from django.apps import apps
+from django.core.exceptions import ValidationError
+from django.db import models
+
+from .core.ingest import ingestor
+from .models import ProductResults
 
 app = apps.get_app_config('tlc')
 
+
+class IngestedImageFormField(forms.ImageField):
+    """ Загрузка картинки в админке проходит те же лимиты, что и через API """
+
+    def to_python(self, data):
+        if data is not None and hasattr(data, 'read'):
+            try:
+                data = ingestor.ingest(data)
+            except ValidationError as error:
+                # ingest отвечает в формате API ([{'info': ...}]), форме нужен текст
+                raise forms.ValidationError(' '.join(error.messages), code='invalid_image')
+        return super().to_python(data)
+
+
+class TlcModelAdmin(admin.ModelAdmin):
+    formfield_overrides = {
+        models.ImageField: {'form_class': IngestedImageFormField},
+    }
+
+
+class ProductResultsAdmin(TlcModelAdmin):
+    # __str__ результата обращается к product.title - подтягиваем одним JOIN
+    list_select_related = ('product',)
+
+
+model_admins = {
+    ProductResults: ProductResultsAdmin,
+}
+
 for model_name, model in app.models.items():
-    admin.site.register(model)
+    admin.site.register(model, model_admins.get(model, TlcModelAdmin))
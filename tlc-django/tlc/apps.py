@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class TlcConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'tlc'
+
+    def ready(self):
+        from tlc import search, signals, snapshots  # noqa: F401
+        from tlc.core.push import init_firebase
+        init_firebase()
@@ -1,12 +1,147 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime
 
 import jwt
+from django.utils.functional import SimpleLazyObject
 from rest_framework import authentication, exceptions
 
 from tlc.models import User
 from configs import settings
 
 
+class TokenCache:
+    """
+    [TokenCache]
+    Процессный LRU-кэш проверенных токенов и их пользователей.
+    Запись только с claims (user=None) значит, что пользователь существует
+    и активен, но строка не загружалась. Запись живет не дольше TTL и не
+    дольше срока действия самого токена.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._by_user = {}
+        self._lock = threading.Lock()
+
+    def get(self, token: str):
+        """ Возвращает (user или None, user_id, expire) или None, если токена нет в кэше """
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                self.misses += 1
+                return None
+            user, user_id, expire, deadline = entry
+            if time.monotonic() >= deadline:
+                self._discard(token)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(token)
+            self.hits += 1
+        # Отдаем копию, чтобы запросы не делили один экземпляр модели
+        return (copy.copy(user) if user is not None else None), user_id, expire
+
+    def set(self, token: str, user, expire: datetime):
+        self._store(token, copy.copy(user), user.pk, expire)
+
+    def set_claims(self, token: str, user_id, expire: datetime):
+        """ Пользователь проверен, но не загружен; полную запись не заменяет """
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is not None and entry[0] is not None:
+                return
+        self._store(token, None, user_id, expire)
+
+    def _store(self, token: str, user, user_id, expire: datetime):
+        lifetime = min(self.ttl, (expire - datetime.now()).total_seconds())
+        if self.maxsize <= 0 or lifetime <= 0:
+            return
+        with self._lock:
+            if token in self._entries:
+                self._discard(token)
+            self._entries[token] = (user, user_id, expire, time.monotonic() + lifetime)
+            self._by_user.setdefault(user_id, set()).add(token)
+            while len(self._entries) > self.maxsize:
+                self._discard(next(iter(self._entries)))
+
+    def invalidate_user(self, user_id):
+        """ Удаляет все токены пользователя (вызывается при save/delete User) """
+        with self._lock:
+            for token in self._by_user.pop(user_id, ()):
+                self._entries.pop(token, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_user.clear()
+            self.hits = self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / total if total else 0.0,
+            }
+
+    def _discard(self, token: str):
+        _, user_id, _, _ = self._entries.pop(token)
+        tokens = self._by_user.get(user_id)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._by_user[user_id]
+
+
+token_cache = TokenCache(settings.JWT_CACHE_MAXSIZE, settings.JWT_CACHE_TTL)
+
+
+class ClaimsUser(SimpleLazyObject):
+    """
+    [ClaimsUser]
+    Пользователь, собранный из claims токена (id, expire).
+    Строка User загружается из БД только при обращении к другим атрибутам.
+    """
+
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, access_token: str, user_id, expire: datetime):
+        self.__dict__['_claims'] = (user_id, expire)
+
+        def load_user():
+            try:
+                user = User.objects.get(id=user_id)
+            except User.DoesNotExist:
+                raise exceptions.NotFound({"info": 'Not found'})
+            token_cache.set(access_token, user, expire)
+            return user
+
+        super().__init__(load_user)
+
+    def __bool__(self):
+        # IsAuthenticated проверяет `request.user and ...` - не загружаем строку ради этого
+        return True
+
+    @property
+    def id(self):
+        return self.__dict__['_claims'][0]
+
+    pk = id
+
+    @property
+    def expire(self) -> datetime:
+        return self.__dict__['_claims'][1]
+
+
 class JWTAuthentication(authentication.TokenAuthentication):
     user_model = User
 
@@ -16,16 +151,61 @@ class JWTAuthentication(authentication.TokenAuthentication):
             return None
         try:
             access_token = authorization_header.split(' ')[1]
+        except:
+            raise exceptions.AuthenticationFailed({"info": 'Ivalid token'})
+        cached = token_cache.get(access_token)
+        if cached is not None:
+            user, user_id, expire = cached
+            if datetime.now() >= expire:
+                raise exceptions.AuthenticationFailed({"info": 'Token expire'})
+            user = self.cached_user(access_token, user, user_id, expire)
+            if user is not None:
+                return user, None
+        payload, expire = self.decode(access_token)
+        return self.get_user(access_token, payload, expire), None
+
+    def cached_user(self, access_token: str, user, user_id, expire: datetime):
+        """ Пользователь из записи кэша; None - в записи только claims, а нужна строка """
+        return user
+
+    def decode(self, access_token: str):
+        """ Проверяет подпись и срок действия токена, возвращает (payload, expire) """
+        try:
             payload = jwt.decode(access_token, settings.SECRET_KEY, algorithms='HS256')
         except:
             raise exceptions.AuthenticationFailed({"info": 'Ivalid token'})
         now = datetime.now()
         expire = datetime.strptime(payload['expire'], "%Y-%m-%d %H:%M:%S.%f")
         if now < expire:
-            try:
-                user = self.user_model.objects.get(id=payload['id'])
-            except:
-                raise exceptions.NotFound({"info": 'Not found'})
-            return user, None
+            return payload, expire
         else:
             raise exceptions.AuthenticationFailed({"info": 'Token expire'})
+
+    def get_user(self, access_token: str, payload: dict, expire: datetime):
+        try:
+            user = self.user_model.objects.get(id=payload['id'])
+        except:
+            raise exceptions.NotFound({"info": 'Not found'})
+        token_cache.set(access_token, user, expire)
+        return user
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    Аутентификация без загрузки User: для эндпоинтов, которым нужен только
+    факт авторизации. Вместо User возвращает ClaimsUser. На промахе кэша
+    один запрос проверяет, что пользователь не удален и активен; результат
+    кэшируется вместе с claims и сбрасывается сигналами User.
+    """
+
+    def cached_user(self, access_token: str, user, user_id, expire: datetime):
+        return user if user is not None else ClaimsUser(access_token, user_id, expire)
+
+    def get_user(self, access_token: str, payload: dict, expire: datetime):
+        is_active = User.objects.filter(id=payload['id']).values_list('is_active', flat=True).first()
+        if is_active is None:
+            raise exceptions.NotFound({"info": 'Not found'})
+        if not is_active:
+            raise exceptions.AuthenticationFailed({"info": 'User inactive'})
+        token_cache.set_claims(access_token, payload['id'], expire)
+        return ClaimsUser(access_token, payload['id'], expire)
@@ -0,0 +1,124 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from django.db import connection
+
+from configs import settings
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class QueryRecorder:
+    """ execute_wrapper, считающий запросы и их суммарное время """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - started
+
+
+def budget_key(request) -> str:
+    """
+    Имя эндпоинта для бюджета: 'NewsView.all_news' для экшнов, имя функции для api_view.
+    HEAD считается по бюджету GET, OPTIONS (метаданные без данных) не учитывается
+    """
+    match = request.resolver_match
+    method = request.method.lower()
+    if match is None or method == 'options':
+        return ''
+    actions = getattr(match.func, 'actions', None)
+    if actions:
+        action = actions.get(method) or (actions.get('get') if method == 'head' else None)
+        return f"{match.func.cls.__name__}.{action}" if action else ''
+    return match.func.__name__
+
+
+class QueryBudgets:
+    """
+    [QueryBudgets]
+    Учет числа и времени запросов по эндпоинтам и сверка с QUERY_BUDGETS.
+    При превышении пишет warning, а в строгом режиме (тесты) падает.
+    """
+
+    def __init__(self, budgets: dict, strict: bool):
+        self.budgets = budgets
+        self.strict = strict
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def check(self, name: str, recorder: QueryRecorder, strict: bool = None):
+        budget = self.budgets.get(name)
+        over = budget is not None and recorder.count > budget
+        with self._lock:
+            stats = self._stats.setdefault(name, {"requests": 0, "queries": 0, "max_queries": 0,
+                                                  "db_time_ms": 0.0, "over_budget": 0})
+            stats["requests"] += 1
+            stats["queries"] += recorder.count
+            stats["max_queries"] = max(stats["max_queries"], recorder.count)
+            stats["db_time_ms"] += recorder.duration * 1000
+            stats["over_budget"] += over
+        if over:
+            message = f'{name} made {recorder.count} queries ({recorder.duration * 1000:.1f} ms), budget is {budget}'
+            if self.strict if strict is None else strict:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                name: dict(stats, budget=self.budgets.get(name))
+                for name, stats in self._stats.items()
+            }
+
+
+budgets = QueryBudgets(settings.QUERY_BUDGETS, settings.QUERY_BUDGET_STRICT)
+
+
+class QueryBudgetMiddleware:
+    """ Считает запросы каждого API-вызова и сверяет их с бюджетом эндпоинта """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            response = self.get_response(request)
+        name = budget_key(request)
+        if name and response.streaming:
+            # Потоковый ответ читает БД уже после выхода из view - считаем до конца потока
+            response.streaming_content = self.count_stream(response.streaming_content, name, recorder)
+        elif name:
+            budgets.check(name, recorder)
+        return response
+
+    @staticmethod
+    def count_stream(chunks, name: str, recorder: QueryRecorder):
+        with connection.execute_wrapper(recorder):
+            yield from chunks
+        budgets.check(name, recorder)
+
+
+@contextmanager
+def query_budget(name: str):
+    """
+    Хелпер для тестов: with query_budget('NewsView.all_news'): client.get(...)
+    Падает с QueryBudgetExceeded, если эндпоинт превысил свой бюджет
+    """
+    recorder = QueryRecorder()
+    with connection.execute_wrapper(recorder):
+        yield recorder
+    budgets.check(name, recorder, strict=True)
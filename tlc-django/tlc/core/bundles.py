@@ -0,0 +1,248 @@
+import hashlib
+import os
+import struct
+import time
+import zlib
+
+from django.core.cache import caches
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework import exceptions, status
+
+from tlc.core.media import MediaServer, parse_range
+from configs import settings
+
+# Уже сжатые форматы кладутся в архив как есть (method 0), остальные - deflate (method 8)
+STORED_EXTENSIONS = {
+    '.pdf', '.docx', '.xlsx', '.pptx', '.zip', '.rar', '.7z', '.gz',
+    '.jpg', '.jpeg', '.png', '.gif', '.webp', '.mp4', '.avi', '.mp3',
+}
+STORED, DEFLATED = 0, 8
+UTF8_FLAG = 0x0800
+ZIP_LIMIT = 0xFFFFFFFF
+
+
+class BundleTooLarge(exceptions.APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = {"info": 'Archive is too large, request fewer files with ?ids='}
+    default_code = 'bundle_too_large'
+
+
+def dos_datetime(timestamp: float):
+    """ (time, date) в формате MS-DOS, как в заголовках ZIP """
+    year, month, day, hour, minute, second = time.localtime(max(timestamp, 315532800))[:6]
+    return (hour << 11) | (minute << 5) | (second // 2), ((year - 1980) << 9) | (month << 5) | day
+
+
+def unique_names(titles: list) -> list:
+    """ Имена записей без повторов: "Инструкция.pdf", "Инструкция (2).pdf" """
+    seen, names = set(), []
+    for title, extension in titles:
+        base = ''.join('_' if char in '/\\:*?"<>|' else char for char in title).strip() or 'document'
+        name, counter = base + extension, 1
+        while name.lower() in seen:
+            counter += 1
+            name = f'{base} ({counter}){extension}'
+        seen.add(name.lower())
+        names.append(name)
+    return names
+
+
+class ZipBundle:
+    """
+    [ZipBundle]
+    ZIP, собираемый на лету из файлов хранилища без временного файла.
+    Раскладка архива (CRC, сжатые размеры, смещения записей) считается одним
+    проходом по файлам и кэшируется, поэтому известны Content-Length и
+    любой байтовый диапазон: при докачке stored-записи читаются с нужного
+    смещения, а deflate-запись пересжимается детерминированно с ее начала.
+    Память ограничена одним блоком чтения
+    """
+
+    def __init__(self, storage, files: list, chunk_size: int, level: int):
+        # files: [(имя в архиве, имя в хранилище, размер, mtime)]
+        self.storage = storage
+        self.files = files
+        self.chunk_size = chunk_size
+        self.level = level
+
+    @property
+    def key(self) -> str:
+        raw = repr((self.files, self.level)).encode('utf-8')
+        return hashlib.sha1(raw).hexdigest()
+
+    def method(self, name: str) -> int:
+        return STORED if os.path.splitext(name)[1].lower() in STORED_EXTENSIONS else DEFLATED
+
+    def read(self, name: str):
+        with self.storage.open(name, 'rb') as file:
+            for data in iter(lambda: file.read(self.chunk_size), b''):
+                yield data
+
+    def compress(self, name: str):
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, -15)
+        for data in self.read(name):
+            output = compressor.compress(data)
+            if output:
+                yield output
+        yield compressor.flush()
+
+    def measure(self) -> list:
+        """ Проход по файлам: [(method, crc, compressed_size)] для каждой записи """
+        layout = []
+        for archive_name, name, size, mtime in self.files:
+            method, crc, compressed = self.method(archive_name), 0, 0
+            if method == STORED:
+                for data in self.read(name):
+                    crc = zlib.crc32(data, crc)
+                compressed = size
+            else:
+                compressor = zlib.compressobj(self.level, zlib.DEFLATED, -15)
+                for data in self.read(name):
+                    crc = zlib.crc32(data, crc)
+                    compressed += len(compressor.compress(data))
+                compressed += len(compressor.flush())
+            layout.append((method, crc, compressed))
+        return layout
+
+    def segments(self, layout: list) -> list:
+        """ Архив как последовательность (длина, bytes или (method, имя файла)) """
+        segments, central, offset = [], [], 0
+        for (archive_name, name, size, mtime), (method, crc, compressed) in zip(self.files, layout):
+            encoded = archive_name.encode('utf-8')
+            dos_time, dos_date = dos_datetime(mtime)
+            header = struct.pack(
+                '<IHHHHHIIIHH', 0x04034b50, 20, UTF8_FLAG, method, dos_time, dos_date,
+                crc, compressed, size, len(encoded), 0,
+            ) + encoded
+            central.append(struct.pack(
+                '<IHHHHHHIIIHHHHHII', 0x02014b50, 20, 20, UTF8_FLAG, method, dos_time, dos_date,
+                crc, compressed, size, len(encoded), 0, 0, 0, 0, 0, offset,
+            ) + encoded)
+            segments.append((len(header), header))
+            segments.append((compressed, (method, name)))
+            offset += len(header) + compressed
+        directory = b''.join(central)
+        end = struct.pack('<IHHHHIIH', 0x06054b50, 0, 0, len(central), len(central), len(directory), offset, 0)
+        segments.append((len(directory) + len(end), directory + end))
+        return segments
+
+    def iter_range(self, segments: list, start: int, end: int):
+        """ Байты архива [start, end] включительно """
+        offset = 0
+        for length, content in segments:
+            segment_end = offset + length - 1
+            if segment_end >= start and offset <= end and length:
+                skip, take = max(start - offset, 0), min(end, segment_end) - max(start, offset) + 1
+                if isinstance(content, bytes):
+                    yield content[skip:skip + take]
+                else:
+                    yield from self.iter_data(*content, skip, take)
+            offset += length
+            if offset > end:
+                break
+
+    def iter_data(self, method: int, name: str, skip: int, take: int):
+        if method == STORED:
+            with self.storage.open(name, 'rb') as file:
+                file.seek(skip)
+                while take > 0:
+                    data = file.read(min(self.chunk_size, take))
+                    if not data:
+                        break
+                    take -= len(data)
+                    yield data
+            return
+        # deflate с тем же уровнем и теми же блоками дает те же байты - пропускаем до skip
+        for data in self.compress(name):
+            if skip >= len(data):
+                skip -= len(data)
+                continue
+            data = data[skip:skip + take]
+            skip = 0
+            take -= len(data)
+            yield data
+            if take <= 0:
+                break
+
+
+class BundleServer:
+    """
+    [BundleServer]
+    Ответ со ZIP-архивом: раскладка в кэше RESPONSE_CACHE_ALIAS по ключу
+    от (имен, размеров, mtime) файлов, ETag - тот же ключ, Range/If-Range - 206
+    """
+
+    def __init__(self, chunk_size: int, level: int, ttl: int, max_files: int):
+        self.chunk_size = chunk_size
+        self.level = level
+        self.ttl = ttl
+        self.max_files = max_files
+        self.cache = caches[settings.RESPONSE_CACHE_ALIAS]
+
+    def bundle(self, documents: list, field: str) -> ZipBundle:
+        """ documents - экземпляры моделей с title и FileField field, не больше max_files """
+        if len(documents) > self.max_files:
+            raise BundleTooLarge({"info": f'At most {self.max_files} files per archive, request fewer with ?ids='})
+        files, titles = [], []
+        storage = None
+        for document in documents:
+            file = getattr(document, field)
+            storage = file.storage
+            try:
+                size, mtime = file.size, storage.get_modified_time(file.name).timestamp()
+            except OSError:
+                continue
+            titles.append((document.title, os.path.splitext(file.name)[1].lower()))
+            files.append((file.name, size, mtime))
+        names = unique_names(titles)
+        return ZipBundle(
+            storage, [(names[i], *files[i]) for i in range(len(files))], self.chunk_size, self.level,
+        )
+
+    def layout(self, bundle: ZipBundle) -> list:
+        key = 'bundle:' + bundle.key
+        layout = self.cache.get(key)
+        if layout is None:
+            layout = bundle.measure()
+            self.cache.set(key, layout, self.ttl)
+        return layout
+
+    def response(self, request, bundle: ZipBundle, filename: str):
+        if not bundle.files:
+            raise exceptions.NotFound({"info": 'No files to bundle'})
+        segments = bundle.segments(self.layout(bundle))
+        size = sum(length for length, _ in segments)
+        if size >= ZIP_LIMIT or len(bundle.files) >= 0xFFFF:
+            # без ZIP64 больше 4 ГБ не поместится
+            raise BundleTooLarge()
+        etag = '"%s"' % bundle.key
+        mtime = int(max(mtime for *_, mtime in bundle.files))
+        response = get_conditional_response(request, etag=etag, last_modified=mtime)
+        if response is None:
+            start, end, status = 0, size - 1, 200
+            if MediaServer.if_range_matches(request, etag, mtime):
+                try:
+                    byte_range = parse_range(request.headers.get('Range'), size)
+                except ValueError:
+                    response = HttpResponse(status=416)
+                    response['Content-Range'] = 'bytes */%d' % size
+                    return response
+                if byte_range is not None:
+                    (start, end), status = byte_range, 206
+            response = StreamingHttpResponse(bundle.iter_range(segments, start, end), status=status)
+            response['Content-Type'] = 'application/zip'
+            response['Content-Length'] = str(end - start + 1)
+            response['Content-Disposition'] = f'attachment; filename="{filename}"'
+            if status == 206:
+                response['Content-Range'] = 'bytes %d-%d/%d' % (start, end, size)
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(mtime)
+        response['Accept-Ranges'] = 'bytes'
+        return response
+
+
+bundles = BundleServer(
+    settings.BUNDLE_CHUNK_SIZE, settings.BUNDLE_COMPRESS_LEVEL, settings.BUNDLE_LAYOUT_TTL, settings.BUNDLE_MAX_FILES,
+)
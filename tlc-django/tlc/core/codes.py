@@ -0,0 +1,161 @@
+import abc
+import secrets
+import threading
+import time
+from typing import Optional
+
+from django.core.cache import caches
+from django.utils.crypto import constant_time_compare
+from django.utils.module_loading import import_string
+
+from configs import settings
+
+CODE_OK = 'ok'
+CODE_MISSING = 'missing'
+CODE_WRONG = 'wrong'
+CODE_EXHAUSTED = 'exhausted'
+
+
+class BaseCodeStore(abc.ABC):
+    """
+    [BaseCodeStore]
+    Хранилище короткоживущих кодов подтверждения: один код на пользователя,
+    код живет ttl секунд. За окно window пользователю выдается не больше
+    max_issues кодов и дается не больше max_attempts неверных попыток на все
+    эти коды: новый код счетчик попыток не сбрасывает.
+    """
+
+    def __init__(self, ttl: int, max_attempts: int, max_issues: int = 3, window: int = None):
+        self.ttl = ttl
+        self.max_attempts = max_attempts
+        self.max_issues = max_issues
+        self.window = max(window or ttl, ttl)
+
+    def issue(self, user_id) -> Optional[int]:
+        """ Создает новый код (старый при этом перестает действовать); None, если лимит кодов за окно исчерпан """
+        code = 1000 + secrets.randbelow(9000)
+        if not self._put(user_id, code):
+            return None
+        return code
+
+    @abc.abstractmethod
+    def verify(self, user_id, code) -> str:
+        """ Проверяет код; при успехе код удаляется. Возвращает один из CODE_* """
+
+    @abc.abstractmethod
+    def _put(self, user_id, code: int) -> bool:
+        """ Сохраняет код пользователя со сроком ttl, если лимит кодов за окно не исчерпан """
+
+    @staticmethod
+    def _matches(expected: int, code) -> bool:
+        return constant_time_compare(str(expected), str(code))
+
+
+class MemoryCodeStore(BaseCodeStore):
+    """ Коды в памяти процесса - для одного воркера """
+
+    def __init__(self, ttl: int, max_attempts: int, max_issues: int = 3, window: int = None):
+        super().__init__(ttl, max_attempts, max_issues, window)
+        # user_id -> (код, срок кода)
+        self._codes = {}
+        # user_id -> [выдано кодов, неверных попыток, конец окна]
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def verify(self, user_id, code) -> str:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._codes.get(user_id)
+            if entry is None or entry[1] <= now:
+                self._codes.pop(user_id, None)
+                return CODE_MISSING
+            counters = self._counters(user_id, now)
+            if counters[1] >= self.max_attempts:
+                del self._codes[user_id]
+                return CODE_EXHAUSTED
+            if self._matches(entry[0], code):
+                del self._codes[user_id]
+                counters[1] = 0
+                return CODE_OK
+            counters[1] += 1
+            if counters[1] >= self.max_attempts:
+                del self._codes[user_id]
+                return CODE_EXHAUSTED
+            return CODE_WRONG
+
+    def _put(self, user_id, code: int) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            for key in [key for key, entry in self._codes.items() if entry[1] <= now]:
+                del self._codes[key]
+            for key in [key for key, counters in self._windows.items() if counters[2] <= now]:
+                del self._windows[key]
+            counters = self._counters(user_id, now)
+            if counters[0] >= self.max_issues:
+                return False
+            counters[0] += 1
+            self._codes[user_id] = (code, now + self.ttl)
+            return True
+
+    def _counters(self, user_id, now: float) -> list:
+        counters = self._windows.get(user_id)
+        if counters is None or counters[2] <= now:
+            counters = self._windows[user_id] = [0, 0, now + self.window]
+        return counters
+
+
+class CacheCodeStore(BaseCodeStore):
+    """ Коды в кэше Django (CONFIRM_CODE_CACHE) - общий для всех воркеров """
+
+    def __init__(self, ttl: int, max_attempts: int, max_issues: int = 3, window: int = None):
+        super().__init__(ttl, max_attempts, max_issues, window)
+        self.cache = caches[settings.CONFIRM_CODE_CACHE]
+
+    def verify(self, user_id, code) -> str:
+        key = self._key(user_id)
+        values = self.cache.get_many([key, key + ':attempts'])
+        expected = values.get(key)
+        if expected is None:
+            return CODE_MISSING
+        if values.get(key + ':attempts', 0) >= self.max_attempts:
+            self.cache.delete(key)
+            return CODE_EXHAUSTED
+        if self._matches(expected, code):
+            self.cache.delete_many([key, key + ':attempts'])
+            return CODE_OK
+        # incr атомарен в memcached, поэтому счетчик общий для воркеров
+        attempts = self._incr(key + ':attempts')
+        if attempts >= self.max_attempts:
+            # Счетчик попыток остается до конца окна: новый код его не обнулит
+            self.cache.delete(key)
+            return CODE_EXHAUSTED
+        return CODE_WRONG
+
+    def _put(self, user_id, code: int) -> bool:
+        key = self._key(user_id)
+        if self._incr(key + ':issued') > self.max_issues:
+            return False
+        # add не трогает счетчик, заведенный предыдущим кодом этого окна
+        self.cache.add(key + ':attempts', 0, self.window)
+        self.cache.set(key, code, self.ttl)
+        return True
+
+    def _incr(self, key: str) -> int:
+        """ Счетчик со сроком window от первого увеличения (incr срок не продлевает) """
+        self.cache.add(key, 0, self.window)
+        try:
+            return self.cache.incr(key)
+        except ValueError:
+            # Счетчик истек между add и incr
+            self.cache.set(key, 1, self.window)
+            return 1
+
+    @staticmethod
+    def _key(user_id) -> str:
+        return f'confirm-code:{user_id}'
+
+
+store = import_string(settings.CONFIRM_CODE_STORE)(
+    settings.CONFIRM_CODE_TTL, settings.CONFIRM_CODE_MAX_ATTEMPTS,
+    settings.CONFIRM_CODE_MAX_ISSUES, settings.CONFIRM_CODE_WINDOW,
+)
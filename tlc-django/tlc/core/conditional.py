@@ -0,0 +1,54 @@
+import hashlib
+from functools import wraps
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework.request import Request
+
+from tlc.core.response_cache import response_cache
+
+
+def compute_validators(request, queryset, timestamp_fields: tuple):
+    """
+    Дешевые валидаторы без сериализации: max(updated_at) и count(*) по выборке.
+    Возвращает (etag, last_modified), где last_modified - datetime или None.
+    Удаление строки меняет только count, поэтому точный валидатор - ETag;
+    If-None-Match по правилам HTTP имеет приоритет над If-Modified-Since
+    """
+    aggregates = {f'last_{i}': Max(field) for i, field in enumerate(timestamp_fields)}
+    result = queryset.order_by().aggregate(count=Count('pk'), **aggregates)
+    stamps = [result[f'last_{i}'] for i in range(len(timestamp_fields)) if result[f'last_{i}'] is not None]
+    last_modified = max(stamps) if stamps else None
+    raw = repr((request.get_host(), request.get_full_path(), result['count'], last_modified))
+    return '"%s"' % hashlib.sha1(raw.encode('utf-8')).hexdigest(), last_modified
+
+
+def conditional(endpoint: str, models: tuple, get_queryset, timestamp_fields: tuple = ('updated_at',)):
+    """
+    Декоратор view/action: отвечает 304 на If-None-Match/If-Modified-Since
+    до запуска сериализаторов. Сами валидаторы кэшируются в response_cache
+    и сбрасываются теми же сигналами, что и ответы.
+    get_queryset получает kwargs из URL (например, id)
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            request = args[0] if isinstance(args[0], Request) else args[1]
+            etag, last_modified = response_cache.get_or_build(
+                'validators:' + endpoint, models, request,
+                lambda: compute_validators(request, get_queryset(**kwargs), timestamp_fields),
+            )
+            timestamp = int(last_modified.timestamp()) if last_modified else None
+            response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+            if response is None:
+                response = func(*args, **kwargs)
+            if response.status_code in (200, 304):
+                response['ETag'] = etag
+                if timestamp is not None:
+                    response['Last-Modified'] = http_date(timestamp)
+            return response
+
+        return wrapper
+
+    return decorator
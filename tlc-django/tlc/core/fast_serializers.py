@@ -0,0 +1,145 @@
+import threading
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.encoding import filepath_to_uri
+from rest_framework import serializers
+from rest_framework.settings import api_settings
+
+from tlc.serializers import get_requested_fields
+
+# Поля, у которых значение из values_list() уже равно результату to_representation()
+IDENTITY_FIELDS = (
+    serializers.CharField, serializers.IntegerField, serializers.BooleanField, serializers.JSONField,
+    serializers.PrimaryKeyRelatedField,
+)
+
+VALUE, FILE, NESTED, CUSTOM = range(4)
+
+
+class UnsupportedField(Exception):
+    pass
+
+
+def file_converter(field, model_field, request):
+    """ URL файла как у FileField.to_representation, но с префиксом медиа, посчитанным один раз """
+    storage = model_field.storage
+    if not getattr(field, 'use_url', api_settings.UPLOADED_FILES_USE_URL):
+        return lambda name: name or None
+    if getattr(storage.url, '__func__', None) is not FileSystemStorage.url:
+        build = request.build_absolute_uri if request is not None else (lambda url: url)
+        return lambda name: build(storage.url(name)) if name else None
+    prefix = request.build_absolute_uri(storage.base_url) if request is not None else storage.base_url
+    return lambda name: prefix + filepath_to_uri(name).lstrip('/') if name else None
+
+
+class RowPlan:
+    """
+    [RowPlan]
+    Скомпилированный read-only сериализатор: колонки для values_list()
+    и список (поле, вид, индекс колонки, конвертер) для сборки словарей
+    """
+
+    def __init__(self, serializer, model, prefix: str = ''):
+        self.columns = []
+        self.fields = []
+        concrete = {field.name: field for field in model._meta.concrete_fields}
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            model_field = concrete.get(field.source)
+            if model_field is None:
+                raise UnsupportedField(f'{serializer.__class__.__name__}.{name}')
+            if isinstance(field, serializers.BaseSerializer):
+                nested = RowPlan(field, model_field.related_model, f'{prefix}{field.source}__')
+                self.fields.append((name, NESTED, len(self.columns), nested))
+                self.columns += nested.columns
+                continue
+            if hasattr(field, 'make_converter'):
+                # Поле само строит конвертер под запрос (ImageVariantsField)
+                self.fields.append((name, CUSTOM, len(self.columns), field))
+            elif isinstance(field, serializers.FileField):
+                self.fields.append((name, FILE, len(self.columns), (field, model_field)))
+            elif isinstance(field, IDENTITY_FIELDS):
+                self.fields.append((name, VALUE, len(self.columns), None))
+            elif isinstance(field, serializers.RelatedField):
+                raise UnsupportedField(f'{serializer.__class__.__name__}.{name}')
+            else:
+                self.fields.append((name, VALUE, len(self.columns), field.to_representation))
+            self.columns.append(prefix + field.source)
+
+    def bind(self, request) -> list:
+        """ Конвертеры с префиксом медиа текущего запроса """
+        bound = []
+        for name, kind, index, converter in self.fields:
+            if kind == NESTED:
+                bound.append((name, kind, index, converter.bind(request)))
+            elif kind == FILE:
+                bound.append((name, VALUE, index, file_converter(*converter, request)))
+            elif kind == CUSTOM:
+                bound.append((name, VALUE, index, converter.make_converter(request)))
+            else:
+                bound.append((name, kind, index, converter))
+        return bound
+
+
+def build_row(bound: list, row: tuple, offset: int = 0) -> dict:
+    data = {}
+    for name, kind, index, converter in bound:
+        if kind == NESTED:
+            # Нет связанного объекта - все его колонки пустые, как None у вложенного сериализатора
+            nested = build_row(converter, row, offset + index)
+            data[name] = nested if any(value is not None for value in nested.values()) else None
+            continue
+        value = row[offset + index]
+        data[name] = value if converter is None or value is None else converter(value)
+    return data
+
+
+class FastSerializer:
+    """
+    [FastSerializer]
+    Быстрый путь для списков: строки читаются через values_list(), словари
+    собираются по плану, скомпилированному из обычного ModelSerializer,
+    без создания моделей и вызова to_representation на каждое поле.
+    JSON на выходе совпадает с ответом исходного сериализатора
+    """
+
+    max_plans = 256
+    _plans = {}
+    _lock = threading.Lock()
+
+    def __init__(self, serializer_class, context: dict = None):
+        self.context = context or {}
+        self.request = self.context.get('request')
+        # Набор полей зависит от ?fields= (SparseFieldsMixin), поэтому он часть ключа плана
+        requested = get_requested_fields(self.request)
+        key = (serializer_class, tuple(requested) if requested is not None else None)
+        plan = self._plans.get(key)
+        if plan is None:
+            plan = RowPlan(serializer_class(context=self.context), serializer_class.Meta.model)
+            with self._lock:
+                # ?fields= приходит от клиента - число вариантов плана ограничено
+                if len(self._plans) >= self.max_plans:
+                    self._plans.clear()
+                self._plans[key] = plan
+        self.plan = plan
+
+    def iter_rows(self, queryset, chunk_size: int = None):
+        """ Словари по одной строке; chunk_size - читать серверным курсором через iterator() """
+        bound = self.plan.bind(self.request)
+        rows = queryset.values_list(*self.plan.columns)
+        if chunk_size:
+            rows = rows.iterator(chunk_size=chunk_size)
+        for row in rows:
+            yield build_row(bound, row)
+
+    def serialize(self, queryset) -> list:
+        return list(self.iter_rows(queryset))
+
+
+def fast_data(serializer_class, queryset, context: dict) -> list:
+    """ Данные списка быстрым путем, если сериализатор поддерживается, иначе обычным """
+    try:
+        return FastSerializer(serializer_class, context).serialize(queryset)
+    except UnsupportedField:
+        return serializer_class(instance=queryset, many=True, context=context).data
@@ -0,0 +1,126 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth import hashers
+from django.utils.crypto import get_random_string
+from rest_framework import exceptions, status
+
+from configs import settings
+
+
+class HashingUnavailable(exceptions.APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = {"info": 'Server is busy, try again later'}
+    default_code = 'hashing_unavailable'
+
+
+class PasswordHasherPool:
+    """
+    [PasswordHasherPool]
+    Ограниченный пул потоков для хэширования и проверки паролей.
+    PBKDF2 из hashlib отпускает GIL, поэтому потоки реально работают параллельно.
+    Если в работе и в очереди уже max_workers + max_queue задач, сразу отдаем 503.
+    """
+
+    def __init__(self, max_workers: int, max_queue: int):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.rejected = 0
+        self._inflight = 0
+        self._executor = None
+        self._dummy_hash = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix='password-hasher')
+        return self._executor
+
+    def submit(self, fn, *args):
+        with self._lock:
+            if self._inflight >= self.max_workers + self.max_queue:
+                self.rejected += 1
+                raise HashingUnavailable()
+            self._inflight += 1
+        try:
+            future = self.executor.submit(fn, *args)
+        except Exception:
+            self._release()
+            raise
+        future.add_done_callback(self._release)
+        return future
+
+    def make_password(self, password: str) -> str:
+        return self.submit(hashers.make_password, password).result()
+
+    def check_password(self, password: str, encoded: str, setter=None) -> bool:
+        """
+        Как hashers.check_password: если пароль верный, но хэш устарел (другой
+        алгоритм или число итераций), вызывается setter(password) - уже в потоке
+        вызывающего, а не в пуле, чтобы запись в БД шла через его соединение
+        """
+        upgrade = []
+        is_correct = self.submit(hashers.check_password, password, encoded, upgrade.append).result()
+        if upgrade and setter is not None:
+            setter(password)
+        return is_correct
+
+    def check_user_password(self, user, password: str) -> bool:
+        """
+        Проверка пароля пользователя с обновлением устаревшего хэша, как в User.check_password.
+        Для несуществующего пользователя (None) проверяется фиктивный хэш,
+        чтобы время ответа не выдавало наличие логина
+        """
+        setter = (lambda raw: self._upgrade(user, self.make_password(raw))) if user is not None else None
+        return self.check_password(password, self._encoded_for(user), setter) and user is not None
+
+    async def acheck_user_password(self, user, password: str) -> bool:
+        async def setter(raw):
+            await sync_to_async(self._upgrade)(user, await self.amake_password(raw))
+
+        is_correct = await self.acheck_password(password, self._encoded_for(user), setter if user is not None else None)
+        return is_correct and user is not None
+
+    async def amake_password(self, password: str) -> str:
+        return await asyncio.wrap_future(self.submit(hashers.make_password, password))
+
+    async def acheck_password(self, password: str, encoded: str, setter=None) -> bool:
+        """ Асинхронный check_password; setter здесь - корутина """
+        upgrade = []
+        is_correct = await asyncio.wrap_future(self.submit(hashers.check_password, password, encoded, upgrade.append))
+        if upgrade and setter is not None:
+            await setter(password)
+        return is_correct
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "inflight": self._inflight,
+                "rejected": self.rejected,
+            }
+
+    def _encoded_for(self, user) -> str:
+        if user is not None and user.has_usable_password():
+            return user.password
+        if self._dummy_hash is None:
+            self._dummy_hash = hashers.make_password(get_random_string(32))
+        return self._dummy_hash
+
+    @staticmethod
+    def _upgrade(user, encoded: str):
+        user.password = encoded
+        user.save(update_fields=['password'])
+
+    def _release(self, future=None):
+        with self._lock:
+            self._inflight -= 1
+
+
+pool = PasswordHasherPool(settings.PASSWORD_HASHING_WORKERS, settings.PASSWORD_HASHING_QUEUE)
@@ -0,0 +1,195 @@
+import base64
+import io
+import logging
+import os
+import shutil
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.db import close_old_connections
+from django.db.models import Q
+from django.dispatch import Signal
+from django.utils import timezone
+from PIL import Image, ImageFilter, ImageOps
+
+from tlc.core.storage import is_content_name
+from tlc.models import Article, AttachmentPhoto, Product, ProductResults, User
+from configs import settings
+
+logger = logging.getLogger(__name__)
+
+# Модель -> ImageField'ы, для которых строятся варианты (колонка <поле>_variants)
+IMAGE_FIELDS = {
+    Article: ('photo',),
+    Product: ('photo',),
+    ProductResults: ('photo_before', 'photo_after'),
+    AttachmentPhoto: ('photo',),
+    User: ('photo',),
+}
+
+# Варианты записаны через UPDATE (без post_save): sender - модель, kwargs pk и field
+variants_ready = Signal()
+
+FORMATS = {
+    # формат -> (расширение, параметры Image.save)
+    'webp': ('webp', {'format': 'WEBP', 'quality': 80, 'method': 4}),
+    'jpeg': ('jpg', {'format': 'JPEG', 'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+
+def variant_dir(name: str) -> str:
+    return f'variants/{os.path.splitext(name)[0]}'
+
+
+def variant_name(name: str, width: int, extension: str) -> str:
+    """ products/a.jpg -> variants/products/a/320.webp """
+    return f'{variant_dir(name)}/{width}.{extension}'
+
+
+def remove_variants(name: str):
+    """ Удаляет все копии файла name (исходник удален из хранилища) """
+    shutil.rmtree(os.path.join(settings.MEDIA_ROOT, variant_dir(name)), ignore_errors=True)
+
+
+def generate_variants(media_root: str, name: str, widths: tuple, placeholder_width: int) -> dict:
+    """
+    Строит уменьшенные копии файла name (путь относительно media_root) и плейсхолдер.
+    Выполняется в дочернем процессе, поэтому работает только с файлами, без ORM
+    """
+    with Image.open(os.path.join(media_root, name)) as source:
+        # draft: JPEG декодируется сразу в уменьшенном масштабе, если нужна только малая копия
+        source.draft('RGB', (max(widths), max(widths)))
+        image = ImageOps.exif_transpose(source)
+        image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+    opaque = image
+    if image.mode == 'RGBA':
+        opaque = Image.new('RGB', image.size, (255, 255, 255))
+        opaque.paste(image, mask=image.getchannel('A'))
+    width, height = image.size
+    variants = {"source": name, "width": width, "height": height, "webp": {}, "jpeg": {}}
+    # Копии не больше исходника; исходник уже меньше всех ширин - одна копия в его размере
+    targets = [target for target in widths if target < width] or [width]
+    for target in targets:
+        size = (target, max(round(height * target / width), 1))
+        resized = image.resize(size, Image.LANCZOS) if size != image.size else image
+        for kind, (extension, options) in FORMATS.items():
+            frame = resized if kind == 'webp' else (opaque.resize(size, Image.LANCZOS) if size != opaque.size else opaque)
+            path = variant_name(name, target, extension)
+            os.makedirs(os.path.dirname(os.path.join(media_root, path)), exist_ok=True)
+            frame.save(os.path.join(media_root, path), **options)
+            variants[kind][str(target)] = path
+    tiny = opaque.resize((placeholder_width, max(round(height * placeholder_width / width), 1)), Image.BILINEAR)
+    buffer = io.BytesIO()
+    tiny.filter(ImageFilter.GaussianBlur(1)).save(buffer, format='WEBP', quality=40)
+    variants["placeholder"] = 'data:image/webp;base64,' + base64.b64encode(buffer.getvalue()).decode('ascii')
+    return variants
+
+
+class VariantPipeline:
+    """
+    [VariantPipeline]
+    Фоновая генерация вариантов изображений в пуле процессов (Pillow держит GIL
+    на ресайзе/кодировании). Результат пишется в <поле>_variants одним UPDATE,
+    только если в поле все еще тот же файл; старые копии удаляются.
+    """
+
+    def __init__(self, workers: int, widths: tuple, placeholder_width: int):
+        self.workers = workers
+        self.widths = tuple(sorted(widths))
+        self.placeholder_width = placeholder_width
+        self.generated = 0
+        self.failed = 0
+        self.inflight = 0
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    def needs_update(self, instance, field: str) -> bool:
+        name = getattr(instance, field).name or None
+        variants = getattr(instance, f'{field}_variants')
+        return (variants or {}).get('source') != name
+
+    def schedule(self, instance, field: str):
+        """ Ставит генерацию в пул; пустое поле сразу сбрасывает варианты """
+        model, pk = type(instance), instance.pk
+        name = getattr(instance, field).name or None
+        previous = getattr(instance, f'{field}_variants')
+        if name is None:
+            self.store(model, pk, field, None, None, previous)
+            return
+        with self._lock:
+            self.inflight += 1
+        future = self.executor.submit(
+            generate_variants, str(settings.MEDIA_ROOT), name, self.widths, self.placeholder_width,
+        )
+        future.add_done_callback(lambda done: self._on_done(done, model, pk, field, name, previous))
+
+    def generate(self, instance, field: str):
+        """ Синхронная генерация (команда build_image_variants) """
+        name = getattr(instance, field).name
+        variants = generate_variants(str(settings.MEDIA_ROOT), name, self.widths, self.placeholder_width)
+        self.store(type(instance), instance.pk, field, name, variants, getattr(instance, f'{field}_variants'))
+        return variants
+
+    def store(self, model, pk, field: str, name, variants, previous):
+        same_file = Q(**{field: name}) if name else Q(**{field: ''}) | Q(**{f'{field}__isnull': True})
+        values = {f'{field}_variants': variants}
+        if any(model_field.name == 'updated_at' for model_field in model._meta.concrete_fields):
+            # UPDATE идет мимо auto_now, а по updated_at считаются ETag/Last-Modified списков
+            values['updated_at'] = timezone.now()
+        updated = model.objects.filter(same_file, pk=pk).update(**values)
+        if updated:
+            variants_ready.send(sender=model, pk=pk, field=field)
+        # Старые копии удаляются, только если новые записаны (иначе их ждет другая генерация).
+        # Копии файла из cas/ общие для всех строк с ним - их удаляет release хранилища
+        if updated and previous and not is_content_name(previous.get('source')):
+            keep = set(self.files(variants))
+            for path in self.files(previous):
+                if path not in keep:
+                    try:
+                        os.remove(os.path.join(settings.MEDIA_ROOT, path))
+                    except OSError:
+                        pass
+            for directory in {os.path.dirname(path) for path in self.files(previous)}:
+                try:
+                    os.rmdir(os.path.join(settings.MEDIA_ROOT, directory))
+                except OSError:
+                    # в папке остались новые копии
+                    pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"workers": self.workers, "inflight": self.inflight, "generated": self.generated, "failed": self.failed}
+
+    @staticmethod
+    def files(variants) -> list:
+        if not variants:
+            return []
+        return [path for kind in FORMATS for path in variants.get(kind, {}).values()]
+
+    def _on_done(self, future, model, pk, field: str, name: str, previous):
+        with self._lock:
+            self.inflight -= 1
+        try:
+            variants = future.result()
+            self.store(model, pk, field, name, variants, previous)
+            with self._lock:
+                self.generated += 1
+        except Exception:
+            logger.exception('Image variants for %s.%s #%s failed', model.__name__, field, pk)
+            with self._lock:
+                self.failed += 1
+        finally:
+            close_old_connections()
+
+
+pipeline = VariantPipeline(settings.IMAGE_VARIANT_WORKERS, settings.IMAGE_VARIANT_WIDTHS, settings.IMAGE_PLACEHOLDER_WIDTH)
@@ -0,0 +1,271 @@
+import os
+import struct
+import tempfile
+import threading
+
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import UploadedFile
+from PIL import Image, ImageOps
+
+from configs import settings
+
+# Первые байты -> формат Pillow. Остальное (EPS, PSD, TIFF...) до Pillow не доходит
+SIGNATURES = (
+    (b'\xff\xd8\xff', 'JPEG'),
+    (b'\x89PNG\r\n\x1a\n', 'PNG'),
+    (b'GIF87a', 'GIF'),
+    (b'GIF89a', 'GIF'),
+)
+EXTENSIONS = {'JPEG': '.jpg', 'PNG': '.png', 'GIF': '.gif', 'WEBP': '.webp'}
+SAVE_OPTIONS = {
+    'JPEG': {'quality': 88, 'optimize': True, 'progressive': True},
+    'PNG': {'optimize': True},
+    'WEBP': {'quality': 88, 'method': 4},
+}
+# Сегменты JPEG, которые сохраняются: APP0 (JFIF), APP2 (ICC-профиль), APP14 (Adobe, цветовое преобразование)
+JPEG_KEEP_APP = {0xE0, 0xE2, 0xEE}
+# Чанки PNG с метаданными
+PNG_METADATA = {b'tEXt', b'zTXt', b'iTXt', b'eXIf', b'tIME'}
+# Pillow хранит RGB/RGBA/CMYK по 4 байта на пиксель, L/P - по одному
+PIXEL_BYTES = {'1': 1, 'L': 1, 'P': 1}
+
+
+def sniff(header: bytes):
+    for magic, image_format in SIGNATURES:
+        if header.startswith(magic):
+            return image_format
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'WEBP'
+    return None
+
+
+def image_bytes(size: tuple, mode: str) -> int:
+    return size[0] * size[1] * PIXEL_BYTES.get(mode, 4)
+
+
+def copy(source, target, length: int, buffer_size: int = 64 * 1024):
+    while length > 0:
+        data = source.read(min(buffer_size, length))
+        if not data:
+            raise ValidationError([{'info': 'Image file is truncated.'}])
+        target.write(data)
+        length -= len(data)
+
+
+def strip_jpeg(source, target):
+    """ Копия JPEG без EXIF/XMP/комментариев, без декодирования: сегменты до SOS фильтруются, скан копируется """
+    target.write(source.read(2))
+    while True:
+        marker = source.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            raise ValidationError([{'info': 'Image file is corrupted.'}])
+        if marker[1] == 0xFF:
+            # заполняющий байт перед маркером
+            source.seek(-1, os.SEEK_CUR)
+            continue
+        if marker[1] in (0x01,) or 0xD0 <= marker[1] <= 0xD7:
+            target.write(marker)
+            continue
+        length = struct.unpack('>H', source.read(2))[0]
+        drop = marker[1] == 0xFE or (0xE0 <= marker[1] <= 0xEF and marker[1] not in JPEG_KEEP_APP)
+        if drop:
+            source.seek(length - 2, os.SEEK_CUR)
+            continue
+        target.write(marker + struct.pack('>H', length))
+        copy(source, target, length - 2)
+        if marker[1] == 0xDA:
+            # Start of scan: дальше сжатые данные до конца файла
+            for data in iter(lambda: source.read(64 * 1024), b''):
+                target.write(data)
+            return
+
+
+def strip_png(source, target):
+    """ Копия PNG без текстовых чанков, eXIf и tIME """
+    target.write(source.read(8))
+    while True:
+        header = source.read(8)
+        if not header:
+            return
+        if len(header) < 8:
+            raise ValidationError([{'info': 'Image file is corrupted.'}])
+        length, chunk_type = struct.unpack('>I', header[:4])[0], header[4:]
+        if chunk_type in PNG_METADATA:
+            source.seek(length + 4, os.SEEK_CUR)
+            continue
+        target.write(header)
+        copy(source, target, length + 4)
+        if chunk_type == b'IEND':
+            return
+
+
+class ImageIngestor:
+    """
+    [ImageIngestor]
+    Прием загружаемых изображений до сохранения в ImageField:
+    1. размер файла и сигнатура (только JPEG/PNG/GIF/WebP) - без Pillow;
+    2. Image.open читает только заголовок: ширина, высота и лимит пикселей;
+    3. оценка памяти на декодирование (для JPEG - с учетом draft, который
+       декодирует сразу в 1/2..1/8 масштаба) против max_memory;
+    4. большие файлы перекодируются с уменьшением до max_side, остальные
+       очищаются от метаданных без перекодирования (JPEG/PNG).
+    Одновременно декодируется не больше concurrency изображений, поэтому
+    общий пик памяти процесса не больше concurrency * max_memory
+    """
+
+    def __init__(self, max_bytes: int, max_pixels: int, max_memory: int, max_side: int,
+                 reencode_bytes: int, concurrency: int, spool_size: int):
+        self.max_bytes = max_bytes
+        self.max_pixels = max_pixels
+        self.max_memory = max_memory
+        self.max_side = max_side
+        self.reencode_bytes = reencode_bytes
+        self.spool_size = spool_size
+        self.slots = threading.BoundedSemaphore(concurrency)
+        self.accepted = 0
+        self.rejected = 0
+        self.reencoded = 0
+        self.stripped = 0
+        self.peak_memory = 0
+        self._lock = threading.Lock()
+
+    def reject(self, message: str):
+        with self._lock:
+            self.rejected += 1
+        raise ValidationError([{'info': message}])
+
+    def ingest(self, file) -> UploadedFile:
+        """ Проверенный файл без метаданных (или перекодированный); ValidationError - отказ """
+        file.seek(0, os.SEEK_END)
+        size = file.tell()
+        if size > self.max_bytes:
+            self.reject(f'Image must be smaller than {self.max_bytes // (1024 * 1024)} MB.')
+        file.seek(0)
+        image_format = sniff(file.read(16))
+        file.seek(0)
+        if image_format is None:
+            self.reject('Upload a valid image (JPEG, PNG, GIF or WebP).')
+        try:
+            image = Image.open(file, formats=[image_format])
+        except Image.DecompressionBombError:
+            self.reject(f'Image must have at most {self.max_pixels // 1000000} megapixels.')
+        except Exception:
+            self.reject('Upload a valid image. The file you uploaded was either not an image or a corrupted image.')
+        width, height = image.size
+        if width * height > self.max_pixels:
+            self.reject(f'Image must have at most {self.max_pixels // 1000000} megapixels.')
+        orientation = image.getexif().get(0x0112, 1) if image_format in ('JPEG', 'WEBP') else 1
+        needs_reencode = (
+            size > self.reencode_bytes or max(width, height) > self.max_side or orientation not in (None, 1)
+            or (image_format in ('WEBP', 'GIF') and ('exif' in image.info or 'xmp' in image.info))
+        )
+        if not needs_reencode:
+            # image не закрываем: у GIF close() закрывает и переданный файл
+            result = self.strip(file, image_format)
+        else:
+            rotate = orientation not in (None, 1)
+            if self.estimate(image, rotate) > self.max_memory:
+                self.reject('Image is too large to process.')
+            with self.slots:
+                result = self.reencode(file, image, image_format, rotate)
+        with self._lock:
+            self.accepted += 1
+        return result
+
+    def target_size(self, size: tuple) -> tuple:
+        scale = min(self.max_side / max(size), 1)
+        return max(round(size[0] * scale), 1), max(round(size[1] * scale), 1)
+
+    def draft_size(self, image) -> tuple:
+        """ Размер, в котором JPEG декодируется с draft (масштаб 1/2, 1/4 или 1/8) """
+        if image.format != 'JPEG':
+            return image.size
+        target = self.target_size(image.size)
+        scale = 1
+        while scale < 8 and image.size[0] // (scale * 2) >= target[0] and image.size[1] // (scale * 2) >= target[1]:
+            scale *= 2
+        return -(-image.size[0] // scale), -(-image.size[1] // scale)
+
+    def estimate(self, image, rotate: bool) -> int:
+        """ Пик буферов Pillow: декодированное (+ повернутая копия) + уменьшенное """
+        mode = 'RGB' if image.format == 'JPEG' else image.mode
+        decoded = image_bytes(self.draft_size(image), mode)
+        return decoded * (2 if rotate else 1) + image_bytes(self.target_size(image.size), mode)
+
+    def spooled(self, name: str, content_type: str) -> UploadedFile:
+        return UploadedFile(
+            tempfile.SpooledTemporaryFile(max_size=self.spool_size), name=name, content_type=content_type,
+        )
+
+    def strip(self, file, image_format: str) -> UploadedFile:
+        if image_format not in ('JPEG', 'PNG'):
+            file.seek(0)
+            return file
+        result = self.spooled(file.name, Image.MIME[image_format])
+        file.seek(0)
+        (strip_jpeg if image_format == 'JPEG' else strip_png)(file, result.file)
+        result.size = result.file.tell()
+        result.file.seek(0)
+        with self._lock:
+            self.stripped += 1
+        return result
+
+    def reencode(self, file, image, image_format: str, rotate: bool) -> UploadedFile:
+        """
+        Декодирование (с draft для JPEG), поворот по EXIF, уменьшение и сохранение без метаданных.
+        Пик памяти считается по буферам Pillow, живущим одновременно
+        """
+        if image_format == 'JPEG':
+            image.draft('RGB', self.target_size(image.size))
+        try:
+            image.load()
+        except Exception:
+            self.reject('Upload a valid image. The file you uploaded was either not an image or a corrupted image.')
+        peak = image_bytes(image.size, image.mode)
+
+        def replace(current, new):
+            nonlocal peak
+            peak = max(peak, image_bytes(current.size, current.mode) + image_bytes(new.size, new.mode))
+            if new is not current:
+                current.close()
+            return new
+
+        if rotate:
+            image = replace(image, ImageOps.exif_transpose(image))
+        if image_format == 'GIF':
+            # анимация не сохраняется: первый кадр в PNG
+            image_format = 'PNG'
+        if image_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+            image = replace(image, image.convert('RGB'))
+        size = self.target_size(image.size)
+        if size != image.size:
+            image = replace(image, image.resize(size, Image.LANCZOS))
+        # info (комментарий, exif, xmp) иначе частично переносится в новый файл
+        image.info = {key: value for key, value in image.info.items() if key == 'icc_profile'}
+        name = os.path.splitext(file.name)[0] + EXTENSIONS[image_format]
+        result = self.spooled(name, Image.MIME[image_format])
+        image.save(result.file, format=image_format, icc_profile=image.info.get('icc_profile'),
+                   **SAVE_OPTIONS.get(image_format, {}))
+        image.close()
+        result.size = result.file.tell()
+        result.file.seek(0)
+        with self._lock:
+            self.reencoded += 1
+            self.peak_memory = max(self.peak_memory, peak)
+        return result
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "accepted": self.accepted,
+                "rejected": self.rejected,
+                "reencoded": self.reencoded,
+                "stripped": self.stripped,
+                "peak_memory": self.peak_memory,
+            }
+
+
+ingestor = ImageIngestor(
+    settings.INGEST_MAX_BYTES, settings.INGEST_MAX_PIXELS, settings.INGEST_MAX_MEMORY, settings.INGEST_MAX_SIDE,
+    settings.INGEST_REENCODE_BYTES, settings.INGEST_CONCURRENCY, settings.INGEST_SPOOL_SIZE,
+)
@@ -0,0 +1,142 @@
+import hashlib
+
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from rest_framework.renderers import JSONRenderer
+
+from tlc.core.fast_serializers import FastSerializer
+from tlc.core.snapshots import URL_PLACEHOLDER, SnapshotRequest
+from tlc.models import Product
+from tlc.serializers import ProductCategorySerializer, ProductSerializer
+from configs import settings
+
+
+class Leaderboard:
+    """
+    [Leaderboard]
+    Материализованный топ товаров: все товары с top в кэше Django,
+    уже сериализованные (с вложенной категорией) и отсортированные по (top, id).
+    Сигналы точечно вставляют/убирают товар и обновляют категорию в строках,
+    так что ответ не зависит от размера каталога. Если структуры нет
+    (холодный старт, гонка записей), она собирается одним запросом
+    по частичному индексу product_top_idx.
+    """
+
+    key = 'leaderboard:products'
+    lock_key = 'leaderboard:products:lock'
+
+    def __init__(self, max_rows: int, ttl: int):
+        self.max_rows = max_rows
+        self.ttl = ttl
+        self.cache = caches[settings.RESPONSE_CACHE_ALIAS]
+
+    def rows(self) -> dict:
+        board = self.cache.get(self.key)
+        if board is None:
+            board = self.rebuild()
+        return board
+
+    def rebuild(self) -> dict:
+        queryset = Product.objects.filter(top__isnull=False).order_by('top', 'id')[:self.max_rows + 1]
+        rows = self.serialize(queryset)
+        board = {"rows": rows[:self.max_rows], "complete": len(rows) <= self.max_rows}
+        self.cache.set(self.key, board, self.ttl)
+        return board
+
+    def top(self, category_id: int = None, limit: int = 5) -> list:
+        board = self.rows()
+        rows = board["rows"]
+        if category_id is not None:
+            rows = [row for row in rows if row["category"]["id"] == category_id]
+            if not board["complete"] and len(rows) < limit:
+                # Топ обрезан по max_rows - категорию добираем из БД (частичный индекс product_category_top_idx)
+                queryset = Product.objects.filter(category_id=category_id, top__isnull=False).order_by('top', 'id')
+                return self.serialize(queryset[:limit])
+        return rows[:limit]
+
+    def update_product(self, product_id: int):
+        """ Товар сохранен: убрать старую строку и вставить новую, если у него есть top """
+        rows = self.serialize(Product.objects.filter(pk=product_id, top__isnull=False))
+        self.modify(lambda board: self.replace(board, product_id, rows[0] if rows else None))
+
+    def remove_product(self, product_id: int):
+        self.modify(lambda board: self.replace(board, product_id, None))
+
+    def update_category(self, category):
+        """ Категория изменилась: обновить денормализованную копию в строках """
+        category_data = self.serialize_category(category)
+
+        def apply(board):
+            for row in board["rows"]:
+                if row["category"]["id"] == category.pk:
+                    row["category"] = dict(category_data)
+
+        self.modify(apply)
+
+    def modify(self, apply):
+        """
+        Изменение структуры под коротким замком в кэше. Не удалось взять
+        замок - структура сбрасывается и соберется заново при чтении
+        """
+        if not self.cache.add(self.lock_key, 1, 10):
+            self.cache.delete(self.key)
+            return
+        try:
+            board = self.cache.get(self.key)
+            if board is None:
+                return
+            apply(board)
+            self.cache.set(self.key, board, self.ttl)
+        finally:
+            self.cache.delete(self.lock_key)
+
+    def replace(self, board: dict, product_id: int, row: dict):
+        if not board["complete"]:
+            # Топ обрезан по max_rows - точечная правка может потерять строки на границе
+            board.update(self.rebuild())
+            return
+        rows = [existing for existing in board["rows"] if existing["id"] != product_id]
+        if row is not None:
+            self.insert(rows, row)
+        board["rows"] = rows[:self.max_rows]
+        board["complete"] = len(rows) <= self.max_rows
+
+    @staticmethod
+    def insert(rows: list, row: dict):
+        position = len(rows)
+        for index, existing in enumerate(rows):
+            if (existing["top"], existing["id"]) > (row["top"], row["id"]):
+                position = index
+                break
+        rows.insert(position, row)
+
+    @staticmethod
+    def serialize(queryset) -> list:
+        """ Строки ProductSerializer с заглушкой вместо хоста в URL (подставляется при отдаче) """
+        return FastSerializer(ProductSerializer, {"request": SnapshotRequest()}).serialize(queryset)
+
+    @staticmethod
+    def serialize_category(category) -> dict:
+        return dict(ProductCategorySerializer(instance=category, context={"request": SnapshotRequest()}).data)
+
+    def render(self, request, serializer_class, category_id: int = None, limit: int = 5) -> bytes:
+        """ JSON топа в полях serializer_class (summary/?fields=) с хостом запроса в URL """
+        fields = [name for name, *_ in FastSerializer(serializer_class, {"request": request}).plan.fields]
+        data = [{name: row[name] for name in fields} for row in self.top(category_id, limit)]
+        content = JSONRenderer().render(data)
+        base = f'{request.scheme}://{request.get_host()}'
+        return content.replace(URL_PLACEHOLDER.encode('utf-8'), base.encode('utf-8'))
+
+    def response(self, request, serializer_class, category_id: int = None, limit: int = 5) -> HttpResponse:
+        """ Ответ с ETag по содержимому """
+        content = self.render(request, serializer_class, category_id, limit)
+        etag = '"%s"' % hashlib.sha1(content).hexdigest()
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = HttpResponse(content, content_type='application/json')
+        response['ETag'] = etag
+        return response
+
+
+leaderboard = Leaderboard(settings.LEADERBOARD_MAX_ROWS, settings.LEADERBOARD_TTL)
@@ -0,0 +1,202 @@
+import mimetypes
+import os
+import posixpath
+import re
+import stat
+from urllib.parse import quote
+
+from django.http import Http404, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_safe
+from rest_framework import exceptions
+
+from tlc.core.auth import ClaimsJWTAuthentication
+from tlc.core.storage import is_content_name
+from configs import settings
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def parse_range(header: str, size: int):
+    """
+    (start, end) включительно для одного диапазона из заголовка Range.
+    None - заголовок игнорируется (нет, не bytes, несколько диапазонов: отдаем весь файл),
+    ValueError - диапазон вне файла (416)
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # bytes=-N: последние N байт
+        length = int(last)
+        if length == 0:
+            raise ValueError(header)
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        raise ValueError(header)
+    return start, end
+
+
+def iter_file(path: str, start: int, length: int, chunk_size: int):
+    with open(path, 'rb') as file:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(chunk_size, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+class MediaServer:
+    """
+    [MediaServer]
+    Отдача MEDIA_ROOT вместо django.conf.urls.static: проверка доступа,
+    ETag/Last-Modified, Range/If-Range с ответом 206. Если задан accel_prefix,
+    после проверок сам файл отдает nginx (X-Accel-Redirect на internal location),
+    и воркер не занят на все время скачивания видео
+    """
+
+    def __init__(self, root, protected_prefixes: tuple, accel_prefix: str, max_age: int, immutable_max_age: int,
+                 chunk_size: int):
+        self.root = os.path.abspath(str(root))
+        self.protected_prefixes = tuple(prefix.strip('/') + '/' for prefix in protected_prefixes)
+        self.accel_prefix = accel_prefix
+        self.max_age = max_age
+        self.immutable_max_age = immutable_max_age
+        self.chunk_size = chunk_size
+
+    def resolve(self, path: str):
+        """ (нормализованный путь, абсолютный путь, stat) или Http404 """
+        path = posixpath.normpath(path).lstrip('/')
+        parts = path.split('/')
+        if not path or path == '.' or any(part in ('', '..') or part.startswith('.') for part in parts):
+            raise Http404
+        full_path = os.path.join(self.root, *parts)
+        try:
+            stat_result = os.stat(full_path)
+        except OSError:
+            raise Http404
+        if not stat.S_ISREG(stat_result.st_mode):
+            raise Http404
+        return path, full_path, stat_result
+
+    def is_protected(self, path: str) -> bool:
+        return path.startswith(self.protected_prefixes)
+
+    def check_access(self, request, path: str):
+        """ Файлы из protected_prefixes - только с действующим токеном (без запроса к БД) """
+        if not self.is_protected(path):
+            return None
+        try:
+            user = ClaimsJWTAuthentication().authenticate(request)
+        except exceptions.APIException:
+            user = None
+        if user is None:
+            response = HttpResponse(status=401)
+            response['WWW-Authenticate'] = 'Bearer'
+            return response
+        return None
+
+    @staticmethod
+    def etag(path: str, stat_result) -> str:
+        if is_content_name(path):
+            # Имя файла в cas/ - хэш содержимого, одинаковый на всех серверах
+            return '"%s"' % os.path.splitext(os.path.basename(path))[0]
+        return '"%x-%x"' % (stat_result.st_mtime_ns, stat_result.st_size)
+
+    def cache_control(self, path: str) -> str:
+        scope = 'private' if self.is_protected(path) else 'public'
+        if is_content_name(path):
+            return '%s, max-age=%d, immutable' % (scope, self.immutable_max_age)
+        return '%s, max-age=%d' % (scope, self.max_age)
+
+    @staticmethod
+    def content_disposition(name: str) -> str:
+        """ ?name=: имя для сохранения файла, у которого в пути хэш (cas/) """
+        name = ''.join(char for char in posixpath.basename(name.replace('\\', '/')) if char >= ' ').strip()
+        base, extension = posixpath.splitext(name)
+        fallback = base.encode('ascii', 'ignore').decode('ascii').replace('"', '').strip() or 'download'
+        fallback += extension.encode('ascii', 'ignore').decode('ascii').replace('"', '')
+        return 'inline; filename="%s"; filename*=UTF-8\'\'%s' % (fallback, quote(name))
+
+    @staticmethod
+    def if_range_matches(request, etag: str, mtime: int) -> bool:
+        """ If-Range: диапазон отдается, только если файл не менялся (сильное сравнение) """
+        value = request.headers.get('If-Range')
+        if not value:
+            return True
+        if value.startswith('"') or value.startswith('W/'):
+            return value == etag
+        since = parse_http_date_safe(value)
+        return since is not None and mtime <= since
+
+    def response(self, request, path: str):
+        path, full_path, stat_result = self.resolve(path)
+        denied = self.check_access(request, path)
+        if denied is not None:
+            return denied
+        etag, mtime, size = self.etag(path, stat_result), int(stat_result.st_mtime), stat_result.st_size
+        not_modified = get_conditional_response(request, etag=etag, last_modified=mtime)
+        if not_modified is not None:
+            response = not_modified
+        elif self.accel_prefix:
+            # Range, If-Range и 206 nginx обрабатывает сам
+            response = HttpResponse()
+            response['X-Accel-Redirect'] = self.accel_prefix.rstrip('/') + '/' + quote(path)
+        else:
+            response = self.file_response(request, full_path, etag, mtime, size)
+        content_type, encoding = mimetypes.guess_type(path)
+        if not isinstance(response, HttpResponseNotModified) and response.status_code != 416:
+            response['Content-Type'] = content_type or 'application/octet-stream'
+            if encoding:
+                response['Content-Encoding'] = encoding
+            if request.GET.get('name'):
+                response['Content-Disposition'] = self.content_disposition(request.GET['name'])
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(mtime)
+        response['Accept-Ranges'] = 'bytes'
+        response['Cache-Control'] = self.cache_control(path)
+        if self.is_protected(path):
+            response['Vary'] = 'Authorization'
+        return response
+
+    def file_response(self, request, full_path: str, etag: str, mtime: int, size: int):
+        start, end = 0, size - 1
+        status = 200
+        if self.if_range_matches(request, etag, mtime):
+            try:
+                byte_range = parse_range(request.headers.get('Range'), size)
+            except ValueError:
+                response = HttpResponse(status=416)
+                response['Content-Range'] = 'bytes */%d' % size
+                return response
+            if byte_range is not None:
+                start, end = byte_range
+                status = 206
+        length = end - start + 1 if size else 0
+        if request.method == 'HEAD':
+            response = HttpResponse(status=status)
+        else:
+            response = StreamingHttpResponse(iter_file(full_path, start, length, self.chunk_size), status=status)
+        response['Content-Length'] = str(length)
+        if status == 206:
+            response['Content-Range'] = 'bytes %d-%d/%d' % (start, end, size)
+        return response
+
+
+media_server = MediaServer(
+    settings.MEDIA_ROOT, settings.MEDIA_PROTECTED_PREFIXES, settings.MEDIA_ACCEL_REDIRECT,
+    settings.MEDIA_MAX_AGE, settings.MEDIA_IMMUTABLE_MAX_AGE, settings.MEDIA_CHUNK_SIZE,
+)
+
+
+@require_safe
+def serve_media(request, path):
+    return media_server.response(request, path)
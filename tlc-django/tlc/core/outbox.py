@@ -0,0 +1,257 @@
+import logging
+import smtplib
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from tlc.models import OutgoingEmail
+from configs import settings
+
+logger = logging.getLogger(__name__)
+
+
+class SMTPConnectionPool:
+    """
+    [SMTPConnectionPool]
+    Пул авторизованных SMTP-соединений. Соединение переиспользуется,
+    пока сервер отвечает на NOOP; сломанные соединения выбрасываются.
+    """
+
+    def __init__(self, host: str, port: int, use_tls: bool, login: str, password: str, size: int, timeout: float):
+        self.host = host
+        self.port = port
+        self.use_tls = use_tls
+        self.login = login
+        self.password = password
+        self.size = size
+        self.timeout = timeout
+        self._idle = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def connection(self):
+        server = self._acquire()
+        try:
+            yield server
+        except Exception:
+            self._close(server)
+            raise
+        else:
+            self._release(server)
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for server in idle:
+            self._close(server)
+
+    def _acquire(self) -> smtplib.SMTP:
+        while True:
+            with self._lock:
+                server = self._idle.pop() if self._idle else None
+            if server is None:
+                return self._connect()
+            try:
+                if server.noop()[0] == 250:
+                    return server
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._close(server)
+
+    def _release(self, server: smtplib.SMTP):
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append(server)
+                return
+        self._close(server)
+
+    def _connect(self) -> smtplib.SMTP:
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.use_tls:
+            server.starttls()
+        if self.login and self.password:
+            server.login(self.login, self.password)
+        return server
+
+    def _close(self, server: smtplib.SMTP):
+        try:
+            server.quit()
+        except (smtplib.SMTPException, OSError):
+            server.close()
+
+
+class Outbox:
+    """
+    [Outbox]
+    Очередь исходящих писем поверх таблицы OutgoingEmail.
+    Запрос только сохраняет письмо; фоновый отправитель забирает пачки,
+    шлет их через пул соединений и повторяет неудачные попытки с backoff.
+    """
+
+    def __init__(self, pool: SMTPConnectionPool, sender: str, batch_size: int, max_attempts: int,
+                 backoff: float, max_backoff: float, lease: float, poll_interval: float):
+        self.pool = pool
+        self.sender = sender
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._stats_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+
+    def enqueue(self, message: str, to: str, subject: str) -> OutgoingEmail:
+        email = OutgoingEmail.objects.create(to=to, subject=subject, body=message)
+        if settings.EMAIL_OUTBOX_AUTOSTART:
+            self.start()
+        transaction.on_commit(self.wake)
+        return email
+
+    def wake(self):
+        self._wakeup.set()
+
+    def start(self):
+        """ Запускает фоновый поток отправки в текущем процессе (один раз) """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self.run_forever, name='email-outbox', daemon=True)
+                self._thread.start()
+
+    def run_forever(self):
+        while True:
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+            try:
+                while self.process_batch() == self.batch_size:
+                    pass
+            except Exception:
+                logger.exception('Email outbox iteration failed')
+            finally:
+                close_old_connections()
+
+    def process_batch(self) -> int:
+        """ Отправляет одну пачку писем, возвращает ее размер """
+        batch = self._claim()
+        if not batch:
+            return 0
+        pending = list(batch)
+        try:
+            with self.pool.connection() as server:
+                while pending:
+                    email = pending[0]
+                    started = time.perf_counter()
+                    try:
+                        server.sendmail(self.sender, [email.to], self._build(email).as_string())
+                    except (smtplib.SMTPRecipientsRefused, smtplib.SMTPDataError, smtplib.SMTPSenderRefused) as e:
+                        self._mark_failed(email, e)
+                    except (smtplib.SMTPException, OSError):
+                        raise
+                    except Exception as e:
+                        # Письмо не собралось (кодировка, заголовки): иначе пачка висит под lease
+                        logger.exception('Email %s could not be sent', email.id)
+                        self._mark_failed(email, e)
+                    else:
+                        self._mark_sent(email, time.perf_counter() - started)
+                    pending.pop(0)
+        except (smtplib.SMTPException, OSError) as e:
+            # Соединение потеряно: остаток пачки уходит на повтор
+            for email in pending:
+                self._mark_failed(email, e)
+        return len(batch)
+
+    def queue_depth(self) -> int:
+        return OutgoingEmail.objects.filter(status=OutgoingEmail.STATUS_PENDING).count()
+
+    def stats(self) -> dict:
+        queue_depth = self.queue_depth()
+        with self._stats_lock:
+            return {
+                "queue_depth": queue_depth,
+                "sent": self.sent,
+                "failed": self.failed,
+                "retried": self.retried,
+                "send_latency_avg_ms": self._latency_total / self.sent * 1000 if self.sent else 0.0,
+                "send_latency_max_ms": self._latency_max * 1000,
+            }
+
+    def _claim(self) -> list:
+        """ Забирает пачку писем, продлевая их lease, чтобы другие воркеры их не взяли """
+        now = timezone.now()
+        with transaction.atomic():
+            batch = list(
+                OutgoingEmail.objects
+                .select_for_update(skip_locked=True)
+                .filter(status=OutgoingEmail.STATUS_PENDING, next_attempt_at__lte=now)
+                .order_by('next_attempt_at')[:self.batch_size]
+            )
+            if batch:
+                OutgoingEmail.objects.filter(id__in=[email.id for email in batch]).update(
+                    next_attempt_at=now + timedelta(seconds=self.lease)
+                )
+        return batch
+
+    def _build(self, email: OutgoingEmail) -> MIMEMultipart:
+        msg = MIMEMultipart()
+        msg['From'] = self.sender
+        msg['To'] = email.to
+        msg['Subject'] = email.subject
+        msg.attach(MIMEText(email.body, 'plain'))
+        return msg
+
+    def _mark_sent(self, email: OutgoingEmail, latency: float):
+        OutgoingEmail.objects.filter(id=email.id).update(
+            status=OutgoingEmail.STATUS_SENT, sent_at=timezone.now(), attempts=email.attempts + 1, last_error=None,
+        )
+        with self._stats_lock:
+            self.sent += 1
+            self._latency_total += latency
+            self._latency_max = max(self._latency_max, latency)
+
+    def _mark_failed(self, email: OutgoingEmail, error: Exception):
+        attempts = email.attempts + 1
+        if attempts >= self.max_attempts:
+            status, delay = OutgoingEmail.STATUS_FAILED, 0
+            logger.error('Email %s to %s failed after %s attempts: %s', email.id, email.to, attempts, error)
+        else:
+            status, delay = OutgoingEmail.STATUS_PENDING, min(self.backoff * 2 ** (attempts - 1), self.max_backoff)
+        OutgoingEmail.objects.filter(id=email.id).update(
+            status=status, attempts=attempts, last_error=str(error),
+            next_attempt_at=timezone.now() + timedelta(seconds=delay),
+        )
+        with self._stats_lock:
+            if status == OutgoingEmail.STATUS_FAILED:
+                self.failed += 1
+            else:
+                self.retried += 1
+
+
+outbox = Outbox(
+    SMTPConnectionPool(
+        settings.EMAIL_HOST, settings.EMAIL_PORT, settings.EMAIL_USE_TLS,
+        settings.EMAIL_HOST_USER, settings.EMAIL_HOST_PASSWORD,
+        settings.EMAIL_OUTBOX_POOL_SIZE, settings.EMAIL_TIMEOUT,
+    ),
+    sender=settings.EMAIL_HOST_USER,
+    batch_size=settings.EMAIL_OUTBOX_BATCH_SIZE,
+    max_attempts=settings.EMAIL_OUTBOX_MAX_ATTEMPTS,
+    backoff=settings.EMAIL_OUTBOX_BACKOFF,
+    max_backoff=settings.EMAIL_OUTBOX_MAX_BACKOFF,
+    lease=settings.EMAIL_OUTBOX_LEASE,
+    poll_interval=settings.EMAIL_OUTBOX_POLL_INTERVAL,
+)
@@ -0,0 +1,95 @@
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework import pagination
+from rest_framework.exceptions import NotFound
+
+from configs import settings
+
+
+class KeysetPagination(pagination.CursorPagination):
+    """
+    [KeysetPagination]
+    Курсорная пагинация по индексированной сортировке: без OFFSET и COUNT(*).
+    Позиция в курсоре - значения всех полей сортировки, а не только первого,
+    поэтому последнее поле (id) разводит записи с одинаковым created_at.
+    Включается, только если клиент передал cursor или page_size;
+    старые клиенты без этих параметров получают прежний голый список.
+    """
+
+    page_size = settings.KEYSET_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = settings.KEYSET_MAX_PAGE_SIZE
+
+    def __init__(self, ordering: tuple):
+        self.ordering = ordering
+
+    def is_requested(self, request) -> bool:
+        return self.cursor_query_param in request.query_params or self.page_size_query_param in request.query_params
+
+    def respond(self, request, view, queryset, serializer_class, context: dict):
+        """ Ответ со страницей и ссылками next/previous """
+        page = self.paginate_queryset(queryset, request, view=view)
+        return self.get_paginated_response(serializer_class(instance=page, many=True, context=context).data)
+
+    def after(self, ordering: tuple, position: str) -> Q:
+        """ Записи строго после position в порядке ordering: (a < x) | (a = x & b < y) | ... """
+        condition, equal = Q(), Q()
+        for order, value in zip(ordering, json.loads(position)):
+            field = order.lstrip('-')
+            condition |= equal & Q(**{field + ('__lt' if order.startswith('-') else '__gt'): value})
+            equal &= Q(**{field: value})
+        return condition
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        self.cursor = self.decode_cursor(request)
+        reverse, current_position = (False, None) if self.cursor is None else (self.cursor.reverse, self.cursor.position)
+        # Позиции уникальны, поэтому смещение внутри одинаковых значений не нужно
+        ordering = tuple(order[1:] if order.startswith('-') else '-' + order for order in self.ordering) \
+            if reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if current_position is not None:
+            try:
+                queryset = queryset.filter(self.after(ordering, current_position))
+            except (ValueError, ValidationError):
+                raise NotFound(self.invalid_cursor_message)
+
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        following_position = None
+        if len(results) > len(self.page):
+            following_position = self._get_position_from_instance(results[-1], self.ordering)
+
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = current_position is not None, following_position is not None
+            self.next_position, self.previous_position = current_position, following_position
+        else:
+            self.has_next, self.has_previous = following_position is not None, current_position is not None
+            self.next_position, self.previous_position = following_position, current_position
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+    def decode_cursor(self, request):
+        cursor = super().decode_cursor(request)
+        if cursor is None or cursor.position is None:
+            return cursor
+        try:
+            values = json.loads(cursor.position)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(self.ordering) \
+                or not all(isinstance(value, str) for value in values):
+            raise NotFound(self.invalid_cursor_message)
+        return cursor
+
+    def _get_position_from_instance(self, instance, ordering):
+        values = [
+            instance[order.lstrip('-')] if isinstance(instance, dict) else getattr(instance, order.lstrip('-'))
+            for order in ordering
+        ]
+        return json.dumps([str(value) for value in values])
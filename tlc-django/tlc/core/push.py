@@ -0,0 +1,160 @@
+import logging
+import queue
+import threading
+import time
+
+from django.db import close_old_connections
+from django.utils.module_loading import import_string
+import firebase_admin
+from fcm_django.models import FCMDevice
+from firebase_admin import credentials, messaging
+
+from configs import settings
+
+logger = logging.getLogger(__name__)
+
+
+def init_firebase():
+    """ Приложение firebase_admin по умолчанию из FIREBASE_CREDENTIALS (один раз на процесс) """
+    if not settings.FIREBASE_CREDENTIALS:
+        return
+    try:
+        firebase_admin.get_app()
+    except ValueError:
+        firebase_admin.initialize_app(credentials.Certificate(settings.FIREBASE_CREDENTIALS))
+
+
+class FirebaseTransport:
+    """ Отправка multicast-сообщений через firebase_admin """
+
+    def send(self, tokens: list, notification: dict, data: dict) -> list:
+        message = messaging.MulticastMessage(
+            tokens=tokens,
+            notification=messaging.Notification(**notification),
+            data=data,
+        )
+        return messaging.send_multicast(message).responses
+
+
+class StubTransport:
+    """
+    Локальная заглушка для тестов и бенчмарков: ничего не отправляет,
+    токены из invalid_tokens отвечают UnregisteredError
+    """
+
+    def __init__(self, invalid_tokens=()):
+        self.invalid_tokens = set(invalid_tokens)
+        self.batches = []
+
+    def send(self, tokens: list, notification: dict, data: dict) -> list:
+        self.batches.append((list(tokens), notification, data))
+        return [
+            messaging.SendResponse(None, messaging.UnregisteredError('Requested entity was not found.'))
+            if token in self.invalid_tokens else messaging.SendResponse({'name': f'stub/{token}'}, None)
+            for token in tokens
+        ]
+
+
+class PushFanout:
+    """
+    [PushFanout]
+    Рассылка пуша всем активным FCMDevice из фонового потока.
+    Устройства читаются из БД пачками по id, отправляются multicast-чанками,
+    невалидные токены по результатам отправки деактивируются одним UPDATE на чанк.
+    """
+
+    def __init__(self, transport, chunk_size: int, db_batch_size: int):
+        self.transport = transport
+        self.chunk_size = chunk_size
+        self.db_batch_size = db_batch_size
+        self.sent = 0
+        self.failed = 0
+        self.pruned = 0
+        self.last_job_seconds = 0.0
+        self._jobs = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def publish(self, notification: dict, data: dict):
+        """ Ставит рассылку в очередь фонового потока """
+        self._jobs.put((notification, data))
+        self.start()
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run_forever, name='push-fanout', daemon=True)
+                self._thread.start()
+
+    def send_to_all(self, notification: dict, data: dict) -> dict:
+        """ Синхронная рассылка по всем активным устройствам """
+        started = time.perf_counter()
+        totals = {"sent": 0, "failed": 0, "pruned": 0}
+        chunk = []
+        for token in self._iter_tokens():
+            chunk.append(token)
+            if len(chunk) == self.chunk_size:
+                self._send_chunk(chunk, notification, data, totals)
+                chunk = []
+        if chunk:
+            self._send_chunk(chunk, notification, data, totals)
+        totals["seconds"] = time.perf_counter() - started
+        with self._lock:
+            self.sent += totals["sent"]
+            self.failed += totals["failed"]
+            self.pruned += totals["pruned"]
+            self.last_job_seconds = totals["seconds"]
+        return totals
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "queued_jobs": self._jobs.qsize(),
+                "sent": self.sent,
+                "failed": self.failed,
+                "pruned": self.pruned,
+                "last_job_seconds": self.last_job_seconds,
+            }
+
+    def _iter_tokens(self):
+        last_id = 0
+        while True:
+            rows = list(
+                FCMDevice.objects
+                .filter(active=True, id__gt=last_id)
+                .order_by('id')
+                .values_list('id', 'registration_id')[:self.db_batch_size]
+            )
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            for _, token in rows:
+                yield token
+
+    def _send_chunk(self, tokens: list, notification: dict, data: dict, totals: dict):
+        responses = self.transport.send(tokens, notification, data)
+        failed = sum(1 for response in responses if not response.success)
+        totals["sent"] += len(responses) - failed
+        totals["failed"] += failed
+        if failed:
+            pruned = FCMDevice.objects.deactivate_devices_with_error_results(tokens, responses)
+            totals["pruned"] += len(pruned)
+
+    def _run_forever(self):
+        while True:
+            notification, data = self._jobs.get()
+            try:
+                self.send_to_all(notification, data)
+            except Exception:
+                logger.exception('Push fan-out failed')
+            finally:
+                close_old_connections()
+
+
+fanout = PushFanout(
+    import_string(settings.PUSH_TRANSPORT)(),
+    chunk_size=settings.PUSH_CHUNK_SIZE,
+    db_batch_size=settings.PUSH_DB_BATCH_SIZE,
+)
@@ -0,0 +1,201 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from django.core.cache import caches
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.module_loading import import_string
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+from configs import settings
+
+
+class LocMemBackend:
+    """ Кэш в памяти процесса (LRU); поколения моделей тоже локальные """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, deadline = entry
+            if time.monotonic() >= deadline:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value, ttl: int):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def generations(self, names: list) -> list:
+        with self._lock:
+            return [self._generations.get(name, 0) for name in names]
+
+    def bump(self, name: str):
+        with self._lock:
+            self._generations[name] = self._generations.get(name, 0) + 1
+
+
+class DjangoCacheBackend:
+    """ Общий кэш Django (RESPONSE_CACHE_ALIAS) - для нескольких воркеров """
+
+    def __init__(self, max_entries: int):
+        self.cache = caches[settings.RESPONSE_CACHE_ALIAS]
+
+    def get(self, key: str):
+        return self.cache.get(key)
+
+    def set(self, key: str, value, ttl: int):
+        self.cache.set(key, value, ttl)
+
+    def generations(self, names: list) -> list:
+        keys = [self._generation_key(name) for name in names]
+        values = self.cache.get_many(keys)
+        missing = [key for key in keys if key not in values]
+        if missing:
+            # Поколение вытеснено из кэша: новое начинается не с 0, иначе совпадут старые ключи
+            for key in missing:
+                self.cache.add(key, time.time_ns(), None)
+            values.update(self.cache.get_many(missing))
+        return [values.get(key, 0) for key in keys]
+
+    def bump(self, name: str):
+        key = self._generation_key(name)
+        try:
+            self.cache.incr(key)
+        except ValueError:
+            # add, чтобы не потерять инкремент при гонке воркеров
+            if not self.cache.add(key, time.time_ns(), None):
+                self.cache.incr(key)
+
+    @staticmethod
+    def _generation_key(name: str) -> str:
+        return f'response-cache-gen:{name}'
+
+
+class ResponseCache:
+    """
+    [ResponseCache]
+    Кэш отрендеренных ответов. Ключ - эндпоинт, хост, путь с параметрами
+    и текущие поколения зависимых моделей; сигнал на модели увеличивает
+    ее поколение, и все старые ключи перестают совпадать.
+    """
+
+    def __init__(self, backend, ttl: int):
+        self.backend = backend
+        self.ttl = ttl
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def get_or_build(self, endpoint: str, models: tuple, request, build, vary_on_query: bool = True):
+        """
+        Возвращает закэшированное значение или строит его через build().
+        vary_on_query=False - ключ не зависит от пути и параметров запроса
+        """
+        key, value = self.lookup(endpoint, models, request, vary_on_query)
+        if value is None:
+            value = build()
+            if value is not None:
+                self.store(key, value)
+        return value
+
+    def lookup(self, endpoint: str, models: tuple, request, vary_on_query: bool = True):
+        """ (ключ, значение или None) - ключ фиксирует поколения моделей на момент запроса """
+        key = self.make_key(endpoint, models, request, vary_on_query)
+        value = self.backend.get(key)
+        self._count(endpoint, value is not None)
+        return key, value
+
+    def store(self, key: str, value):
+        self.backend.set(key, value, self.ttl)
+
+    def make_key(self, endpoint: str, models: tuple, request, vary_on_query: bool = True) -> str:
+        labels = [model._meta.label_lower for model in models]
+        location = (request.path, sorted(request.GET.lists())) if vary_on_query else None
+        raw = repr((endpoint, request.scheme, request.get_host(), location, self.backend.generations(labels)))
+        return 'response-cache:' + hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    def invalidate(self, model):
+        self.backend.bump(model._meta.label_lower)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                endpoint: {"hits": hits, "misses": misses, "hit_ratio": hits / (hits + misses)}
+                for endpoint, (hits, misses) in self._stats.items()
+            }
+
+    def _count(self, endpoint: str, hit: bool):
+        with self._lock:
+            counters = self._stats.setdefault(endpoint, [0, 0])
+            counters[0 if hit else 1] += 1
+
+
+response_cache = ResponseCache(
+    import_string(settings.RESPONSE_CACHE_BACKEND)(settings.RESPONSE_CACHE_MAX_ENTRIES),
+    settings.RESPONSE_CACHE_TTL,
+)
+
+
+def cached_response(endpoint: str, models: tuple):
+    """
+    Декоратор view/action: кэширует отрендеренный JSON успешного ответа.
+    Ответы в других форматах (browsable API) не кэшируются.
+    Потоковый ответ отдается как есть и попадает в кэш, только если
+    дочитан до конца и не больше RESPONSE_CACHE_MAX_STREAM_BYTES
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            request = args[0] if isinstance(args[0], Request) else args[1]
+            renderer = getattr(request, 'accepted_renderer', None)
+            if renderer is None or renderer.format != 'json':
+                return func(*args, **kwargs)
+            key, cached = response_cache.lookup(endpoint, models, request)
+            if cached is not None:
+                content, status_code = cached
+                return HttpResponse(content, status=status_code, content_type=renderer.media_type)
+            response = func(*args, **kwargs)
+            if response.status_code != 200:
+                return response
+            if isinstance(response, StreamingHttpResponse):
+                response.streaming_content = tee_to_cache(response.streaming_content, key, response.status_code)
+                return response
+            if not isinstance(response, Response):
+                return response
+            content = renderer.render(response.data, request.accepted_media_type, {})
+            response_cache.store(key, (content, response.status_code))
+            return HttpResponse(content, status=response.status_code, content_type=renderer.media_type)
+
+        return wrapper
+
+    return decorator
+
+
+def tee_to_cache(chunks, key: str, status_code: int):
+    """ Пропускает чанки потокового ответа и копит их для кэша, пока не превышен лимит """
+    collected, size = [], 0
+    for chunk in chunks:
+        if collected is not None:
+            size += len(chunk)
+            if size > settings.RESPONSE_CACHE_MAX_STREAM_BYTES:
+                collected = None
+            else:
+                collected.append(chunk)
+        yield chunk
+    if collected is not None:
+        response_cache.store(key, (b''.join(collected), status_code))
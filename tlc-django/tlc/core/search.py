@@ -0,0 +1,202 @@
+import html
+import re
+
+from django.contrib.postgres.search import SearchHeadline, SearchQuery, SearchRank, SearchVector
+from django.db import connection
+from django.db.models import F, Q, TextField, Value
+from django.db.models.functions import Concat, Replace
+
+from configs import settings
+
+# Веса полей tsvector: A - заголовок, дальше по убыванию
+WEIGHT_SCORES = {'A': 1.0, 'B': 0.4, 'C': 0.2, 'D': 0.1}
+SNIPPET_START, SNIPPET_STOP = '<b>', '</b>'
+# Сниппет - HTML: текст экранируется до подсветки, как html.escape(quote=False); & первым
+HTML_ENTITIES = (('&', '&amp;'), ('<', '&lt;'), ('>', '&gt;'))
+
+
+class SearchIndex:
+    """
+    [SearchIndex]
+    Описание индексируемой модели: поля с весами для search_vector,
+    поле заголовка результата и поля, из которых строится сниппет
+    """
+
+    def __init__(self, kind: str, model, weights: dict, title_field: str, snippet_fields: tuple):
+        self.kind = kind
+        self.model = model
+        self.weights = weights
+        self.title_field = title_field
+        self.snippet_fields = snippet_fields
+
+    def vector(self):
+        vectors = [
+            SearchVector(field, weight=weight, config=settings.SEARCH_CONFIG)
+            for field, weight in self.weights.items()
+        ]
+        vector = vectors[0]
+        for other in vectors[1:]:
+            vector = vector + other
+        return vector
+
+
+class PostgresSearchBackend:
+    """ tsvector-колонка search_vector с GIN-индексом, websearch-запрос, ts_rank и ts_headline """
+
+    def update(self, index: SearchIndex, pk):
+        index.model.objects.filter(pk=pk).update(search_vector=index.vector())
+
+    def rebuild(self, index: SearchIndex):
+        index.model.objects.update(search_vector=index.vector())
+
+    def query(self, text: str):
+        return SearchQuery(text, config=settings.SEARCH_CONFIG, search_type='websearch')
+
+    def search(self, index: SearchIndex, text: str, limit: int) -> list:
+        """ [(rank, pk)] лучших совпадений """
+        query = self.query(text)
+        return [
+            (rank, pk) for pk, rank in index.model.objects
+            .filter(search_vector=query)
+            .annotate(rank=SearchRank(F('search_vector'), query))
+            .order_by('-rank', '-pk')
+            .values_list('pk', 'rank')[:limit]
+        ]
+
+    def snippets(self, index: SearchIndex, text: str, pks: list) -> dict:
+        """ {pk: (заголовок, сниппет)} - ts_headline считается только для строк страницы """
+        parts = []
+        for field in index.snippet_fields:
+            parts += [F(field), Value(' ')]
+        headline = SearchHeadline(
+            escape_html(Concat(*parts[:-1], output_field=TextField()) if len(parts) > 2 else parts[0]), self.query(text),
+            config=settings.SEARCH_CONFIG, start_sel=SNIPPET_START, stop_sel=SNIPPET_STOP,
+            max_words=settings.SEARCH_SNIPPET_WORDS, min_words=settings.SEARCH_SNIPPET_WORDS // 2,
+        )
+        rows = index.model.objects.filter(pk__in=pks).annotate(snippet=headline)
+        return {pk: (title, snippet) for pk, title, snippet in rows.values_list('pk', index.title_field, 'snippet')}
+
+
+class SimpleSearchBackend:
+    """
+    Запасной поиск для SQLite (тесты, локальный запуск): icontains по словам
+    запроса, ранг - сумма весов полей с совпадениями, без стемминга
+    """
+
+    def update(self, index: SearchIndex, pk):
+        pass
+
+    def rebuild(self, index: SearchIndex):
+        pass
+
+    def search(self, index: SearchIndex, text: str, limit: int) -> list:
+        terms = split_terms(text)
+        if not terms:
+            return []
+        condition = Q()
+        for term in terms:
+            term_condition = Q()
+            for field in index.weights:
+                term_condition |= Q(**{f'{field}__icontains': term})
+            condition &= term_condition
+        fields = list(index.weights)
+        rows = index.model.objects.filter(condition).values_list('pk', *fields)[:settings.SEARCH_SIMPLE_MAX_CANDIDATES]
+        ranked = []
+        for pk, *values in rows:
+            rank = sum(
+                WEIGHT_SCORES[index.weights[field]]
+                for field, value in zip(fields, values) for term in terms
+                if value and term.lower() in value.lower()
+            )
+            ranked.append((rank, pk))
+        ranked.sort(key=lambda item: (-item[0], -item[1]))
+        return ranked[:limit]
+
+    def snippets(self, index: SearchIndex, text: str, pks: list) -> dict:
+        terms = split_terms(text)
+        rows = index.model.objects.filter(pk__in=pks).values_list('pk', index.title_field, *index.snippet_fields)
+        return {
+            pk: (title, make_snippet(' '.join(value for value in values if value), terms))
+            for pk, title, *values in rows
+        }
+
+
+def split_terms(text: str) -> list:
+    return [term for term in re.split(r'\W+', text) if term]
+
+
+def escape_html(expression):
+    """ Экранирование текста в запросе: ts_headline добавит теги только вокруг слов, а сущности не подсвечивает """
+    for char, entity in HTML_ENTITIES:
+        expression = Replace(expression, Value(char), Value(entity), output_field=TextField())
+    return expression
+
+
+def make_snippet(text: str, terms: list, width: int = 80) -> str:
+    """ HTML-фрагмент текста вокруг первого совпадения с подсвеченными словами запроса """
+    lowered = text.lower()
+    positions = [lowered.find(term.lower()) for term in terms]
+    positions = [position for position in positions if position >= 0]
+    start = max(min(positions) - width // 2, 0) if positions else 0
+    fragment = text[start:start + width * 2]
+    if not terms:
+        return html.escape(fragment, quote=False)
+    # Совпадения ищутся в исходном тексте, экранируется все между ними и сами совпадения
+    pattern = re.compile('|'.join(re.escape(term) for term in terms), re.IGNORECASE)
+    parts, end = [], 0
+    for match in pattern.finditer(fragment):
+        parts += [
+            html.escape(fragment[end:match.start()], quote=False),
+            SNIPPET_START, html.escape(match.group(0), quote=False), SNIPPET_STOP,
+        ]
+        end = match.end()
+    parts.append(html.escape(fragment[end:], quote=False))
+    return ''.join(parts)
+
+
+class SearchEngine:
+    """
+    [SearchEngine]
+    Поиск по нескольким моделям сразу: по каждой берутся лучшие совпадения,
+    общий список сортируется по рангу, сниппеты строятся только для страницы
+    """
+
+    def __init__(self):
+        self.indexes = {}
+
+    def register(self, index: SearchIndex):
+        self.indexes[index.kind] = index
+
+    @property
+    def backend(self):
+        if connection.vendor == 'postgresql':
+            return PostgresSearchBackend()
+        return SimpleSearchBackend()
+
+    def update(self, model, pk):
+        for index in self.indexes.values():
+            if index.model is model:
+                self.backend.update(index, pk)
+
+    def search(self, text: str, kinds: list, offset: int, limit: int):
+        """ ([{type, id, title, snippet, rank}], есть ли следующая страница) """
+        backend = self.backend
+        candidates = []
+        for kind in kinds:
+            for rank, pk in backend.search(self.indexes[kind], text, offset + limit + 1):
+                candidates.append((rank, kind, pk))
+        candidates.sort(key=lambda item: (-item[0], item[1], -item[2]))
+        page = candidates[offset:offset + limit]
+        snippets = {}
+        for kind in kinds:
+            pks = [pk for _, page_kind, pk in page if page_kind == kind]
+            if pks:
+                snippets[kind] = backend.snippets(self.indexes[kind], text, pks)
+        results = []
+        for rank, kind, pk in page:
+            title, snippet = snippets[kind].get(pk, (None, None))
+            results.append({"type": kind, "id": pk, "title": title, "snippet": snippet, "rank": round(rank, 4)})
+        return results, len(candidates) > offset + limit
+
+
+engine = SearchEngine()
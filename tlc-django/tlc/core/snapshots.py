@@ -0,0 +1,215 @@
+import fcntl
+import hashlib
+import os
+import threading
+from contextlib import contextmanager
+from functools import wraps
+
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from configs import settings
+
+# Абсолютные URL файлов в снапшоте строятся от этой заглушки и при отдаче
+# заменяются на схему и хост текущего запроса
+URL_PLACEHOLDER = 'http://snapshot.invalid'
+
+
+class SnapshotRequest:
+    """ Минимальный request для сериализаторов при сборке снапшота """
+
+    def build_absolute_uri(self, location: str) -> str:
+        return URL_PLACEHOLDER + location
+
+
+class Snapshot:
+    """ Неизменяемый отрендеренный JSON коллекции и его версия (хэш содержимого) """
+
+    def __init__(self, name: str, content: bytes, pointer_mtime: int = None):
+        self.name = name
+        self.content = content
+        self.version = hashlib.sha256(content).hexdigest()[:32]
+        self.has_urls = URL_PLACEHOLDER.encode('utf-8') in content
+        self.pointer_mtime = pointer_mtime
+
+    def render(self, request) -> bytes:
+        if not self.has_urls:
+            return self.content
+        return self.content.replace(URL_PLACEHOLDER.encode('utf-8'), self.base_url(request).encode('utf-8'))
+
+    def etag(self, request) -> str:
+        """ Версия снапшота, а с URL внутри - еще и схема с хостом, которые подставляются в ответ """
+        if not self.has_urls:
+            return f'"{self.version}"'
+        return '"%s"' % hashlib.sha256(f'{self.version} {self.base_url(request)}'.encode('utf-8')).hexdigest()[:32]
+
+    @staticmethod
+    def base_url(request) -> str:
+        return f'{request.scheme}://{request.get_host()}'
+
+
+class SnapshotStore:
+    """
+    [SnapshotStore]
+    Предрендеренные JSON-снапшоты справочных коллекций в памяти и на диске.
+    На диске лежат файлы <name>.<version>.json и указатель <name>.current;
+    воркер сверяет mtime указателя и перечитывает файл, если версию
+    пересобрал другой процесс. ORM и сериализаторы на чтении не участвуют.
+    """
+
+    def __init__(self, directory):
+        self.directory = str(directory)
+        self.definitions = {}
+        self._memory = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, models: tuple, build):
+        """ build() возвращает данные коллекции (список/словарь) для рендера """
+        self.definitions[name] = (models, build)
+
+    def get(self, name: str) -> Snapshot:
+        snapshot = self._memory.get(name)
+        try:
+            pointer_mtime = os.stat(self._pointer_path(name)).st_mtime_ns
+        except FileNotFoundError:
+            return snapshot or self.rebuild(name)
+        if snapshot is not None and snapshot.pointer_mtime == pointer_mtime:
+            return snapshot
+        return self._load(name, pointer_mtime) or self.rebuild(name)
+
+    def rebuild(self, name: str) -> Snapshot:
+        """
+        Рендерит коллекцию из БД, пишет на диск и переключает указатель.
+        Сборка и публикация идут под одной блокировкой (и между процессами):
+        позже собранный снапшот видит более свежие данные и публикуется последним
+        """
+        models, build = self.definitions[name]
+        with self._locked(name):
+            content = JSONRenderer().render(build())
+            snapshot = Snapshot(name, content)
+            previous = self._read_pointer(name)
+            self._write_atomic(self._content_path(name, snapshot.version), content)
+            self._write_atomic(self._pointer_path(name), snapshot.version.encode('ascii'))
+            snapshot.pointer_mtime = os.stat(self._pointer_path(name)).st_mtime_ns
+            self._memory[name] = snapshot
+            self._cleanup(name, keep=(snapshot.version, previous))
+        return snapshot
+
+    def invalidate(self, name: str):
+        """ Убирает указатель: следующий запрос соберет снапшот из БД """
+        with self._locked(name):
+            self._memory.pop(name, None)
+            try:
+                os.remove(self._pointer_path(name))
+            except FileNotFoundError:
+                pass
+
+    def verify(self, name: str) -> list:
+        """ Сверяет файл на диске с его хэшем и со свежим рендером из БД, возвращает ошибки """
+        version = self._read_pointer(name)
+        if version is None:
+            return [f'{name}: no snapshot on disk']
+        try:
+            with open(self._content_path(name, version), 'rb') as f:
+                content = f.read()
+        except FileNotFoundError:
+            return [f'{name}: snapshot file for version {version} is missing']
+        errors = []
+        if Snapshot(name, content).version != version:
+            errors.append(f'{name}: content hash does not match version {version}')
+        _, build = self.definitions[name]
+        if JSONRenderer().render(build()) != content:
+            errors.append(f'{name}: snapshot is stale compared to the database')
+        return errors
+
+    def response(self, name: str, request) -> HttpResponse:
+        """ Отдает снапшот байтами с ETag = версия снапшота """
+        snapshot = self.get(name)
+        etag = snapshot.etag(request)
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = HttpResponse(snapshot.render(request), content_type='application/json')
+        response['ETag'] = etag
+        return response
+
+    def stats(self) -> dict:
+        return {
+            name: {"version": snapshot.version, "bytes": len(snapshot.content)}
+            for name, snapshot in list(self._memory.items())
+        }
+
+    def _load(self, name: str, pointer_mtime: int):
+        version = self._read_pointer(name)
+        if version is None:
+            return None
+        try:
+            with open(self._content_path(name, version), 'rb') as f:
+                snapshot = Snapshot(name, f.read(), pointer_mtime)
+        except FileNotFoundError:
+            return None
+        if snapshot.version != version:
+            return None
+        self._memory[name] = snapshot
+        return snapshot
+
+    @contextmanager
+    def _locked(self, name: str):
+        """ Блокировка снапшота name: между потоками - _lock, между процессами - flock на <name>.lock """
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(os.path.join(self.directory, f'{name}.lock'), 'ab') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_pointer(self, name: str):
+        try:
+            with open(self._pointer_path(name), 'rb') as f:
+                return f.read().decode('ascii').strip() or None
+        except FileNotFoundError:
+            return None
+
+    def _cleanup(self, name: str, keep: tuple):
+        keep_files = {os.path.basename(self._content_path(name, version)) for version in keep if version}
+        for filename in os.listdir(self.directory):
+            if filename.startswith(name + '.') and filename.endswith('.json') and filename not in keep_files:
+                os.remove(os.path.join(self.directory, filename))
+
+    def _pointer_path(self, name: str) -> str:
+        return os.path.join(self.directory, f'{name}.current')
+
+    def _content_path(self, name: str, version: str) -> str:
+        return os.path.join(self.directory, f'{name}.{version}.json')
+
+    @staticmethod
+    def _write_atomic(path: str, content: bytes):
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+
+snapshots = SnapshotStore(settings.SNAPSHOT_DIR)
+
+
+def snapshot_response(name: str):
+    """
+    Декоратор view/action: JSON-ответ отдается из снапшота name.
+    Для других форматов (browsable API) вызывается сама view
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            request = args[0] if isinstance(args[0], Request) else args[1]
+            renderer = getattr(request, 'accepted_renderer', None)
+            if renderer is None or renderer.format != 'json':
+                return func(*args, **kwargs)
+            return snapshots.response(name, request)
+
+        return wrapper
+
+    return decorator
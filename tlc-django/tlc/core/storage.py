@@ -0,0 +1,151 @@
+import hashlib
+import os
+import posixpath
+import re
+import time
+import uuid
+
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F
+from django.utils.deconstruct import deconstructible
+
+# Папка контентно-адресуемых файлов внутри MEDIA_ROOT или внутри upload_to поля
+CONTENT_PREFIX = 'cas/'
+CONTENT_NAME_RE = re.compile(r'^(?:.+/)?cas/[0-9a-f]{2}/[0-9a-f]{64}(?:\.[^/]*)?$')
+
+
+def is_content_name(name) -> bool:
+    return bool(name) and CONTENT_NAME_RE.match(name) is not None
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    [ContentAddressedStorage]
+    Хранилище, в котором имя файла - SHA-256 содержимого: <upload_to>/cas/ab/<sha256>.<ext>.
+    Папка upload_to остается в имени, чтобы по ней работали MEDIA_PROTECTED_PREFIXES.
+    Повторная загрузка того же файла в то же поле не пишет вторую копию, а возвращает
+    существующее имя. Строки, ссылающиеся на файл, учитываются в StoredFile
+    (acquire/release из сигналов), файл удаляется, когда ссылок не осталось.
+    Содержимое по имени никогда не меняется, поэтому его можно кэшировать навсегда
+    """
+
+    buffer_size = 64 * 1024
+    # Столько секунд после повторной загрузки файл не удаляется, даже если ссылок на него нет
+    reupload_grace = 10
+
+    def get_available_name(self, name, max_length=None):
+        # Конечное имя определяется содержимым в _save, суффиксы не нужны
+        return name
+
+    def content_name(self, digest: str, name: str) -> str:
+        """ documents/file.pdf -> documents/cas/ab/<sha256>.pdf """
+        directory = posixpath.dirname(name)
+        prefix = f'{directory}/{CONTENT_PREFIX}' if directory else CONTENT_PREFIX
+        return f'{prefix}{digest[:2]}/{digest}{os.path.splitext(name)[1].lower()}'
+
+    def _save(self, name, content):
+        digest = hashlib.sha256()
+        if hasattr(content, 'temporary_file_path'):
+            # Файл уже на диске (большая загрузка): только считаем хэш и переносим
+            source = content.temporary_file_path()
+            with open(source, 'rb') as file:
+                for data in iter(lambda: file.read(self.buffer_size), b''):
+                    digest.update(data)
+            name = self.content_name(digest.hexdigest(), name)
+            self.publish(name, lambda path: file_move_safe(source, path))
+            return name
+        temp_path = self.path(f'{CONTENT_PREFIX}.tmp/{uuid.uuid4().hex}')
+        os.makedirs(os.path.dirname(temp_path), exist_ok=True)
+        try:
+            with open(temp_path, 'wb') as file:
+                if hasattr(content, 'seek'):
+                    content.seek(0)
+                for data in content.chunks(self.buffer_size):
+                    digest.update(data)
+                    file.write(data)
+            name = self.content_name(digest.hexdigest(), name)
+            # os.replace атомарен: одновременная запись того же содержимого безопасна
+            self.publish(name, lambda path: os.replace(temp_path, path))
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        return name
+
+    def publish(self, name: str, write):
+        """
+        Кладет файл под именем name через write(path), если его нет, а существующий
+        только "освежает" (mtime). Делается под блокировкой строки StoredFile,
+        поэтому remove того же имени либо уже удалил файл (и он пишется заново),
+        либо увидит свежий mtime и файл не тронет
+        """
+        from tlc.models import StoredFile
+        path = self.path(name)
+        with transaction.atomic():
+            list(StoredFile.objects.select_for_update().filter(name=name).values_list('pk', flat=True))
+            try:
+                os.utime(path)
+                return
+            except FileNotFoundError:
+                pass
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            write(path)
+            if self.file_permissions_mode is not None:
+                os.chmod(path, self.file_permissions_mode)
+
+    def delete(self, name):
+        # Общий файл удаляет только release, когда на него не осталось ссылок
+        if not is_content_name(name):
+            super().delete(name)
+
+    def acquire(self, name: str):
+        """ +1 ссылка на файл (строка модели сохранена с этим именем) """
+        from tlc.models import StoredFile
+        if not is_content_name(name):
+            return
+        updated = StoredFile.objects.filter(name=name).update(refcount=F('refcount') + 1)
+        if not updated:
+            size = self.size(name) if self.exists(name) else 0
+            stored, created = StoredFile.objects.get_or_create(name=name, defaults={"size": size, "refcount": 1})
+            if not created:
+                StoredFile.objects.filter(name=name).update(refcount=F('refcount') + 1)
+
+    def release(self, name: str, on_delete=None):
+        """
+        -1 ссылка. После коммита последней ссылки файл удаляет remove;
+        on_delete(name) вызывается после удаления файла (например, для его вариантов)
+        """
+        from tlc.models import StoredFile
+        if not is_content_name(name):
+            return
+        StoredFile.objects.filter(name=name).update(refcount=F('refcount') - 1)
+        if StoredFile.objects.filter(name=name, refcount__lte=0).exists():
+            transaction.on_commit(lambda: self.remove(name, on_delete))
+
+    def remove(self, name: str, on_delete=None):
+        """
+        Удаление файла без ссылок. Строка StoredFile блокируется на время удаления
+        (ее же ждет publish), а файл, который только что загрузили заново и на
+        который ссылка еще не успела появиться, остается вместе со строкой
+        """
+        from tlc.models import StoredFile
+        with transaction.atomic():
+            stored = StoredFile.objects.select_for_update().filter(name=name).first()
+            # Пока ждали коммита, на файл снова сослались
+            if stored is not None and stored.refcount > 0:
+                return
+            try:
+                if time.time() - os.path.getmtime(self.path(name)) < self.reupload_grace:
+                    return
+            except FileNotFoundError:
+                pass
+            super().delete(name)
+            if stored is not None:
+                stored.delete()
+        if on_delete is not None:
+            on_delete(name)
+
+
+content_storage = ContentAddressedStorage()
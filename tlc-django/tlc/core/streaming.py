@@ -0,0 +1,67 @@
+from django.http import StreamingHttpResponse
+from rest_framework import renderers
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+from tlc.core.fast_serializers import FastSerializer, UnsupportedField, fast_data
+from configs import settings
+
+
+def make_encoder():
+    """ Кодировщик строк с теми же настройками, что у JSONRenderer (чтобы байты совпадали) """
+    renderer = renderers.JSONRenderer
+    return renderer.encoder_class(
+        ensure_ascii=renderer.ensure_ascii,
+        allow_nan=not renderer.strict,
+        separators=api_settings.COMPACT_JSON and renderers.SHORT_SEPARATORS or renderers.LONG_SEPARATORS,
+    )
+
+
+def iter_json_list(items, buffer_size: int = None):
+    """
+    JSON-массив по частям: элементы кодируются по одному и копятся
+    в буфер до buffer_size байт, после чего буфер отдается наружу
+    """
+    buffer_size = buffer_size or settings.STREAMING_BUFFER_SIZE
+    encoder = make_encoder()
+    separator = b'['
+    buffer = []
+    buffered = 0
+    for item in items:
+        chunk = encoder.encode(item).replace('\u2028', '\\u2028').replace('\u2029', '\\u2029').encode('utf-8')
+        buffer.append(separator)
+        buffer.append(chunk)
+        buffered += len(chunk) + 1
+        separator = b','
+        if buffered >= buffer_size:
+            yield b''.join(buffer)
+            buffer, buffered = [], 0
+    buffer.append(b']' if separator == b',' else b'[]')
+    yield b''.join(buffer)
+
+
+def iter_rows(serializer_class, queryset, context: dict, chunk_size: int = None):
+    """ Строки списка серверным курсором: быстрым путем, если сериализатор поддерживается """
+    chunk_size = chunk_size or settings.STREAMING_CHUNK_SIZE
+    try:
+        return FastSerializer(serializer_class, context).iter_rows(queryset, chunk_size=chunk_size)
+    except UnsupportedField:
+        return (
+            serializer_class(instance=instance, context=context).data
+            for instance in queryset.iterator(chunk_size=chunk_size)
+        )
+
+
+def streaming_list(serializer_class, queryset, context: dict):
+    """
+    Список потоковым ответом: память воркера не растет с размером таблицы,
+    первые байты уходят клиенту после первой пачки строк.
+    Для других форматов (browsable API) - обычный Response
+    """
+    renderer = getattr(context['request'], 'accepted_renderer', None)
+    if renderer is None or renderer.format != 'json':
+        return Response(fast_data(serializer_class, queryset, context))
+    return StreamingHttpResponse(
+        iter_json_list(iter_rows(serializer_class, queryset, context)),
+        content_type='application/json',
+    )
@@ -0,0 +1,225 @@
+import hashlib
+import os
+import shutil
+import uuid
+from datetime import timedelta
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+from django.utils.text import get_valid_filename
+from rest_framework import exceptions
+
+from tlc.models import About, Document, UploadSession, Video
+from tlc.validators import validate_file_content
+from configs import settings
+
+# Цель загрузки -> (модель, FileField)
+UPLOAD_TARGETS = {
+    'video': (Video, 'file'),
+    'about_video': (About, 'video'),
+    'document': (Document, 'file'),
+}
+
+
+class AssembledFile(File):
+    """
+    Собранный файл на диске. temporary_file_path() позволяет FileSystemStorage
+    перенести его в MEDIA_ROOT переименованием, без второго копирования
+    """
+
+    def __init__(self, path: str, name: str):
+        super().__init__(open(path, 'rb'), name=name)
+        self.path = path
+
+    def temporary_file_path(self) -> str:
+        return self.path
+
+
+class UploadManager:
+    """
+    [UploadManager]
+    Загрузка больших файлов частями фиксированного размера: части приходят
+    в любом порядке и с SHA-256 каждой, повтор части просто перезаписывает ее.
+    Каждая часть - отдельный файл в папке сессии, поэтому параллельные PUT
+    не конфликтуют, а список принятых частей берется из папки.
+    Finalize один раз склеивает части потоково (память ограничена буфером),
+    проверяет валидаторы поля и содержимое и сохраняет файл в FileField цели
+    """
+
+    def __init__(self, directory, chunk_size: int, min_chunk_size: int, max_chunk_size: int,
+                 max_size: int, ttl: int, buffer_size: int):
+        self.directory = str(directory)
+        self.chunk_size = chunk_size
+        self.min_chunk_size = min_chunk_size
+        self.max_chunk_size = max_chunk_size
+        self.max_size = max_size
+        self.ttl = ttl
+        self.buffer_size = buffer_size
+
+    def session_dir(self, session: UploadSession) -> str:
+        return os.path.join(self.directory, str(session.pk))
+
+    def get_object(self, target: str, object_id):
+        model, _ = UPLOAD_TARGETS[target]
+        try:
+            return model.objects.get(pk=object_id)
+        except model.DoesNotExist:
+            raise exceptions.NotFound({"info": 'Not found'})
+
+    def start(self, user, target: str, filename: str, size: int, chunk_size: int = None,
+              sha256: str = '', object_id: int = None) -> UploadSession:
+        if object_id is not None:
+            self.get_object(target, object_id)
+        session = UploadSession.objects.create(
+            user=user if getattr(user, 'pk', None) else None, target=target, object_id=object_id,
+            filename=get_valid_filename(os.path.basename(filename)) or 'upload',
+            size=size, chunk_size=chunk_size or self.chunk_size, sha256=sha256 or '',
+        )
+        os.makedirs(self.session_dir(session), exist_ok=True)
+        return session
+
+    def get(self, session_id) -> UploadSession:
+        try:
+            return UploadSession.objects.get(pk=uuid.UUID(str(session_id)))
+        except (ValueError, UploadSession.DoesNotExist):
+            raise exceptions.NotFound({"info": 'Not found'})
+
+    def received(self, session: UploadSession) -> list:
+        """ Номера принятых частей (имя файла части - ее номер) """
+        try:
+            names = os.listdir(self.session_dir(session))
+        except OSError:
+            return []
+        return sorted(int(name) for name in names if name.isdigit())
+
+    def write_chunk(self, session: UploadSession, index: int, stream, checksum: str):
+        """ Пишет часть во временный файл, сверяет длину и SHA-256 и атомарно публикует ее """
+        if session.status != UploadSession.STATUS_ACTIVE:
+            raise exceptions.ValidationError({"info": f'Upload is {session.status}'})
+        if not 0 <= index < session.chunks:
+            raise exceptions.ValidationError({"info": f'Chunk index must be in 0..{session.chunks - 1}'})
+        checksum = (checksum or '').strip().lower()
+        if len(checksum) != 64:
+            raise exceptions.ValidationError({"info": 'X-Chunk-SHA256 header is required'})
+        expected = session.chunk_length(index)
+        directory = self.session_dir(session)
+        temp_path = os.path.join(directory, f'{index}.{uuid.uuid4().hex}.tmp')
+        digest = hashlib.sha256()
+        written = 0
+        try:
+            with open(temp_path, 'wb') as file:
+                while stream is not None and written <= expected:
+                    data = stream.read(min(self.buffer_size, expected + 1 - written))
+                    if not data:
+                        break
+                    digest.update(data)
+                    file.write(data)
+                    written += len(data)
+            if written != expected:
+                raise exceptions.ValidationError({"info": f'Chunk {index} must be {expected} bytes'})
+            if digest.hexdigest() != checksum:
+                raise exceptions.ValidationError({"info": f'Chunk {index} checksum mismatch'})
+            os.replace(temp_path, os.path.join(directory, str(index)))
+        except FileNotFoundError:
+            # папку сессии удалили (finalize/очистка) во время записи
+            raise exceptions.ValidationError({"info": 'Upload is not active'})
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        UploadSession.objects.filter(pk=session.pk).update(updated_at=timezone.now())
+
+    def finalize(self, session: UploadSession):
+        """ Склеивает части, проверяет файл и сохраняет его в объект цели. Возвращает объект """
+        if session.status != UploadSession.STATUS_ACTIVE:
+            raise exceptions.ValidationError({"info": f'Upload is {session.status}'})
+        missing = sorted(set(range(session.chunks)) - set(self.received(session)))
+        if missing:
+            raise exceptions.ValidationError({"info": 'Upload is incomplete', "missing": missing[:100]})
+        # Сборку выполняет только один запрос
+        claimed = UploadSession.objects.filter(pk=session.pk, status=UploadSession.STATUS_ACTIVE).update(
+            status=UploadSession.STATUS_ASSEMBLING, updated_at=timezone.now(),
+        )
+        if not claimed:
+            raise exceptions.ValidationError({"info": 'Upload is already being finalized'})
+        directory = self.session_dir(session)
+        try:
+            path = self.assemble(session)
+            instance = self.store(session, path)
+        except exceptions.APIException as e:
+            # Файл не прошел проверку: повтор не поможет, части удаляются
+            error = e.detail.get('info', e.detail) if isinstance(e.detail, dict) else e.detail
+            UploadSession.objects.filter(pk=session.pk).update(status=UploadSession.STATUS_FAILED, error=str(error))
+            shutil.rmtree(directory, ignore_errors=True)
+            raise
+        except Exception as e:
+            # Сбой диска/БД: части остаются, сессия снова активна и finalize можно повторить
+            try:
+                os.remove(os.path.join(directory, 'assembled'))
+            except OSError:
+                pass
+            UploadSession.objects.filter(pk=session.pk).update(
+                status=UploadSession.STATUS_ACTIVE, error=str(e), updated_at=timezone.now(),
+            )
+            raise
+        UploadSession.objects.filter(pk=session.pk).update(
+            status=UploadSession.STATUS_COMPLETE, object_id=instance.pk, updated_at=timezone.now(),
+        )
+        shutil.rmtree(directory, ignore_errors=True)
+        return instance
+
+    def assemble(self, session: UploadSession) -> str:
+        """ Потоковая склейка частей по порядку с подсчетом SHA-256 всего файла """
+        directory = self.session_dir(session)
+        path = os.path.join(directory, 'assembled')
+        digest = hashlib.sha256()
+        with open(path, 'wb') as output:
+            for index in range(session.chunks):
+                with open(os.path.join(directory, str(index)), 'rb') as part:
+                    while True:
+                        data = part.read(self.buffer_size)
+                        if not data:
+                            break
+                        digest.update(data)
+                        output.write(data)
+        if session.sha256 and digest.hexdigest() != session.sha256:
+            raise exceptions.ValidationError({"info": 'File checksum mismatch'})
+        return path
+
+    def store(self, session: UploadSession, path: str):
+        model, field_name = UPLOAD_TARGETS[session.target]
+        field = model._meta.get_field(field_name)
+        file = AssembledFile(path, session.filename)
+        try:
+            # Валидаторы поля (расширение) и сверка содержимого - один раз, на собранном файле
+            for validator in (*field.validators, validate_file_content):
+                validator(file)
+            with transaction.atomic():
+                if session.object_id is not None:
+                    instance = self.get_object(session.target, session.object_id)
+                else:
+                    instance = model()
+                getattr(instance, field_name).save(session.filename, file, save=True)
+        except DjangoValidationError as e:
+            raise exceptions.ValidationError({"info": ' '.join(e.messages)})
+        finally:
+            file.close()
+        return instance
+
+    def expire(self) -> int:
+        """ Удаляет незавершенные сессии без активности дольше ttl и их части """
+        deadline = timezone.now() - timedelta(seconds=self.ttl)
+        expired = UploadSession.objects.filter(updated_at__lt=deadline).exclude(status=UploadSession.STATUS_COMPLETE)
+        count = 0
+        for session in expired.iterator():
+            shutil.rmtree(self.session_dir(session), ignore_errors=True)
+            session.delete()
+            count += 1
+        return count
+
+
+uploads = UploadManager(
+    settings.UPLOAD_DIR, settings.UPLOAD_CHUNK_SIZE, settings.UPLOAD_MIN_CHUNK_SIZE, settings.UPLOAD_MAX_CHUNK_SIZE,
+    settings.UPLOAD_MAX_SIZE, settings.UPLOAD_SESSION_TTL, settings.UPLOAD_BUFFER_SIZE,
+)
@@ -0,0 +1,66 @@
+import asyncio
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient
+
+from tlc.core import hashing
+from tlc.models import User
+
+BENCH_USERNAME = 'bench-login@example.com'
+BENCH_PASSWORD = 'benchmark'
+
+
+class Command(BaseCommand):
+    help = 'Пропускная способность входа через /auth/async/signin/ (пул хэширования) при разной конкурентности'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--levels', default='1,4,16,64', help='уровни конкурентности через запятую')
+        parser.add_argument('--logins', type=int, default=200, help='число входов на каждый уровень')
+
+    def handle(self, *args, **options):
+        levels = [int(level) for level in options['levels'].split(',')]
+        # Временный пользователь: асинхронный view читает его из своего потока, поэтому без отката транзакции
+        User.objects.filter(username=BENCH_USERNAME).delete()
+        User.objects.create(username=BENCH_USERNAME, password=hashing.pool.make_password(BENCH_PASSWORD))
+        self.stdout.write(
+            f"workers={hashing.pool.max_workers} max_queue={hashing.pool.max_queue} logins={options['logins']}"
+        )
+        self.stdout.write(
+            f"{'concurrency':>12} {'ok':>6} {'503':>6} {'other':>6} {'logins/s':>10} {'p50 ms':>8} {'p99 ms':>8}"
+        )
+        try:
+            for level in levels:
+                counters, elapsed, latencies = asyncio.run(self._run(level, options['logins']))
+                latencies.sort()
+                p50 = latencies[len(latencies) // 2] * 1000 if latencies else 0
+                p99 = latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0
+                self.stdout.write(
+                    f"{level:>12} {counters[200]:>6} {counters[503]:>6} {counters['other']:>6} "
+                    f"{counters[200] / elapsed:>10.1f} {p50:>8.1f} {p99:>8.1f}"
+                )
+        finally:
+            User.objects.filter(username=BENCH_USERNAME).delete()
+
+    async def _run(self, concurrency: int, logins: int):
+        client = AsyncClient()
+        counters = {200: 0, 503: 0, "other": 0}
+        latencies = []
+        remaining = iter(range(logins))
+        body = json.dumps({"username": BENCH_USERNAME, "password": BENCH_PASSWORD})
+
+        async def worker():
+            for _ in remaining:
+                started = time.perf_counter()
+                response = await client.post('/api/v1/auth/async/signin/', body, content_type='application/json')
+                if response.status_code not in counters:
+                    counters["other"] += 1
+                    continue
+                counters[response.status_code] += 1
+                if response.status_code == 200:
+                    latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return counters, time.perf_counter() - started, latencies
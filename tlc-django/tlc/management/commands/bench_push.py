@@ -0,0 +1,31 @@
+from django.db import transaction
+from fcm_django.models import FCMDevice
+from django.core.management.base import BaseCommand
+
+from tlc.core.push import PushFanout, StubTransport
+from configs import settings
+
+
+class Command(BaseCommand):
+    help = 'Пропускная способность рассылки пушей на заглушке транспорта (данные откатываются)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--devices', type=int, default=100000)
+        parser.add_argument('--invalid-every', type=int, default=50, help='каждый N-й токен невалиден')
+
+    def handle(self, *args, **options):
+        devices, invalid_every = options['devices'], options['invalid_every']
+        tokens = [f'bench-token-{i}' for i in range(devices)]
+        transport = StubTransport(tokens[::invalid_every] if invalid_every else ())
+        fanout = PushFanout(transport, settings.PUSH_CHUNK_SIZE, settings.PUSH_DB_BATCH_SIZE)
+        with transaction.atomic():
+            FCMDevice.objects.bulk_create(
+                (FCMDevice(registration_id=token, type='android') for token in tokens), batch_size=5000,
+            )
+            totals = fanout.send_to_all({"title": "bench", "body": "bench"}, {"type": "bench"})
+            transaction.set_rollback(True)
+        self.stdout.write(
+            f"devices={devices} sent={totals['sent']} failed={totals['failed']} pruned={totals['pruned']} "
+            f"multicasts={len(transport.batches)} seconds={totals['seconds']:.2f} "
+            f"devices/s={devices / totals['seconds']:.0f}"
+        )
@@ -0,0 +1,65 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from tlc.core.search import engine
+from tlc.models import Article, FAQ, Product, ProductCategory
+
+WORDS = (
+    'крем', 'маска', 'сыворотка', 'кожа', 'лицо', 'волосы', 'уход', 'увлажнение', 'питание', 'очищение',
+    'витамин', 'масло', 'тоник', 'пилинг', 'защита', 'солнце', 'морщины', 'сияние', 'эффект', 'результат',
+    'ночной', 'дневной', 'легкий', 'нежный', 'натуральный', 'экстракт', 'коллаген', 'гиалуроновая', 'кислота', 'бальзам',
+)
+
+
+class Command(BaseCommand):
+    help = 'Латентность /search/ (p50/p95/p99) на сгенерированном каталоге (данные откатываются)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000000, help='всего строк на товары, новости и FAQ')
+        parser.add_argument('--queries', type=int, default=500)
+        parser.add_argument('--page-size', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        rows, page_size = options['rows'], options['page_size']
+        rnd = random.Random(options['seed'])
+        text = lambda count: ' '.join(rnd.choice(WORDS) for _ in range(count))
+        with transaction.atomic():
+            category = ProductCategory.objects.create(title='bench')
+            started = time.perf_counter()
+            per_model = rows // 3
+            Product.objects.bulk_create(
+                (Product(title=text(3), summary=text(10), text=text(60), category=category) for _ in range(per_model)),
+                batch_size=5000,
+            )
+            Article.objects.bulk_create(
+                (Article(title=text(4), summary=text(12), text=text(80)) for _ in range(per_model)), batch_size=5000,
+            )
+            FAQ.objects.bulk_create(
+                (FAQ(question=text(8), answer=text(30)) for _ in range(rows - 2 * per_model)), batch_size=5000,
+            )
+            backend = engine.backend
+            for index in engine.indexes.values():
+                backend.rebuild(index)
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute('ANALYZE tlc_product, tlc_article, tlc_faq')
+            self.stdout.write(f'backend={backend.__class__.__name__} rows={rows} load={time.perf_counter() - started:.1f}s')
+
+            kinds = list(engine.indexes)
+            timings = []
+            for _ in range(options['queries']):
+                query = text(rnd.choice((1, 1, 2, 3)))
+                started = time.perf_counter()
+                engine.search(query, kinds, 0, page_size)
+                timings.append((time.perf_counter() - started) * 1000)
+            transaction.set_rollback(True)
+        timings.sort()
+        percentile = lambda p: timings[min(int(len(timings) * p), len(timings) - 1)]
+        self.stdout.write(
+            f'queries={len(timings)} p50={percentile(0.5):.1f}ms p95={percentile(0.95):.1f}ms '
+            f'p99={percentile(0.99):.1f}ms max={timings[-1]:.1f}ms'
+        )
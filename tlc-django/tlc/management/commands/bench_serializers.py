@@ -0,0 +1,69 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from tlc.core.fast_serializers import FastSerializer
+from tlc.models import Article, Product, ProductCategory, ProductResults
+from tlc.serializers import ArticleListSerializer, ArticleSerializer, ProductResultSerializer, ProductSerializer
+
+
+class Command(BaseCommand):
+    help = 'Сравнение DRF-сериализаторов и быстрого пути на values_list() для длинных списков (данные откатываются)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        rows, repeat = options['rows'], options['repeat']
+        request = Request(APIRequestFactory().get('/api/v1/bench/', HTTP_HOST='bench.local'))
+        renderer = JSONRenderer()
+        with transaction.atomic():
+            category = ProductCategory.objects.create(title='bench')
+            product = Product.objects.create(title='bench', category=category)
+            Article.objects.bulk_create(
+                (Article(title=f'Новость {i}', summary='Аннотация', text='Текст ' * 50, photo=f'news_photos/{i}.jpg')
+                 for i in range(rows)), batch_size=2000,
+            )
+            Product.objects.bulk_create(
+                (Product(title=f'Товар {i}', summary='Кратко', text='Описание ' * 20, category=category,
+                         photo=f'products/{i}.jpg', top=i) for i in range(rows)), batch_size=2000,
+            )
+            ProductResults.objects.bulk_create(
+                (ProductResults(product=product, name=f'Отзыв {i}', photo_before=f'products_res_before/{i}.jpg',
+                                links={"instagram": f'https://example.com/{i}'}) for i in range(rows)), batch_size=2000,
+            )
+            cases = (
+                (ArticleSerializer, Article.objects.all()),
+                (ArticleListSerializer, Article.objects.all()),
+                (ProductSerializer, Product.objects.select_related('category')),
+                (ProductResultSerializer, ProductResults.objects.filter(product=product)),
+            )
+            for serializer_class, queryset in cases:
+                drf_content, drf_seconds = self.measure(repeat, lambda: renderer.render(
+                    serializer_class(instance=queryset.all(), many=True, context={"request": request}).data))
+                fast_content, fast_seconds = self.measure(repeat, lambda: renderer.render(
+                    FastSerializer(serializer_class, {"request": request}).serialize(queryset.all())))
+                if fast_content != drf_content:
+                    raise CommandError(f'{serializer_class.__name__}: fast path output differs from DRF')
+                self.stdout.write(
+                    f'{serializer_class.__name__}: rows={queryset.count()} drf={drf_seconds * 1000:.0f}ms '
+                    f'fast={fast_seconds * 1000:.0f}ms speedup={drf_seconds / fast_seconds:.1f}x '
+                    f'bytes={len(fast_content)}'
+                )
+            transaction.set_rollback(True)
+
+    @staticmethod
+    def measure(repeat: int, func):
+        """ Лучшее время из repeat прогонов и результат последнего """
+        best, result = None, None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            result = func()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return result, best
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from tlc.core.images import IMAGE_FIELDS, pipeline
+
+
+class Command(BaseCommand):
+    help = 'Генерация уменьшенных копий и плейсхолдеров для уже загруженных фото'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='пересобрать и те, у которых варианты актуальны')
+
+    def handle(self, *args, **options):
+        done = failed = 0
+        for model, fields in IMAGE_FIELDS.items():
+            for field in fields:
+                queryset = model.objects.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True})
+                for instance in queryset.only('pk', field, f'{field}_variants').iterator():
+                    if not options['all'] and not pipeline.needs_update(instance, field):
+                        continue
+                    try:
+                        pipeline.generate(instance, field)
+                        done += 1
+                    except (OSError, ValueError) as e:
+                        failed += 1
+                        self.stderr.write(f'{model.__name__}.{field} #{instance.pk}: {e}')
+        self.stdout.write(f'Generated variants for {done} images, failed {failed}')
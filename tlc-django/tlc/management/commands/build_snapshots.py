@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from tlc.core.snapshots import snapshots
+
+
+class Command(BaseCommand):
+    help = 'Пересборка и проверка JSON-снапшотов справочных коллекций (при деплое)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify-only', action='store_true', help='только проверить снапшоты на диске')
+
+    def handle(self, *args, **options):
+        errors = []
+        for name in snapshots.definitions:
+            if not options['verify_only']:
+                snapshot = snapshots.rebuild(name)
+                self.stdout.write(f'{name}: version {snapshot.version}, {len(snapshot.content)} bytes')
+            errors += snapshots.verify(name)
+        if errors:
+            raise CommandError('\n'.join(errors))
+        self.stdout.write(f'Verified {len(snapshots.definitions)} snapshots in {snapshots.directory}')
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from tlc.core.uploads import uploads
+
+
+class Command(BaseCommand):
+    help = 'Удаление брошенных сессий загрузки частями и их временных файлов'
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'Removed {uploads.expire()} expired upload sessions')
@@ -0,0 +1,87 @@
+import os
+import posixpath
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from tlc.core.images import remove_variants
+from tlc.core.storage import CONTENT_PREFIX, content_storage, is_content_name
+from tlc.models import StoredFile
+from tlc.signals import CONTENT_FIELDS
+
+
+class Command(BaseCommand):
+    help = 'Перенос файлов в контентно-адресуемое хранилище, пересчет ссылок и удаление файлов без ссылок'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='только показать, что будет сделано')
+        parser.add_argument('--grace', type=int, default=3600, help='не трогать файлы cas/ моложе N секунд')
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        legacy = self.import_legacy(dry_run)
+        counts = Counter(
+            name for model, fields in CONTENT_FIELDS.items() for field in fields
+            for name in model.objects.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True})
+            .values_list(field, flat=True) if is_content_name(name)
+        )
+        referenced = {name for model, fields in CONTENT_FIELDS.items() for field in fields
+                      for name in model.objects.values_list(field, flat=True)}
+        storage = content_storage
+        removed = 0
+        if not dry_run:
+            with transaction.atomic():
+                StoredFile.objects.exclude(name__in=list(counts)).delete()
+                for name, count in counts.items():
+                    StoredFile.objects.update_or_create(
+                        name=name, defaults={"refcount": count, "size": storage.size(name) if storage.exists(name) else 0},
+                    )
+            for name in legacy:
+                if name not in referenced and storage.exists(name):
+                    storage.delete(name)
+        deadline = time.time() - options['grace']
+        # cas/ лежит в корне и внутри папки upload_to каждого поля
+        for directory, subdirectories, files in os.walk(storage.location):
+            subdirectories[:] = [name for name in subdirectories if not name.startswith('.') and name != 'variants']
+            for file in files:
+                path = os.path.join(directory, file)
+                name = os.path.relpath(path, storage.location).replace(os.sep, '/')
+                if not is_content_name(name) or name in counts or os.path.getmtime(path) > deadline:
+                    continue
+                removed += 1
+                if not dry_run:
+                    os.remove(path)
+                    remove_variants(name)
+        self.stdout.write(
+            f'Imported {len(legacy)} files, {len(counts)} stored files referenced, removed {removed} orphans'
+            + (' (dry run)' if dry_run else '')
+        )
+        if legacy and not dry_run:
+            self.stdout.write('Run build_image_variants to rebuild variants of imported photos')
+
+    def import_legacy(self, dry_run: bool) -> set:
+        """
+        Старые файлы (до хранилища по хэшу, или в cas/ без папки upload_to) сохраняются
+        в <upload_to>/cas/, строки обновляются без сигналов
+        """
+        legacy = set()
+        for model, fields in CONTENT_FIELDS.items():
+            for field in fields:
+                model_field = model._meta.get_field(field)
+                storage = model_field.storage
+                prefix = posixpath.dirname(model_field.generate_filename(None, 'file')) + '/' + CONTENT_PREFIX
+                rows = model.objects.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True}) \
+                    .exclude(**{f'{field}__startswith': prefix}).values_list('pk', field)
+                for pk, name in rows.iterator():
+                    if not storage.exists(name):
+                        self.stderr.write(f'{model.__name__}.{field} #{pk}: {name} is missing')
+                        continue
+                    legacy.add(name)
+                    if dry_run:
+                        continue
+                    with storage.open(name) as file:
+                        content_name = storage.save(model_field.generate_filename(None, posixpath.basename(name)), file)
+                    model.objects.filter(pk=pk, **{field: name}).update(**{field: content_name})
+        return legacy
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from tlc.core.outbox import outbox
+
+
+class Command(BaseCommand):
+    help = 'Фоновая отправка писем из очереди OutgoingEmail'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='отправить текущую очередь и выйти')
+
+    def handle(self, *args, **options):
+        if not options['once']:
+            self.stdout.write('Email outbox sender started')
+            outbox.run_forever()
+        total = 0
+        while True:
+            sent = outbox.process_batch()
+            total += sent
+            if sent < outbox.batch_size:
+                break
+        outbox.pool.close_all()
+        self.stdout.write(f'Processed {total} emails, stats: {outbox.stats()}')
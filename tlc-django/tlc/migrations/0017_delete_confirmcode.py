@@ -0,0 +1,16 @@
+# Generated by Django 3.2.6 on 2026-10-18 08:29
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tlc', '0016_outgoingemail'),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name='ConfirmCode',
+        ),
+    ]
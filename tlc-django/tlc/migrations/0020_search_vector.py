@@ -0,0 +1,55 @@
+# Generated by Django 3.2.6 on 2026-10-18 08:42
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+# Таблица -> поля с весами; GIN-индексы и заполнение только на PostgreSQL
+SEARCH_TABLES = {
+    'tlc_product': (('title', 'A'), ('summary', 'B'), ('text', 'C')),
+    'tlc_article': (('title', 'A'), ('summary', 'B'), ('text', 'C')),
+    'tlc_faq': (('question', 'A'), ('answer', 'B')),
+}
+
+
+def create_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table, weights in SEARCH_TABLES.items():
+        vector = ' || '.join(
+            f"setweight(to_tsvector('russian', coalesce({column}, '')), '{weight}')" for column, weight in weights
+        )
+        schema_editor.execute(f'UPDATE {table} SET search_vector = {vector}')
+        schema_editor.execute(f'CREATE INDEX {table}_search_gin ON {table} USING gin (search_vector)')
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table in SEARCH_TABLES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {table}_search_gin')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tlc', '0019_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='article',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='faq',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 3.2.6 on 2026-10-18 08:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tlc', '0020_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('top__isnull', False)), fields=['top', 'id'], name='product_top_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('top__isnull', False)), fields=['category', 'top', 'id'], name='product_category_top_idx'),
+        ),
+    ]
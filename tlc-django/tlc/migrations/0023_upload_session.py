@@ -0,0 +1,41 @@
+# Generated by Django 3.2.6 on 2026-10-18 08:52
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tlc', '0022_image_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadSession',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('target', models.CharField(max_length=20, verbose_name='Куда загружается')),
+                ('object_id', models.IntegerField(blank=True, null=True, verbose_name='ID объекта')),
+                ('filename', models.CharField(max_length=255, verbose_name='Имя файла')),
+                ('size', models.BigIntegerField(verbose_name='Размер')),
+                ('chunk_size', models.IntegerField(verbose_name='Размер части')),
+                ('sha256', models.CharField(blank=True, default='', max_length=64, verbose_name='SHA-256 файла')),
+                ('status', models.CharField(choices=[('active', 'Загружается'), ('assembling', 'Собирается'), ('complete', 'Собран'), ('failed', 'Ошибка')], default='active', max_length=10, verbose_name='Статус')),
+                ('error', models.TextField(blank=True, null=True, verbose_name='Ошибка')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Загрузка файла',
+                'verbose_name_plural': 'Загрузки файлов',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='uploadsession',
+            index=models.Index(fields=['status', 'updated_at'], name='tlc_uploads_status_722c4a_idx'),
+        ),
+    ]
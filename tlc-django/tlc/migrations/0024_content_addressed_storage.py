@@ -0,0 +1,54 @@
+# Generated by Django 3.2.6 on 2026-10-18 08:54
+
+from django.db import migrations, models
+import tlc.core.storage
+import tlc.validators
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tlc', '0023_upload_session'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True, verbose_name='Файл')),
+                ('size', models.BigIntegerField(default=0, verbose_name='Размер')),
+                ('refcount', models.IntegerField(default=0, verbose_name='Ссылок')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Файл хранилища',
+                'verbose_name_plural': 'Файлы хранилища',
+            },
+        ),
+        migrations.AlterField(
+            model_name='attachmentphoto',
+            name='photo',
+            field=models.ImageField(storage=tlc.core.storage.ContentAddressedStorage(), upload_to='images', verbose_name='Файл'),
+        ),
+        migrations.AlterField(
+            model_name='document',
+            name='file',
+            field=models.FileField(storage=tlc.core.storage.ContentAddressedStorage(), upload_to='documents', validators=[tlc.validators.validate_file_extension]),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='photo',
+            field=models.ImageField(blank=True, null=True, storage=tlc.core.storage.ContentAddressedStorage(), upload_to='products'),
+        ),
+        migrations.AlterField(
+            model_name='productresults',
+            name='photo_after',
+            field=models.ImageField(blank=True, null=True, storage=tlc.core.storage.ContentAddressedStorage(), upload_to='products_res_after', verbose_name='Фото после'),
+        ),
+        migrations.AlterField(
+            model_name='productresults',
+            name='photo_before',
+            field=models.ImageField(blank=True, null=True, storage=tlc.core.storage.ContentAddressedStorage(), upload_to='products_res_before', verbose_name='Фото до'),
+        ),
+    ]
@@ -1,13 +1,16 @@
+import uuid
 from datetime import datetime, timedelta
 from email.policy import default
-import random
 from typing import List
 from django.db.models.deletion import CASCADE
 import jwt as jwt
 from django.contrib.auth.models import AbstractUser
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
+from django.utils import timezone
 from configs import settings
 
+from .core.storage import content_storage
 from .validators import *
 
 
@@ -20,6 +23,7 @@ class User(AbstractUser):
     name = models.CharField(max_length=30, blank=True, null=True, verbose_name="имя пользователя")
     username = models.CharField(max_length=50, unique=True, verbose_name='номер телефона/email')
     photo = models.ImageField(upload_to='user_images', blank=True, null=True)
+    photo_variants = models.JSONField(null=True, blank=True, editable=False)
 
     USERNAME_FIELD = 'username'
 
@@ -49,19 +53,6 @@ class User(AbstractUser):
         verbose_name_plural = 'Пользователи'
 
 
-class ConfirmCode(models.Model):
-    """
-    [ConfirmCode]
-    Модель кода подтверждения для регистрации
-    """
-    user = models.ForeignKey(User, on_delete=CASCADE)
-    code = models.IntegerField(default=0)
-
-    def save(self, *args, **kwargs):
-        self.code = random.randint(1000, 9999)
-        super(ConfirmCode, self).save(*args, **{})
-
-
 class Article(models.Model):
     """
     [Article]
@@ -71,7 +62,12 @@ class Article(models.Model):
     title = models.CharField(max_length=50, default="Без заголовка", verbose_name="Заголовок")
     summary = models.TextField(max_length=150, blank=True, null=True, verbose_name='Аннотация')
     photo = models.ImageField(upload_to='news_photos', blank=True, null=True)
+    photo_variants = models.JSONField(null=True, blank=True, editable=False)
     text = models.TextField(blank=True, null=True, verbose_name="Текст")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Создано")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Изменено")
+    # Поисковый вектор, обновляется сигналом после сохранения (tlc.core.search)
+    search_vector = SearchVectorField(null=True, editable=False)
 
     def __str__(self) -> str:
         return f"{self.title}"
@@ -79,6 +75,7 @@ class Article(models.Model):
     class Meta:
         verbose_name = 'Новостная запись'
         verbose_name_plural = 'Новостные записи'
+        indexes = [models.Index(fields=['-created_at', '-id'], name='article_created_id_idx')]
 
 
 class Document(models.Model):
@@ -88,8 +85,9 @@ class Document(models.Model):
     """
 
     title = models.CharField(max_length=50, default="Без названия", verbose_name="Название")
-    file = models.FileField(upload_to='documents', validators=(validate_file_extension,))
+    file = models.FileField(upload_to='documents', storage=content_storage, validators=(validate_file_extension,))
     is_educate = models.BooleanField(default=False, verbose_name="Документ для раздела Обучение?")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Изменено")
 
     def __str__(self) -> str:
         return f"{self.title}"
@@ -107,6 +105,7 @@ class Chat(models.Model):
 
     title = models.CharField(max_length=50, default="Без названия", verbose_name="Название")
     link = models.CharField(max_length=50, null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Изменено")
 
     def __str__(self) -> str:
         return f"{self.title} ({self.link})"
@@ -123,6 +122,7 @@ class Social(models.Model):
     """
 
     link = models.CharField(max_length=50, null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Изменено")
 
     def __str__(self) -> str:
         return f"{self.link}"
@@ -137,7 +137,8 @@ class AttachmentPhoto(models.Model):
     [AttachmentPhoto]
     Модель прикрепляемого фото
     """
-    photo = models.ImageField(upload_to='images', blank=False, verbose_name="Файл")
+    photo = models.ImageField(upload_to='images', storage=content_storage, blank=False, verbose_name="Файл")
+    photo_variants = models.JSONField(null=True, blank=True, editable=False)
 
     def __str__(self) -> str:
         return str(self.id)
@@ -172,6 +173,7 @@ class ProductCategory(models.Model):
     """
 
     title = models.CharField(max_length=70, blank=True, null=True, verbose_name="название категории")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Изменено")
 
     def __str__(self) -> str:
         return f"{self.title}"
@@ -188,11 +190,15 @@ class Product(models.Model):
     """
 
     title = models.CharField(max_length=70, blank=True, null=True, verbose_name="название товара")
-    photo = models.ImageField(upload_to='products', null=True, blank=True)
+    photo = models.ImageField(upload_to='products', storage=content_storage, null=True, blank=True)
+    photo_variants = models.JSONField(null=True, blank=True, editable=False)
     summary = models.TextField(blank=True, null=True, verbose_name="краткое описание")
     text = models.TextField(blank=True, null=True, verbose_name="описание")
     category = models.ForeignKey(ProductCategory, on_delete=CASCADE)
     top = models.IntegerField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Изменено")
+    # Поисковый вектор, обновляется сигналом после сохранения (tlc.core.search)
+    search_vector = SearchVectorField(null=True, editable=False)
 
     def __str__(self) -> str:
         return f"{self.title}"
@@ -200,6 +206,13 @@ class Product(models.Model):
     class Meta:
         verbose_name = 'Продукт'
         verbose_name_plural = 'Продукты'
+        indexes = [
+            models.Index(fields=['category', 'id'], name='product_category_id_idx'),
+            # Частичные индексы топа: в них только товары с top
+            models.Index(fields=['top', 'id'], name='product_top_idx', condition=models.Q(top__isnull=False)),
+            models.Index(fields=['category', 'top', 'id'], name='product_category_top_idx',
+                         condition=models.Q(top__isnull=False)),
+        ]
 
 
 class ProductResults(models.Model):
@@ -210,10 +223,14 @@ class ProductResults(models.Model):
 
     product = models.ForeignKey(Product, on_delete=CASCADE)
     name = models.CharField(max_length=50, blank=True, null=True, verbose_name="Имя")
-    photo_before = models.ImageField(upload_to='products_res_before', null=True, blank=True, verbose_name="Фото до")
-    photo_after = models.ImageField(upload_to='products_res_after', null=True, blank=True, verbose_name="Фото после")
+    photo_before = models.ImageField(upload_to='products_res_before', storage=content_storage, null=True, blank=True, verbose_name="Фото до")
+    photo_after = models.ImageField(upload_to='products_res_after', storage=content_storage, null=True, blank=True, verbose_name="Фото после")
+    # Уменьшенные копии и плейсхолдеры фото (tlc.core.images), заполняются фоном
+    photo_before_variants = models.JSONField(null=True, blank=True, editable=False)
+    photo_after_variants = models.JSONField(null=True, blank=True, editable=False)
     text = models.TextField(blank=True, null=True, verbose_name="описание отзыва")
     links = models.JSONField(default=dict, blank=True)
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Изменено")
 
     def __str__(self) -> str:
         return f"{self.product.title} ({self.name})"
@@ -221,6 +238,7 @@ class ProductResults(models.Model):
     class Meta:
         verbose_name = 'Результат по продукту'
         verbose_name_plural = 'Результаты по продукту'
+        indexes = [models.Index(fields=['product', 'id'], name='productresults_product_id_idx')]
 
 
 class Video(models.Model):
@@ -232,6 +250,7 @@ class Video(models.Model):
     title = models.CharField(max_length=50, default="Без названия", verbose_name="Название")
     file = models.FileField(upload_to='video', validators=(validate_video_extension,))
     is_educate = models.BooleanField(default=False, verbose_name="Видео для раздела Обучение?")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Изменено")
 
     def __str__(self) -> str:
         return f"{self.title}"
@@ -249,6 +268,9 @@ class FAQ(models.Model):
 
     question = models.TextField(verbose_name="Вопрос")
     answer = models.TextField(verbose_name="Ответ")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Изменено")
+    # Поисковый вектор, обновляется сигналом после сохранения (tlc.core.search)
+    search_vector = SearchVectorField(null=True, editable=False)
 
     def __str__(self) -> str:
         return f"{self.question}"
@@ -256,3 +278,106 @@ class FAQ(models.Model):
     class Meta:
         verbose_name = 'FAQ'
         verbose_name_plural = 'FAQ'
+
+
+class OutgoingEmail(models.Model):
+    """
+    [OutgoingEmail]
+    Модель письма в очереди на отправку (outbox)
+    """
+
+    STATUS_PENDING = 'pending'
+    STATUS_SENT = 'sent'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = (
+        (STATUS_PENDING, 'В очереди'),
+        (STATUS_SENT, 'Отправлено'),
+        (STATUS_FAILED, 'Ошибка'),
+    )
+
+    to = models.CharField(max_length=254, verbose_name="Получатель")
+    subject = models.CharField(max_length=255, verbose_name="Тема")
+    body = models.TextField(verbose_name="Текст")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING, verbose_name="Статус")
+    attempts = models.IntegerField(default=0, verbose_name="Попыток отправки")
+    next_attempt_at = models.DateTimeField(default=timezone.now, verbose_name="Следующая попытка")
+    last_error = models.TextField(blank=True, null=True, verbose_name="Последняя ошибка")
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self) -> str:
+        return f"{self.subject} -> {self.to} ({self.status})"
+
+    class Meta:
+        verbose_name = 'Исходящее письмо'
+        verbose_name_plural = 'Исходящие письма'
+        indexes = [models.Index(fields=['status', 'next_attempt_at'])]
+
+
+class UploadSession(models.Model):
+    """
+    [UploadSession]
+    Сессия загрузки большого файла частями (см. tlc.core.uploads).
+    Части лежат во временной папке сессии до сборки в FileField цели
+    """
+
+    STATUS_ACTIVE = 'active'
+    STATUS_ASSEMBLING = 'assembling'
+    STATUS_COMPLETE = 'complete'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = (
+        (STATUS_ACTIVE, 'Загружается'),
+        (STATUS_ASSEMBLING, 'Собирается'),
+        (STATUS_COMPLETE, 'Собран'),
+        (STATUS_FAILED, 'Ошибка'),
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Пользователь")
+    target = models.CharField(max_length=20, verbose_name="Куда загружается")
+    object_id = models.IntegerField(null=True, blank=True, verbose_name="ID объекта")
+    filename = models.CharField(max_length=255, verbose_name="Имя файла")
+    size = models.BigIntegerField(verbose_name="Размер")
+    chunk_size = models.IntegerField(verbose_name="Размер части")
+    sha256 = models.CharField(max_length=64, blank=True, default='', verbose_name="SHA-256 файла")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_ACTIVE, verbose_name="Статус")
+    error = models.TextField(blank=True, null=True, verbose_name="Ошибка")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self) -> str:
+        return f"{self.filename} ({self.status})"
+
+    @property
+    def chunks(self) -> int:
+        return max((self.size + self.chunk_size - 1) // self.chunk_size, 1)
+
+    def chunk_length(self, index: int) -> int:
+        """ Все части ровно chunk_size, кроме последней """
+        if index == self.chunks - 1:
+            return self.size - index * self.chunk_size
+        return self.chunk_size
+
+    class Meta:
+        verbose_name = 'Загрузка файла'
+        verbose_name_plural = 'Загрузки файлов'
+        indexes = [models.Index(fields=['status', 'updated_at'])]
+
+
+class StoredFile(models.Model):
+    """
+    [StoredFile]
+    Файл контентно-адресуемого хранилища (см. tlc.core.storage) и число строк, которые на него ссылаются
+    """
+
+    name = models.CharField(max_length=100, unique=True, verbose_name="Файл")
+    size = models.BigIntegerField(default=0, verbose_name="Размер")
+    refcount = models.IntegerField(default=0, verbose_name="Ссылок")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self) -> str:
+        return f"{self.name} ({self.refcount})"
+
+    class Meta:
+        verbose_name = 'Файл хранилища'
+        verbose_name_plural = 'Файлы хранилища'
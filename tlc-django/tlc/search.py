@@ -0,0 +1,12 @@
+from tlc.core.search import SearchIndex, engine
+from tlc.models import Article, FAQ, Product
+
+# Порядок определяет значение ?type= по умолчанию
+SEARCH_INDEXES = (
+    SearchIndex('product', Product, {'title': 'A', 'summary': 'B', 'text': 'C'}, 'title', ('summary', 'text')),
+    SearchIndex('article', Article, {'title': 'A', 'summary': 'B', 'text': 'C'}, 'title', ('summary', 'text')),
+    SearchIndex('faq', FAQ, {'question': 'A', 'answer': 'B'}, 'question', ('answer',)),
+)
+
+for index in SEARCH_INDEXES:
+    engine.register(index)
@@ -1,11 +1,106 @@
+import os
+
+from django.core.files.storage import default_storage
 from django.core.validators import ProhibitNullCharactersValidator
+from django.db import IntegrityError, transaction
 from django.db.models import fields
 from django.utils.functional import empty
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
+from rest_framework.utils.urls import replace_query_param
 from django.contrib.auth.password_validation import validate_password
+from django.utils.encoding import filepath_to_uri
 
 from .models import *
+from .core import hashing
+from .core.ingest import ingestor
+from .core.uploads import UPLOAD_TARGETS, uploads
+
+
+def get_requested_fields(request):
+    """ Список полей из ?fields=a,b,c или None, если параметр не передан """
+    query_params = getattr(request, 'query_params', None)
+    fields = query_params.get('fields') if query_params is not None else None
+    if not fields:
+        return None
+    return [field.strip() for field in fields.split(',') if field.strip()]
+
+
+class SparseFieldsMixin:
+    """
+    Разреженный набор полей: ?fields=... оставляет в ответе только перечисленные
+    поля, а optimize_queryset переносит этот набор в список колонок SQL.
+    Неизвестное имя поля - 400, а не молча урезанный ответ
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        requested = get_requested_fields(self.context.get('request'))
+        if requested is not None:
+            unknown = [name for name in dict.fromkeys(requested) if name not in self.fields]
+            if unknown:
+                raise ValidationError({"info": f"Unknown fields: {', '.join(unknown)}"})
+            for name in set(self.fields) - set(requested):
+                self.fields.pop(name)
+
+    @classmethod
+    def optimize_queryset(cls, queryset, request, extra: tuple = ()):
+        """ only()/select_related() по полям сериализатора; extra - колонки для сортировки """
+        model_fields = {field.name for field in queryset.model._meta.concrete_fields}
+        columns, related = list(extra), []
+        for field in cls(context={"request": request}).fields.values():
+            if field.source not in model_fields:
+                continue
+            columns.append(field.source)
+            if isinstance(field, serializers.BaseSerializer):
+                related.append(field.source)
+                columns += [f'{field.source}__{child.source}' for child in field.fields.values()]
+        if related:
+            queryset = queryset.select_related(*related)
+        return queryset.only(*columns)
+
+
+class ImageVariantsField(serializers.Field):
+    """
+    srcset-карта уменьшенных копий фото из колонки <поле>_variants:
+    {"width", "height", "placeholder", "webp": {ширина: url}, "jpeg": {ширина: url}}.
+    None, пока варианты не сгенерированы
+    """
+
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        return self.make_converter(self.context.get('request'))(value)
+
+    @staticmethod
+    def make_converter(request):
+        """ Конвертер с префиксом медиа, посчитанным один раз (используется и FastSerializer) """
+        base_url = default_storage.base_url
+        prefix = request.build_absolute_uri(base_url) if request is not None else base_url
+
+        def convert(value):
+            if not value:
+                return None
+            return {
+                "width": value["width"],
+                "height": value["height"],
+                "placeholder": value["placeholder"],
+                "webp": {width: prefix + filepath_to_uri(path) for width, path in value["webp"].items()},
+                "jpeg": {width: prefix + filepath_to_uri(path) for width, path in value["jpeg"].items()},
+            }
+
+        return convert
+
+
+class IngestedImageField(serializers.ImageField):
+    """ ImageField, который перед проверкой Pillow пропускает файл через ingestor (лимиты, метаданные) """
+
+    def to_internal_value(self, data):
+        if hasattr(data, 'read'):
+            data = ingestor.ingest(data)
+        return super().to_internal_value(data)
 
 
 class AuthorizationSerializer(serializers.Serializer):
@@ -16,25 +111,37 @@ class AuthorizationSerializer(serializers.Serializer):
     name = serializers.CharField(max_length=50, required=False)
     password = serializers.CharField(max_length=50, write_only=True)
     # password = serializers.CharField(max_length=50, validators=(validate_password,), write_only=True)
-    photo = serializers.ImageField(required=False, use_url=True)
+    photo = IngestedImageField(required=False, use_url=True)
 
     def create(self, validated_data):
-        is_signup = self.context['signup']
-        user, created = User.objects.get_or_create(username=validated_data.get('username'))
-        if created:
-            if not is_signup:
-                user.delete()
-                raise serializers.ValidationError({'info': 'Bad username/password'})
-            # user.name = validated_data['name'] # Так почему то он сохраняет в виде кортежа из одного элемента
-            setattr(user, 'name', validated_data['name']) # А вот так как строку
-            user.set_password(validated_data.get('password'))
-            user.photo = validated_data.get('photo')
-            user.save()
-        else:
-            if is_signup:
-                raise serializers.ValidationError({'info': f'User with phone/email {validated_data.get("username")} already exists'})
-            if not user.check_password(validated_data.get('password')):
-                raise serializers.ValidationError({'info': 'Bad username/password'})
+        if self.context['signup']:
+            return self.signup(validated_data)
+        return self.signin(validated_data)
+
+    def signin(self, validated_data):
+        """ Вход: один SELECT по уникальному индексу username (и UPDATE пароля, если его хэш устарел) """
+        user = User.objects.filter(username=validated_data.get('username')).first()
+        if not hashing.pool.check_user_password(user, validated_data.get('password')):
+            raise serializers.ValidationError({'info': 'Bad username/password'})
+        return user
+
+    def signup(self, validated_data):
+        """ Регистрация - единственный путь, который пишет в таблицу пользователей """
+        username = validated_data.get('username')
+        if User.objects.filter(username=username).exists():
+            raise serializers.ValidationError({'info': f'User with phone/email {username} already exists'})
+        password = hashing.pool.make_password(validated_data.get('password'))
+        try:
+            # Гонку двух одновременных регистраций разрешает уникальный индекс username
+            with transaction.atomic():
+                user = User.objects.create(
+                    username=username,
+                    name=validated_data.get('name'),
+                    password=password,
+                    photo=validated_data.get('photo'),
+                )
+        except IntegrityError:
+            raise serializers.ValidationError({'info': f'User with phone/email {username} already exists'})
         return user
 
     class Meta:
@@ -46,16 +153,18 @@ class UserDetailSerializer(serializers.ModelSerializer):
     """
     Сериализатор для детального отображения пользователя
     """
+    photo_variants = ImageVariantsField()
 
     class Meta:
         model = User
-        fields = ['username', 'name', 'photo']
+        fields = ['username', 'name', 'photo', 'photo_variants']
 
 
 class UserUpdateSerializer(serializers.ModelSerializer):
     """
     Сериализатор для обновления пользователя
     """
+    photo = IngestedImageField(required=False, allow_null=True, use_url=True)
     old_password = serializers.CharField(write_only=True)
     new_password = serializers.CharField(write_only=True)
 
@@ -65,12 +174,12 @@ class UserUpdateSerializer(serializers.ModelSerializer):
         old_pass = validated_data.get('old_password')
         new_pass = validated_data.get('new_password')
         if old_pass is not None and new_pass is not None:
-            if instance.check_password(old_pass):
+            if hashing.pool.check_user_password(instance, old_pass):
                 # try:
                 #     validate_password(new_pass)
                 # except Exception as e:
                 #     raise ValidationError(e)
-                instance.set_password(new_pass)
+                instance.password = hashing.pool.make_password(new_pass)
             else:
                 raise ValidationError({'info': 'Wrong password'})
         instance.save()
@@ -81,20 +190,43 @@ class UserUpdateSerializer(serializers.ModelSerializer):
         fields = ['username', 'name', 'photo', 'old_password', 'new_password']
 
 
-class ArticleSerializer(serializers.ModelSerializer):
+class ArticleSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """
     Сериализатор новостей
     """
+    photo_variants = ImageVariantsField()
 
     class Meta:
         model = Article
-        fields = "__all__"
+        exclude = ("created_at", "updated_at", "search_vector")
+
+
+class ArticleListSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """
+    Сериализатор новостей для списка (без текста)
+    """
+    photo_variants = ImageVariantsField()
+
+    class Meta:
+        model = Article
+        fields = ["id", "title", "summary", "photo", "photo_variants"]
 
 
 class DocumentSerializer(serializers.ModelSerializer):
     """
-    Сериализатор документов
+    Сериализатор документов. Файл назван хэшем содержимого, поэтому в URL
+    добавляется ?name=<название>.<расширение> - с ним media отдает имя для сохранения
     """
+    file = serializers.SerializerMethodField()
+
+    def get_file(self, document):
+        if not document.file:
+            return None
+        request = self.context.get('request')
+        url = document.file.url
+        if request is not None:
+            url = request.build_absolute_uri(url)
+        return replace_query_param(url, 'name', document.title + os.path.splitext(document.file.name)[1])
 
     class Meta:
         model = Document
@@ -118,7 +250,7 @@ class FAQSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = FAQ
-        fields = "__all__"
+        exclude = ("updated_at", "search_vector")
 
 
 class ChatSerializer(serializers.ModelSerializer):
@@ -128,7 +260,7 @@ class ChatSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Chat
-        fields = "__all__"
+        exclude = ("updated_at",)
 
 
 class SocialSerializer(serializers.ModelSerializer):
@@ -138,13 +270,14 @@ class SocialSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Social
-        fields = "__all__"
+        exclude = ("updated_at",)
 
     
 class AttachesSerializer(serializers.ModelSerializer):
     """
     Сериализатор фото
     """
+    photo_variants = ImageVariantsField()
 
     class Meta:
         model = AttachmentPhoto
@@ -158,8 +291,8 @@ class AboutSerializer(serializers.ModelSerializer):
     attaches = serializers.SerializerMethodField()
 
     def get_attaches(self, object):
-        services = AttachmentPhoto.objects.all()
-        return AttachesSerializer(instance=services, many=True, context=self.context).data
+        # attaches.all() берет данные из prefetch_related, без отдельного запроса
+        return AttachesSerializer(instance=object.attaches.all(), many=True, context=self.context).data
 
     class Meta:
         model = About
@@ -173,25 +306,65 @@ class ProductCategorySerializer(serializers.ModelSerializer):
 
     class Meta:
         model = ProductCategory
-        fields = "__all__"
+        exclude = ("updated_at",)
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """
     Сериализатор продуктов
     """
     category = ProductCategorySerializer(read_only=True)
+    photo_variants = ImageVariantsField()
 
     class Meta:
         model = Product
-        fields = "__all__"
+        exclude = ("updated_at", "search_vector")
+
+
+class ProductListSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """
+    Сериализатор продуктов для списка (без описания)
+    """
+    category = ProductCategorySerializer(read_only=True)
+    photo_variants = ImageVariantsField()
+
+    class Meta:
+        model = Product
+        fields = ["id", "category", "title", "photo", "photo_variants", "summary", "top"]
 
 
 class ProductResultSerializer(serializers.ModelSerializer):
     """
     Сериализатор пезультатов по продуктам
     """
+    photo_before_variants = ImageVariantsField()
+    photo_after_variants = ImageVariantsField()
 
     class Meta:
         model = ProductResults
-        fields = ['name', 'photo_before', 'photo_after', 'text', 'links']
+        fields = ['name', 'photo_before', 'photo_before_variants', 'photo_after', 'photo_after_variants', 'text', 'links']
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    """ Сессия загрузки частями: параметры при создании, прогресс при чтении """
+
+    target = serializers.ChoiceField(choices=list(UPLOAD_TARGETS))
+    size = serializers.IntegerField(min_value=1, max_value=uploads.max_size)
+    chunk_size = serializers.IntegerField(
+        min_value=uploads.min_chunk_size, max_value=uploads.max_chunk_size, required=False,
+    )
+    sha256 = serializers.RegexField(r'^[0-9a-f]{64}$', required=False)
+    chunks = serializers.IntegerField(read_only=True)
+    received = serializers.SerializerMethodField()
+
+    def get_received(self, obj):
+        return uploads.received(obj)
+
+    def create(self, validated_data):
+        return uploads.start(self.context['request'].user, **validated_data)
+
+    class Meta:
+        model = UploadSession
+        fields = ['id', 'target', 'object_id', 'filename', 'size', 'chunk_size', 'sha256', 'status', 'error',
+                  'chunks', 'received']
+        read_only_fields = ['status', 'error']
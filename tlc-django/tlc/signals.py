@@ -0,0 +1,229 @@
+import logging
+
+from django.db import transaction
+from django.apps import apps
+from django.db.models import FileField
+from django.db.models.signals import m2m_changed, post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from tlc.core.auth import token_cache
+from tlc.core.images import IMAGE_FIELDS, pipeline, remove_variants, variants_ready
+from tlc.core.leaderboard import leaderboard
+from tlc.core.push import fanout
+from tlc.core.response_cache import response_cache
+from tlc.core.search import engine as search_engine
+from tlc.core.snapshots import snapshots
+from tlc.core.storage import ContentAddressedStorage
+from tlc.models import (
+    About, Article, AttachmentPhoto, Chat, Document, FAQ, Product, ProductCategory, ProductResults, Social, User, Video,
+)
+from configs import settings
+
+logger = logging.getLogger(__name__)
+
+
+@receiver((post_save, post_delete), sender=User, dispatch_uid='tlc_user_token_cache')
+def invalidate_user_tokens(sender, instance, **kwargs):
+    """
+    Сбрасывает закэшированные токены пользователя при изменении/удалении
+    """
+    token_cache.invalidate_user(instance.pk)
+
+
+PUBLISH_NOTIFICATIONS = {
+    Article: ('article', 'Новая новость'),
+    Video: ('video', 'Новое видео'),
+    Document: ('document', 'Новый документ'),
+}
+
+
+@receiver(post_save, sender=Article, dispatch_uid='tlc_publish_article')
+@receiver(post_save, sender=Video, dispatch_uid='tlc_publish_video')
+@receiver(post_save, sender=Document, dispatch_uid='tlc_publish_document')
+def notify_devices_on_publish(sender, instance, created, raw=False, **kwargs):
+    """
+    Рассылает пуш всем устройствам при создании нового контента
+    """
+    if not created or raw or not settings.PUSH_ON_PUBLISH:
+        return
+    kind, title = PUBLISH_NOTIFICATIONS[sender]
+    notification = {"title": title, "body": instance.title}
+    data = {"type": kind, "id": str(instance.pk)}
+    transaction.on_commit(lambda: fanout.publish(notification, data))
+
+
+CATALOG_MODELS = (
+    Article, Document, Video, Chat, Social, Product, ProductCategory, ProductResults, FAQ, About, AttachmentPhoto,
+)
+
+
+def invalidate_response_cache(sender, **kwargs):
+    """
+    Сбрасывает закэшированные ответы эндпоинтов, зависящих от модели, после коммита:
+    иначе параллельный запрос успеет закэшировать старые данные под новым поколением
+    """
+    transaction.on_commit(lambda: response_cache.invalidate(sender))
+
+
+for model in CATALOG_MODELS:
+    post_save.connect(invalidate_response_cache, sender=model, dispatch_uid=f'tlc_response_cache_save_{model.__name__}')
+    post_delete.connect(invalidate_response_cache, sender=model, dispatch_uid=f'tlc_response_cache_delete_{model.__name__}')
+
+
+@receiver(m2m_changed, sender=About.attaches.through, dispatch_uid='tlc_response_cache_about_attaches')
+def invalidate_about_attaches(sender, action, **kwargs):
+    """
+    Смена набора фото у "О компании" тоже сбрасывает закэшированную страницу
+    """
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        transaction.on_commit(lambda: response_cache.invalidate(About))
+
+
+SNAPSHOT_MODELS = (Chat, Social, ProductCategory, Document, Video, FAQ)
+
+
+def rebuild_snapshots(sender, **kwargs):
+    """
+    Пересобирает JSON-снапшоты, зависящие от модели, после коммита.
+    Если сборка упала, снапшот сбрасывается и соберется из БД при чтении
+    """
+    def rebuild():
+        for name, (models, _) in snapshots.definitions.items():
+            if sender not in models:
+                continue
+            try:
+                snapshots.rebuild(name)
+            except Exception:
+                logger.exception('Snapshot %s rebuild failed', name)
+                snapshots.invalidate(name)
+
+    transaction.on_commit(rebuild)
+
+
+for model in SNAPSHOT_MODELS:
+    post_save.connect(rebuild_snapshots, sender=model, dispatch_uid=f'tlc_snapshots_save_{model.__name__}')
+    post_delete.connect(rebuild_snapshots, sender=model, dispatch_uid=f'tlc_snapshots_delete_{model.__name__}')
+
+
+@receiver(post_save, sender=Product, dispatch_uid='tlc_search_product')
+@receiver(post_save, sender=Article, dispatch_uid='tlc_search_article')
+@receiver(post_save, sender=FAQ, dispatch_uid='tlc_search_faq')
+def update_search_vector(sender, instance, raw=False, **kwargs):
+    """
+    Пересчитывает search_vector сохраненной строки одним UPDATE (сигналов не вызывает)
+    """
+    if raw:
+        return
+    search_engine.update(sender, instance.pk)
+
+
+@receiver(post_save, sender=Product, dispatch_uid='tlc_leaderboard_product_save')
+def update_leaderboard_product(sender, instance, raw=False, **kwargs):
+    """
+    Точечно обновляет строку товара в материализованном топе
+    """
+    if not raw:
+        transaction.on_commit(lambda: leaderboard.update_product(instance.pk))
+
+
+@receiver(post_delete, sender=Product, dispatch_uid='tlc_leaderboard_product_delete')
+def remove_leaderboard_product(sender, instance, **kwargs):
+    product_id = instance.pk
+    transaction.on_commit(lambda: leaderboard.remove_product(product_id))
+
+
+@receiver(post_save, sender=ProductCategory, dispatch_uid='tlc_leaderboard_category_save')
+def update_leaderboard_category(sender, instance, raw=False, **kwargs):
+    """
+    Обновляет денормализованную категорию у товаров топа
+    """
+    if not raw:
+        transaction.on_commit(lambda: leaderboard.update_category(instance))
+
+
+def schedule_image_variants(sender, instance, raw=False, **kwargs):
+    """
+    Ставит генерацию вариантов для ImageField'ов, у которых сменился файл
+    """
+    if raw or not settings.IMAGE_VARIANTS_ON_SAVE:
+        return
+    for field in IMAGE_FIELDS[sender]:
+        if pipeline.needs_update(instance, field):
+            transaction.on_commit(lambda field=field: pipeline.schedule(instance, field))
+
+
+for model in IMAGE_FIELDS:
+    post_save.connect(schedule_image_variants, sender=model, dispatch_uid=f'tlc_image_variants_{model.__name__}')
+
+
+@receiver(variants_ready, dispatch_uid='tlc_image_variants_ready')
+def invalidate_on_variants(sender, pk, **kwargs):
+    """
+    Варианты записаны UPDATE'ом в обход post_save - сбрасываем то же, что и при сохранении
+    """
+    if sender is User:
+        token_cache.invalidate_user(pk)
+        return
+    response_cache.invalidate(sender)
+    if sender is Product:
+        leaderboard.update_product(pk)
+
+
+# Модель -> FileField'ы в контентно-адресуемом хранилище (учет ссылок на файлы)
+CONTENT_FIELDS = {
+    model: fields for model, fields in (
+        (model, tuple(
+            field.name for field in model._meta.concrete_fields
+            if isinstance(field, FileField) and isinstance(field.storage, ContentAddressedStorage)
+        ))
+        for model in apps.get_app_config('tlc').get_models()
+    ) if fields
+}
+
+
+def file_name(value):
+    return getattr(value, 'name', value) or None
+
+
+def remember_content_names(sender, instance, **kwargs):
+    """
+    Запоминает имена файлов при загрузке строки, чтобы post_save увидел замену
+    без лишнего запроса. Отложенные (.only/.defer) поля не запоминаются
+    """
+    instance._content_names = {
+        field: file_name(instance.__dict__[field]) for field in CONTENT_FIELDS[sender] if field in instance.__dict__
+    }
+
+
+def count_content_references(sender, instance, created=False, raw=False, update_fields=None, **kwargs):
+    """
+    Новое имя файла в поле: +1 ссылка на него и -1 на прежнее.
+    Файл без ссылок удаляется после коммита вместе с вариантами
+    """
+    if raw:
+        return
+    names = instance.__dict__.setdefault('_content_names', {})
+    for field in CONTENT_FIELDS[sender]:
+        if update_fields is not None and field not in update_fields:
+            continue
+        if field not in instance.__dict__ or (not created and field not in names):
+            continue
+        name, previous = file_name(instance.__dict__[field]), None if created else names[field]
+        if name != previous:
+            storage = sender._meta.get_field(field).storage
+            storage.acquire(name)
+            storage.release(previous, on_delete=remove_variants)
+        names[field] = name
+
+
+def release_content_references(sender, instance, **kwargs):
+    for field in CONTENT_FIELDS[sender]:
+        sender._meta.get_field(field).storage.release(
+            file_name(instance.__dict__.get(field)), on_delete=remove_variants,
+        )
+
+
+for model in CONTENT_FIELDS:
+    post_init.connect(remember_content_names, sender=model, dispatch_uid=f'tlc_content_names_{model.__name__}')
+    post_save.connect(count_content_references, sender=model, dispatch_uid=f'tlc_content_refs_{model.__name__}')
+    post_delete.connect(release_content_references, sender=model, dispatch_uid=f'tlc_content_release_{model.__name__}')
@@ -0,0 +1,25 @@
+from tlc.core.fast_serializers import fast_data
+from tlc.core.snapshots import SnapshotRequest, snapshots
+from tlc.models import Chat, Document, FAQ, ProductCategory, Social, Video
+from tlc.serializers import (
+    ChatSerializer, DocumentSerializer, FAQSerializer, ProductCategorySerializer, SocialSerializer, VideoSerializer,
+)
+
+
+def collection(serializer_class, get_queryset):
+    """ build() снапшота: сериализует всю выборку с заглушкой вместо request """
+    return lambda: fast_data(serializer_class, get_queryset(), {"request": SnapshotRequest()})
+
+
+# Имя снапшота -> (модели, от которых он зависит, сборка)
+SNAPSHOTS = {
+    'chats': ((Chat,), collection(ChatSerializer, lambda: Chat.objects.all())),
+    'social': ((Social,), collection(SocialSerializer, lambda: Social.objects.all())),
+    'categories': ((ProductCategory,), collection(ProductCategorySerializer, lambda: ProductCategory.objects.all())),
+    'education_docs': ((Document,), collection(DocumentSerializer, lambda: Document.objects.filter(is_educate=True))),
+    'education_video': ((Video,), collection(VideoSerializer, lambda: Video.objects.filter(is_educate=True))),
+    'education_faq': ((FAQ,), collection(FAQSerializer, lambda: FAQ.objects.all())),
+}
+
+for name, (models, build) in SNAPSHOTS.items():
+    snapshots.register(name, models, build)
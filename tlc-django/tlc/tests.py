@@ -1,3 +1,1354 @@
-from django.test import TestCase
+import base64
+import hashlib
+import io
+import json
+import os
+import shutil
+import socketserver
+import tempfile
+import threading
+import zipfile
+from datetime import datetime, timedelta
+from unittest import mock
+from urllib.parse import urlencode
 
-# Create your tests here.
+from django import forms
+from django.contrib.auth.hashers import make_password
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.db.models import F
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, resolve
+from fcm_django.models import FCMDevice
+from PIL import Image
+from rest_framework.exceptions import AuthenticationFailed, ValidationError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from tlc import urls as tlc_urls, utils
+from tlc.admin import IngestedImageFormField
+from tlc.core import codes, hashing
+from tlc.core.auth import ClaimsJWTAuthentication, JWTAuthentication, TokenCache, token_cache
+from tlc.core.budgets import budget_key, query_budget
+from tlc.core.bundles import bundles
+from tlc.core.images import generate_variants, pipeline
+from tlc.core.fast_serializers import FastSerializer
+from tlc.core.ingest import ingestor
+from tlc.core.leaderboard import leaderboard
+from tlc.core.media import media_server
+from tlc.core.outbox import Outbox, SMTPConnectionPool
+from tlc.core.pagination import KeysetPagination
+from tlc.core.push import PushFanout, StubTransport, fanout
+from tlc.core.response_cache import DjangoCacheBackend, ResponseCache, response_cache
+from tlc.core.search import escape_html, make_snippet
+from tlc.core.snapshots import snapshots
+from tlc.core.streaming import iter_json_list
+from tlc.core.storage import ContentAddressedStorage
+from tlc.core.uploads import uploads
+from tlc.models import (
+    FAQ, About, Article, AttachmentPhoto, Chat, Document, OutgoingEmail, Product, ProductCategory, ProductResults, Social, StoredFile, User,
+    Video,
+)
+from tlc.serializers import (
+    ArticleListSerializer, ArticleSerializer, DocumentSerializer, ProductListSerializer, ProductResultSerializer,
+    ProductSerializer,
+)
+from configs import settings
+
+
+class PushFanoutTests(TestCase):
+    """ Рассылка пушей на заглушке транспорта """
+
+    notification = {"title": "Новая новость", "body": "test"}
+    data = {"type": "article", "id": "1"}
+
+    def test_stub_transport_responses(self):
+        transport = StubTransport(invalid_tokens=['bad'])
+        responses = transport.send(['good', 'bad'], self.notification, self.data)
+        self.assertEqual([response.success for response in responses], [True, False])
+        self.assertEqual(transport.batches, [(['good', 'bad'], self.notification, self.data)])
+
+    def test_send_to_all_chunks_and_prunes(self):
+        tokens = [f'token-{i}' for i in range(7)]
+        FCMDevice.objects.bulk_create(FCMDevice(registration_id=token, type='android') for token in tokens)
+        FCMDevice.objects.create(registration_id='inactive', type='android', active=False)
+        transport = StubTransport(invalid_tokens=['token-2', 'token-5'])
+        fanout = PushFanout(transport, chunk_size=3, db_batch_size=2)
+
+        totals = fanout.send_to_all(self.notification, self.data)
+
+        self.assertEqual((totals["sent"], totals["failed"], totals["pruned"]), (5, 2, 2))
+        self.assertEqual([batch[0] for batch in transport.batches], [tokens[0:3], tokens[3:6], tokens[6:]])
+        self.assertEqual(
+            set(FCMDevice.objects.filter(active=False).values_list('registration_id', flat=True)),
+            {'token-2', 'token-5', 'inactive'},
+        )
+        self.assertEqual(fanout.stats()["sent"], 5)
+
+    def test_publish_after_commit_of_new_content(self):
+        with mock.patch.object(settings, 'PUSH_ON_PUBLISH', True), mock.patch.object(fanout, 'publish') as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                article = Article.objects.create(title='Article', text='Text')
+                publish.assert_not_called()
+            publish.assert_called_once_with({"title": 'Новая новость', "body": 'Article'},
+                                            {"type": 'article', "id": str(article.pk)})
+            # Изменение уже опубликованной записи пуш не рассылает
+            with self.captureOnCommitCallbacks(execute=True):
+                article.save()
+            self.assertEqual(publish.call_count, 1)
+
+
+class PasswordUpgradeTests(TestCase):
+    """ Проверка пароля через пул обновляет устаревший хэш, как User.check_password """
+
+    def setUp(self):
+        self.user = User.objects.create(username='user@example.com',
+                                        password=make_password('secret12', hasher='pbkdf2_sha1'))
+
+    def assertUpgraded(self):
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$'))
+        self.assertTrue(self.user.check_password('secret12'))
+
+    def test_wrong_password_keeps_hash(self):
+        encoded = self.user.password
+        self.assertFalse(hashing.pool.check_user_password(self.user, 'wrong'))
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.password, encoded)
+
+    def test_signin_upgrades_hash(self):
+        response = self.client.post('/api/v1/auth/signin/', {"username": 'user@example.com', "password": 'secret12'})
+        self.assertEqual(response.status_code, 200)
+        self.assertUpgraded()
+
+    def test_async_signin_upgrades_hash(self):
+        response = self.client.post('/api/v1/auth/async/signin/',
+                                    {"username": 'user@example.com', "password": 'secret12'})
+        self.assertEqual(response.status_code, 200)
+        self.assertUpgraded()
+
+
+class CodeStoreTests(TestCase):
+    """ Коды сброса пароля в общем кэше """
+
+    def setUp(self):
+        self.store = codes.CacheCodeStore(ttl=60, max_attempts=3)
+        self.addCleanup(self.store.cache.clear)
+
+    def test_code_is_single_use(self):
+        code = self.store.issue(1)
+        self.assertEqual(self.store.verify(1, code + 1 if code < 9999 else 1000), codes.CODE_WRONG)
+        self.assertEqual(self.store.verify(1, code), codes.CODE_OK)
+        self.assertEqual(self.store.verify(1, code), codes.CODE_MISSING)
+
+    def test_code_burns_after_max_attempts(self):
+        code = self.store.issue(2)
+        wrong = code + 1 if code < 9999 else 1000
+        self.assertEqual([self.store.verify(2, wrong) for _ in range(3)],
+                         [codes.CODE_WRONG, codes.CODE_WRONG, codes.CODE_EXHAUSTED])
+        self.assertEqual(self.store.verify(2, code), codes.CODE_MISSING)
+
+    def test_new_code_replaces_old(self):
+        first = self.store.issue(3)
+        second = self.store.issue(3)
+        if first != second:
+            self.assertEqual(self.store.verify(3, first), codes.CODE_WRONG)
+        self.assertEqual(self.store.verify(3, second), codes.CODE_OK)
+
+    def test_issue_is_rate_limited(self):
+        for store in (self.store, codes.MemoryCodeStore(ttl=60, max_attempts=3)):
+            self.assertIsNotNone(store.issue(4))
+            self.assertIsNotNone(store.issue(4))
+            self.assertIsNotNone(store.issue(4))
+            self.assertIsNone(store.issue(4))
+            self.assertIsNotNone(store.issue(5))
+
+    def test_reissue_keeps_attempts(self):
+        for store in (self.store, codes.MemoryCodeStore(ttl=60, max_attempts=3)):
+            code = store.issue(6)
+            wrong = code + 1 if code < 9999 else 1000
+            self.assertEqual([store.verify(6, wrong) for _ in range(2)], [codes.CODE_WRONG, codes.CODE_WRONG])
+            code = store.issue(6)
+            wrong = code + 1 if code < 9999 else 1000
+            self.assertEqual(store.verify(6, wrong), codes.CODE_EXHAUSTED)
+            # До конца окна новый код не дает новых попыток
+            code = store.issue(6)
+            self.assertEqual(store.verify(6, code), codes.CODE_EXHAUSTED)
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    """ Минимальный SMTP-сервер: принимает все, кроме получателей из server.rejected """
+
+    def reply(self, line: str):
+        self.wfile.write(line.encode('ascii') + b'\r\n')
+
+    def handle(self):
+        self.server.connections += 1
+        self.reply('220 localhost ESMTP')
+        recipients = []
+        for line in self.rfile:
+            command = line.decode('utf-8').strip()
+            verb = command.split(' ', 1)[0].upper()
+            if verb in ('EHLO', 'HELO'):
+                self.reply('250 localhost')
+            elif verb == 'RCPT':
+                recipient = command.split(':', 1)[1].strip('<> ')
+                if recipient in self.server.rejected:
+                    self.reply('550 No such user')
+                else:
+                    recipients.append(recipient)
+                    self.reply('250 OK')
+            elif verb == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                data = []
+                for data_line in self.rfile:
+                    if data_line in (b'.\r\n', b'.\n'):
+                        break
+                    data.append(data_line)
+                self.server.messages.append((recipients, b''.join(data)))
+                recipients = []
+                self.reply('250 OK')
+            elif verb == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                # MAIL, RSET, NOOP
+                self.reply('250 OK')
+
+
+class OutboxTests(TestCase):
+    """ Отправка пачки писем на локальный SMTP-сервер """
+
+    def setUp(self):
+        server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), SMTPHandler)
+        server.daemon_threads = True
+        server.rejected, server.messages, server.connections = {'rejected@example.com'}, [], 0
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.server = server
+        pool = SMTPConnectionPool('127.0.0.1', server.server_address[1], False, None, None, size=1, timeout=5)
+        self.addCleanup(pool.close_all)
+        self.outbox = Outbox(pool, 'noreply@example.com', batch_size=10, max_attempts=3, backoff=30,
+                             max_backoff=3600, lease=300, poll_interval=10)
+
+    def test_bad_email_does_not_stall_batch(self):
+        sent = OutgoingEmail.objects.create(to='user@example.com', subject='Код', body='1234')
+        rejected = OutgoingEmail.objects.create(to='rejected@example.com', subject='Код', body='1234')
+        broken = OutgoingEmail.objects.create(to='user@example.com', subject='broken', body='1234')
+        build = self.outbox._build
+
+        def build_or_fail(email):
+            if email.subject == 'broken':
+                raise UnicodeEncodeError('ascii', 'ы', 0, 1, 'ordinal not in range(128)')
+            return build(email)
+
+        with mock.patch.object(self.outbox, '_build', side_effect=build_or_fail):
+            self.assertEqual(self.outbox.process_batch(), 3)
+
+        statuses = dict(OutgoingEmail.objects.values_list('id', 'status'))
+        self.assertEqual(statuses[sent.id], OutgoingEmail.STATUS_SENT)
+        for email in (rejected, broken):
+            email.refresh_from_db()
+            self.assertEqual((email.status, email.attempts), (OutgoingEmail.STATUS_PENDING, 1))
+            self.assertTrue(email.last_error)
+            # повтор по backoff, а не через lease
+            self.assertLess((email.next_attempt_at - email.created_at).total_seconds(), 60)
+        self.assertEqual([recipients for recipients, _ in self.server.messages], [['user@example.com']])
+        self.assertEqual(self.outbox.stats()["sent"], 1)
+
+    def test_connection_is_reused_between_batches(self):
+        for i in range(3):
+            OutgoingEmail.objects.create(to=f'user{i}@example.com', subject='Код', body='1234')
+            self.assertEqual(self.outbox.process_batch(), 1)
+        self.assertEqual(len(self.server.messages), 3)
+        self.assertEqual(self.server.connections, 1)
+
+    def test_failed_email_gives_up_after_max_attempts(self):
+        email = OutgoingEmail.objects.create(to='rejected@example.com', subject='Код', body='1234')
+        for _ in range(3):
+            # Не ждем backoff: письмо снова готово к отправке
+            OutgoingEmail.objects.filter(id=email.id).update(next_attempt_at=email.created_at)
+            self.outbox.process_batch()
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), (OutgoingEmail.STATUS_FAILED, 3))
+        OutgoingEmail.objects.filter(id=email.id).update(next_attempt_at=email.created_at)
+        self.assertEqual(self.outbox.process_batch(), 0)
+
+    def test_send_email_only_enqueues(self):
+        with mock.patch.object(settings, 'EMAIL_OUTBOX_AUTOSTART', False), \
+                mock.patch('smtplib.SMTP') as smtp, self.captureOnCommitCallbacks(execute=True):
+            email = utils.send_email('1234', 'user@example.com', 'Код')
+        smtp.assert_not_called()
+        email.refresh_from_db()
+        self.assertEqual(email.status, OutgoingEmail.STATUS_PENDING)
+
+
+def route_names(patterns) -> set:
+    """ Имена бюджетов всех маршрутов, как их считает budget_key """
+    names = set()
+    for pattern in patterns:
+        if not isinstance(pattern, URLPattern):
+            continue
+        actions = getattr(pattern.callback, 'actions', None)
+        if actions:
+            names.update(f'{pattern.callback.cls.__name__}.{action}' for action in actions.values())
+        else:
+            names.add(pattern.callback.__name__)
+    return names
+
+
+class QueryBudgetTests(TestCase):
+    """
+    Каждый маршрут tlc/urls.py на холодных кэшах укладывается в свой QUERY_BUDGETS.
+    Новый маршрут без бюджета или без проверки здесь роняет test_every_route_is_checked
+    """
+
+    route_tests = ('test_auth_routes', 'test_user_routes', 'test_content_routes', 'test_service_routes',
+                   'test_upload_routes')
+
+    def setUp(self):
+        self.checked = set()
+        # Лимит выдачи кодов сброса хранится в общем кэше между тестами
+        code_cache = caches[settings.CONFIRM_CODE_CACHE]
+        code_cache.clear()
+        self.addCleanup(code_cache.clear)
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        media_settings = override_settings(MEDIA_ROOT=self.media_root)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        for patcher in (
+            mock.patch.object(media_server, 'root', self.media_root),
+            mock.patch.object(uploads, 'directory', os.path.join(self.media_root, '.uploads')),
+            mock.patch.object(snapshots, 'directory', os.path.join(self.media_root, '.snapshots')),
+            mock.patch.object(settings, 'EMAIL_OUTBOX_AUTOSTART', False),
+            mock.patch.dict(os.environ, {"EMAIL_SUPPORT": 'support@example.com'}),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        token_cache.clear()
+        # Кэши ответов и снапшоты сбрасываются сигналами после коммита
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user = User.objects.create_user(username='user@example.com', password='secret12', name='User')
+            self.admin = User.objects.create_superuser(username='admin@example.com', password='secret12')
+            self.category = ProductCategory.objects.create(title='Category')
+            self.product = Product.objects.create(title='Product', category=self.category, top=1, text='Text')
+            ProductResults.objects.create(product=self.product, name='Result')
+            self.article = Article.objects.create(title='Article', summary='Summary', text='Text')
+            Chat.objects.create(title='Chat', link='https://t.me/chat')
+            Social.objects.create(link='https://vk.com/tlc')
+            FAQ.objects.create(question='Question', answer='Answer')
+            Video.objects.create(title='Video', file='video/video.mp4', is_educate=True)
+            document = Document(title='Document', is_educate=True)
+            document.file.save('document.pdf', ContentFile(b'%PDF-1.4 test'), save=True)
+            About.objects.create(video='video/about.mp4', text='About')
+        os.makedirs(os.path.join(self.media_root, 'public'))
+        with open(os.path.join(self.media_root, 'public', 'file.txt'), 'wb') as file:
+            file.write(b'public file')
+
+    def auth(self, user) -> dict:
+        return {"HTTP_AUTHORIZATION": f'Bearer {user.token}'}
+
+    def request(self, name: str, method: str, path: str, status: int = 200, **kwargs):
+        self.checked.add(name)
+        with query_budget(name):
+            response = getattr(self.client, method)(path, **kwargs)
+            if response.streaming:
+                # Потоковые ответы читают БД при отдаче - дочитываем внутри бюджета
+                b''.join(response.streaming_content)
+        self.assertEqual(response.status_code, status, name)
+        return response
+
+    def test_auth_routes(self):
+        self.request('AuthView.signup', 'post', '/api/v1/auth/signup/',
+                     status=201, data={"username": 'new@example.com', "password": 'secret12', "name": 'New'})
+        self.request('AuthView.signin', 'post', '/api/v1/auth/signin/',
+                     data={"username": 'user@example.com', "password": 'secret12'})
+        self.request('async_signin', 'post', '/api/v1/auth/async/signin/',
+                     data={"username": 'user@example.com', "password": 'secret12'})
+        self.request('AuthView.send_reset_code', 'post', '/api/v1/auth/send/', data={"username": 'user@example.com'})
+        code = codes.store.issue(self.user.pk)
+        self.request('AuthView.reset_password', 'post', '/api/v1/auth/reset/',
+                     data={"username": 'user@example.com', "code": code, "password": 'secret34'})
+
+    def test_user_routes(self):
+        headers = self.auth(self.user)
+        self.request('UserView.about_user', 'get', '/api/v1/user/me/', **headers)
+        self.request('UserView.edit_user', 'patch', '/api/v1/user/edit/', data=json.dumps({"name": 'Renamed'}),
+                     content_type='application/json', **headers)
+
+    def test_content_routes(self):
+        headers = self.auth(self.user)
+        for name, path in (
+            ('NewsView.all_news', '/api/v1/news/all/'),
+            ('NewsView.get_article', f'/api/v1/news/{self.article.pk}/'),
+            ('DocumentsView.all_docs', '/api/v1/docs/all/'),
+            ('VideoView.all_videos', '/api/v1/video/all/'),
+            ('ChatView.all_chats', '/api/v1/chats/all/'),
+            ('SocialView.all_socials', '/api/v1/social/all/'),
+            ('ProductView.get_categories', '/api/v1/product/categories/'),
+            ('ProductView.get_products_cat', f'/api/v1/product/categories/{self.category.pk}/'),
+            ('ProductView.get_results', f'/api/v1/product/results/{self.product.pk}/'),
+            ('ProductView.get_top', '/api/v1/product/top/'),
+            ('EducationView.all_edu_docs', '/api/v1/education/docs/'),
+            ('EducationView.edu_docs_bundle', '/api/v1/education/docs/bundle/'),
+            ('EducationView.all_edu_videos', '/api/v1/education/video/'),
+            ('EducationView.all_edu_faq', '/api/v1/education/faq/'),
+            ('get_about', '/api/v1/about/'),
+            ('bootstrap', '/api/v1/bootstrap/'),
+            ('search', '/api/v1/search/?q=Product'),
+        ):
+            with self.subTest(name):
+                self.request(name, 'get', path, **headers)
+        self.request('serve_media', 'get', '/media/public/file.txt')
+
+    def test_missing_ids_stay_within_budget(self):
+        headers = self.auth(self.user)
+        self.request('NewsView.get_article', 'get', '/api/v1/news/999999/', status=404, **headers)
+        self.request('ProductView.get_products_cat', 'get', '/api/v1/product/categories/999999/', **headers)
+        self.request('ProductView.get_results', 'get', '/api/v1/product/results/999999/', **headers)
+        for path in ('/api/v1/news/abc/', '/api/v1/product/categories/abc/', '/api/v1/product/results/abc/'):
+            self.assertEqual(self.client.get(path, **headers).status_code, 404, path)
+
+    def test_service_routes(self):
+        self.request('support', 'post', '/api/v1/support/', data={"text": 'Help'}, **self.auth(self.user))
+        self.request('metrics', 'get', '/api/v1/metrics/', **self.auth(self.admin))
+
+    def test_upload_routes(self):
+        headers = self.auth(self.admin)
+        content = b'%PDF-1.4 uploaded'
+        session = self.request('UploadView.start_upload', 'post', '/api/v1/uploads/start/', status=201, data={
+            "target": 'document', "filename": 'upload.pdf', "size": len(content),
+            "sha256": hashlib.sha256(content).hexdigest(),
+        }, **headers).json()
+        base = f'/api/v1/uploads/{session["id"]}/'
+        self.request('UploadView.upload_chunk', 'put', base + 'chunks/0/', data=content,
+                     content_type='application/octet-stream',
+                     HTTP_X_CHUNK_SHA256=hashlib.sha256(content).hexdigest(), **headers)
+        self.request('UploadView.upload_status', 'get', base, **headers)
+        response = self.request('UploadView.finalize_upload', 'post', base + 'finalize/', **headers)
+        self.assertEqual(response.json()["status"], 'complete')
+
+    def test_budget_key_by_method(self):
+        for method, name in (('get', 'NewsView.all_news'), ('head', 'NewsView.all_news'), ('options', ''),
+                             ('delete', '')):
+            request = getattr(RequestFactory(), method)('/api/v1/news/all/')
+            request.resolver_match = resolve(request.path_info)
+            self.assertEqual(budget_key(request), name, method)
+        request = RequestFactory().head('/api/v1/bootstrap/')
+        request.resolver_match = resolve(request.path_info)
+        self.assertEqual(budget_key(request), 'bootstrap')
+
+    def test_every_route_is_checked(self):
+        for test in self.route_tests:
+            getattr(self, test)()
+        names = route_names(tlc_urls.urlpatterns) | {'serve_media'}
+        self.assertEqual(names - set(settings.QUERY_BUDGETS), set(), 'routes without a budget')
+        self.assertEqual(names - self.checked, set(), 'routes not driven through query_budget')
+
+
+class SparseFieldsTests(TestCase):
+    """ ?fields= с неизвестными именами """
+
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user = User.objects.create_user(username='user@example.com', password='secret12')
+            Article.objects.create(title='Article', summary='Summary', text='Text')
+        self.headers = {"HTTP_AUTHORIZATION": f'Bearer {self.user.token}'}
+
+    def test_known_fields(self):
+        response = self.client.get('/api/v1/news/all/?fields=id,title', **self.headers)
+        content = b''.join(response.streaming_content) if response.streaming else response.content
+        self.assertEqual([set(row) for row in json.loads(content)], [{'id', 'title'}])
+
+    def test_unknown_fields_are_rejected(self):
+        response = self.client.get('/api/v1/news/all/?fields=id,bogus,text&view=summary', **self.headers)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {"info": 'Unknown fields: bogus, text'})
+
+
+class UploadFinalizeTests(TestCase):
+    """ Сбой finalize: инфраструктурный - сессия снова активна, проверка файла - сессия failed """
+
+    content = b'%PDF-1.4 uploaded'
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        media_settings = override_settings(MEDIA_ROOT=self.media_root)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        patcher = mock.patch.object(uploads, 'directory', os.path.join(self.media_root, '.uploads'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def start(self, filename: str = 'upload.pdf', sha256: str = ''):
+        session = uploads.start(None, 'document', filename, len(self.content), sha256=sha256)
+        stream = mock.Mock(read=mock.Mock(side_effect=[self.content, b'']))
+        uploads.write_chunk(session, 0, stream, hashlib.sha256(self.content).hexdigest())
+        return session
+
+    def test_storage_error_keeps_chunks(self):
+        session = self.start()
+        with mock.patch.object(uploads, 'store', side_effect=OSError(28, 'No space left on device')):
+            with self.assertRaises(OSError):
+                uploads.finalize(session)
+        session.refresh_from_db()
+        self.assertEqual(session.status, session.STATUS_ACTIVE)
+        self.assertEqual(uploads.received(session), [0])
+
+        document = uploads.finalize(session)
+        session.refresh_from_db()
+        self.assertEqual((session.status, session.object_id), (session.STATUS_COMPLETE, document.pk))
+        with document.file.open('rb') as file:
+            self.assertEqual(file.read(), self.content)
+
+    def test_invalid_file_fails_session(self):
+        session = self.start(sha256='0' * 64)
+        with self.assertRaises(ValidationError):
+            uploads.finalize(session)
+        session.refresh_from_db()
+        self.assertEqual((session.status, session.error), (session.STATUS_FAILED, 'File checksum mismatch'))
+        self.assertFalse(os.path.exists(uploads.session_dir(session)))
+
+
+class ContentStorageTests(TestCase):
+    """ Удаление файла без ссылок против повторной загрузки того же содержимого """
+
+    content = b'%PDF-1.4 shared'
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        media_settings = override_settings(MEDIA_ROOT=self.media_root)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        self.storage = ContentAddressedStorage()
+
+    def stored(self) -> str:
+        name = self.storage.save('file.pdf', ContentFile(self.content))
+        self.storage.acquire(name)
+        # файл загружен давно
+        os.utime(self.storage.path(name), (0, 0))
+        return name
+
+    def test_last_release_removes_file(self):
+        name = self.stored()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.storage.release(name)
+        self.assertFalse(self.storage.exists(name))
+        self.assertFalse(StoredFile.objects.filter(name=name).exists())
+
+    def test_reupload_before_remove_keeps_file(self):
+        name = self.stored()
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.storage.release(name)
+        self.assertEqual(self.storage.save('copy.pdf', ContentFile(self.content)), name)
+        for callback in callbacks:
+            callback()
+        self.assertTrue(self.storage.exists(name))
+        self.storage.acquire(name)
+        self.assertEqual(StoredFile.objects.get(name=name).refcount, 1)
+
+    def test_document_keeps_upload_to_prefix(self):
+        user = User.objects.create_user(username='user@example.com', password='secret12', name='User')
+        for patcher in (
+            mock.patch.object(media_server, 'root', self.media_root),
+            mock.patch.object(media_server, 'protected_prefixes', ('documents/',)),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        document = Document(title='Инструкция')
+        document.file.save('manual.pdf', ContentFile(self.content), save=True)
+        self.assertTrue(document.file.name.startswith('documents/cas/'), document.file.name)
+        url = DocumentSerializer(instance=document).data['file']
+        self.assertTrue(url.endswith('.pdf?name=%D0%98%D0%BD%D1%81%D1%82%D1%80%D1%83%D0%BA%D1%86%D0%B8%D1%8F.pdf'), url)
+        self.assertEqual(self.client.get(url).status_code, 401)
+        response = self.client.get(url, HTTP_AUTHORIZATION=f'Bearer {user.token}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(
+            response['Content-Disposition'],
+            "inline; filename=\"download.pdf\"; filename*=UTF-8''%D0%98%D0%BD%D1%81%D1%82%D1%80%D1%83%D0%BA%D1%86%D0%B8%D1%8F.pdf",
+        )
+
+    def test_reupload_after_remove_rewrites_file(self):
+        name = self.stored()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.storage.release(name)
+        self.assertEqual(self.storage.save('copy.pdf', ContentFile(self.content)), name)
+        with self.storage.open(name, 'rb') as file:
+            self.assertEqual(file.read(), self.content)
+
+
+class KeysetPaginationTests(TestCase):
+    """ Курсор news/all по (-created_at, -id): записи с одинаковым created_at не теряются и не повторяются """
+
+    def setUp(self):
+        token_cache.clear()
+        self.user = User.objects.create_user(username='user@example.com', password='secret12', name='User')
+        with self.captureOnCommitCallbacks(execute=True):
+            articles = [Article.objects.create(title=f'Article {i}', text='Text') for i in range(7)]
+            Article.objects.update(created_at=articles[0].created_at)
+        self.expected = [article.pk for article in reversed(articles)]
+
+    def get(self, url: str):
+        response = self.client.get(url, HTTP_AUTHORIZATION=f'Bearer {self.user.token}')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_pages_through_tied_created_at(self):
+        page, seen, pages = self.get('/api/v1/news/all/?page_size=3'), [], []
+        while True:
+            pages.append(page)
+            seen += [article['id'] for article in page['results']]
+            if page['next'] is None:
+                break
+            page = self.get(page['next'])
+        self.assertEqual(seen, self.expected)
+        self.assertEqual(len(pages), 3)
+        previous = self.get(pages[-1]['previous'])
+        self.assertEqual([article['id'] for article in previous['results']], self.expected[3:6])
+
+    def test_bad_cursor_is_not_found(self):
+        for position in ('xyz', '["1"]', '["not a date", "1"]'):
+            cursor = base64.b64encode(urlencode({"p": position}).encode('ascii')).decode('ascii')
+            response = self.client.get(f'/api/v1/news/all/?cursor={cursor}',
+                                       HTTP_AUTHORIZATION=f'Bearer {self.user.token}')
+            self.assertEqual(response.status_code, 404, position)
+
+
+class BootstrapTests(TestCase):
+    """ Разделы bootstrap общие для всех: параметры одного клиента не меняют ответ другим """
+
+    def setUp(self):
+        token_cache.clear()
+        self.user = User.objects.create_user(username='user@example.com', password='secret12', name='User')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.articles = [Article.objects.create(title=f'Article {i}', text='Long text') for i in range(3)]
+        patcher = mock.patch.object(KeysetPagination, 'page_size', 2)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get(self, query: str):
+        response = self.client.get(f'/api/v1/bootstrap/?{query}', HTTP_AUTHORIZATION=f'Bearer {self.user.token}')
+        self.assertEqual(response.status_code, 200, query)
+        return response.json()
+
+    def test_news_is_first_summary_page(self):
+        news = self.get('sections=news')["news"]
+        self.assertEqual([article['id'] for article in news['results']], [self.articles[2].pk, self.articles[1].pk])
+        self.assertNotIn('text', news['results'][0])
+        self.assertTrue(news['next'].startswith('http://testserver/api/v1/news/all/?cursor='))
+        following = self.client.get(news['next'], HTTP_AUTHORIZATION=f'Bearer {self.user.token}').json()
+        self.assertEqual([article['id'] for article in following['results']], [self.articles[0].pk])
+
+    def test_fields_do_not_leak_into_shared_sections(self):
+        trimmed = self.get('sections=news,top&fields=id')
+        self.assertIn('title', trimmed["news"]['results'][0])
+        plain = self.get('sections=news')
+        self.assertEqual(plain["news"], trimmed["news"])
+        self.get('sections=news&fields=bogus&view=summary')
+
+
+class ResponseCacheTests(TestCase):
+    """ Кэш ответов сбрасывается после коммита записи и общий для всех процессов """
+
+    def setUp(self):
+        caches[settings.RESPONSE_CACHE_ALIAS].clear()
+        token_cache.clear()
+        self.user = User.objects.create_user(username='user@example.com', password='secret12', name='User')
+        self.headers = {"HTTP_AUTHORIZATION": f'Bearer {self.user.token}'}
+
+    def titles(self) -> list:
+        response = self.client.get('/api/v1/news/all/', **self.headers)
+        self.assertEqual(response.status_code, 200)
+        content = b''.join(response.streaming_content) if response.streaming else response.content
+        return sorted(article['title'] for article in json.loads(content))
+
+    def test_write_invalidates_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Article.objects.create(title='First', text='Text')
+        self.assertEqual(self.titles(), ['First'])
+        with self.captureOnCommitCallbacks() as callbacks:
+            Article.objects.create(title='Second', text='Text')
+        # До коммита старый ответ еще действителен
+        self.assertEqual(self.titles(), ['First'])
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.titles(), ['First', 'Second'])
+
+    def test_generations_are_shared_between_processes(self):
+        other = ResponseCache(DjangoCacheBackend(settings.RESPONSE_CACHE_MAX_ENTRIES), settings.RESPONSE_CACHE_TTL)
+        self.assertIsInstance(response_cache.backend, DjangoCacheBackend)
+        before = response_cache.backend.generations(['tlc.article'])
+        other.invalidate(Article)
+        self.assertNotEqual(response_cache.backend.generations(['tlc.article']), before)
+
+    def test_evicted_generation_does_not_restart(self):
+        backend = response_cache.backend
+        before = backend.generations(['tlc.article'])
+        caches[settings.RESPONSE_CACHE_ALIAS].delete('response-cache-gen:tlc.article')
+        self.assertNotEqual(backend.generations(['tlc.article']), before)
+
+
+class ClaimsAuthTests(TestCase):
+    """ ClaimsJWTAuthentication не загружает User, но токен удаленного или отключенного пользователя не проходит """
+
+    def setUp(self):
+        token_cache.clear()
+        self.user = User.objects.create_user(username='user@example.com', password='secret12', name='User')
+        self.headers = {"HTTP_AUTHORIZATION": f'Bearer {self.user.token}'}
+
+    def test_checked_claims_are_cached(self):
+        self.assertEqual(self.client.get('/api/v1/news/all/', **self.headers).status_code, 200)
+        with self.assertNumQueries(0):
+            self.assertEqual(ClaimsJWTAuthentication().authenticate(mock.Mock(headers={
+                "Authorization": self.headers["HTTP_AUTHORIZATION"],
+            }))[0].pk, self.user.pk)
+
+    def test_deleted_user_is_rejected(self):
+        self.assertEqual(self.client.get('/api/v1/news/all/', **self.headers).status_code, 200)
+        self.user.delete()
+        self.assertEqual(self.client.get('/api/v1/news/all/', **self.headers).status_code, 404)
+
+    def test_inactive_user_is_rejected(self):
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertEqual(self.client.get('/api/v1/news/all/', **self.headers).status_code, 401)
+
+
+class SnapshotTests(TestCase):
+    """ Снапшоты справочников: пересборка после записи, ETag с учетом хоста, сборка под блокировкой """
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        media_settings = override_settings(MEDIA_ROOT=self.media_root)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        patcher = mock.patch.object(snapshots, 'directory', os.path.join(self.media_root, '.snapshots'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        snapshots._memory.clear()
+        self.addCleanup(snapshots._memory.clear)
+        token_cache.clear()
+        self.user = User.objects.create_user(username='user@example.com', password='secret12', name='User')
+        self.headers = {"HTTP_AUTHORIZATION": f'Bearer {self.user.token}'}
+
+    def test_write_rebuilds_snapshot(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Chat.objects.create(title='First', link='https://t.me/first')
+        first = self.client.get('/api/v1/chats/all/', **self.headers)
+        self.assertEqual([chat['title'] for chat in first.json()], ['First'])
+        with self.captureOnCommitCallbacks(execute=True):
+            Chat.objects.create(title='Second', link='https://t.me/second')
+        second = self.client.get('/api/v1/chats/all/', HTTP_IF_NONE_MATCH=first['ETag'], **self.headers)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual([chat['title'] for chat in second.json()], ['First', 'Second'])
+        repeated = self.client.get('/api/v1/chats/all/', HTTP_IF_NONE_MATCH=second['ETag'], **self.headers)
+        self.assertEqual(repeated.status_code, 304)
+
+    def test_etag_depends_on_host(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            document = Document(title='Document', is_educate=True)
+            document.file.save('document.pdf', ContentFile(b'%PDF-1.4 test'), save=True)
+        first = self.client.get('/api/v1/education/docs/', HTTP_HOST='a.example.com', **self.headers)
+        self.assertTrue(first.json()[0]['file'].startswith('http://a.example.com/media/'))
+        other = self.client.get('/api/v1/education/docs/', HTTP_HOST='b.example.com',
+                                HTTP_IF_NONE_MATCH=first['ETag'], **self.headers)
+        self.assertEqual(other.status_code, 200)
+        self.assertTrue(other.json()[0]['file'].startswith('http://b.example.com/media/'))
+        same = self.client.get('/api/v1/education/docs/', HTTP_HOST='a.example.com',
+                               HTTP_IF_NONE_MATCH=first['ETag'], **self.headers)
+        self.assertEqual(same.status_code, 304)
+
+    def test_build_runs_under_lock(self):
+        with mock.patch.dict(snapshots.definitions, {"probe": ((), lambda: [snapshots._lock.locked()])}):
+            self.assertEqual(snapshots.rebuild('probe').content, b'[true]')
+
+
+class SearchTests(TestCase):
+    """ Поиск: порядок по весам полей и HTML-сниппеты """
+
+    def setUp(self):
+        token_cache.clear()
+        self.user = User.objects.create_user(username='user@example.com', password='secret12', name='User')
+        self.headers = {"HTTP_AUTHORIZATION": f'Bearer {self.user.token}'}
+
+    def search(self, query: str) -> dict:
+        response = self.client.get('/api/v1/search/?' + urlencode(query), **self.headers)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_title_match_ranks_first(self):
+        in_text = Article.objects.create(title='Other', text='About the rocket launch')
+        in_title = Article.objects.create(title='Rocket', text='Text')
+        results = self.search({"q": 'rocket', "type": 'article'})["results"]
+        self.assertEqual([result["id"] for result in results], [in_title.pk, in_text.pk])
+        self.assertEqual(results[1]["snippet"], 'About the <b>rocket</b> launch')
+
+    def test_snippet_is_escaped(self):
+        Article.objects.create(title='Article', text='<script>alert(1)</script> Tom & Jerry')
+        results = self.search({"q": 'alert jerry', "type": 'article'})["results"]
+        self.assertEqual(results[0]["snippet"], '&lt;script&gt;<b>alert</b>(1)&lt;/script&gt; Tom &amp; <b>Jerry</b>')
+        # Слова из сущностей не подсвечиваются
+        self.assertEqual(make_snippet('a < b', ['lt']), 'a &lt; b')
+
+    def test_database_escape_matches_html_escape(self):
+        Article.objects.create(title='Article', text='<i>Tom</i> & "Jerry"')
+        escaped = Article.objects.annotate(escaped=escape_html(F('text'))).values_list('escaped', flat=True).get()
+        self.assertEqual(escaped, '&lt;i&gt;Tom&lt;/i&gt; &amp; "Jerry"')
+
+
+class BundleTests(TestCase):
+    """ ZIP документов обучения: корректный архив, докачка Range/If-Range, лимиты """
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        media_settings = override_settings(MEDIA_ROOT=self.media_root)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        token_cache.clear()
+        self.user = User.objects.create_user(username='user@example.com', password='secret12', name='User')
+        self.headers = {"HTTP_AUTHORIZATION": f'Bearer {self.user.token}'}
+        self.contents = {"Report.pdf": b'%PDF-1.4 report', "Notes.txt": b'notes ' * 1000}
+        for name, content in self.contents.items():
+            document = Document(title=os.path.splitext(name)[0], is_educate=True)
+            document.file.save(name, ContentFile(content), save=True)
+
+    def get(self, path='/api/v1/education/docs/bundle/', **headers):
+        response = self.client.get(path, **self.headers, **headers)
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, body
+
+    def test_archive_contains_documents(self):
+        response, body = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(int(response['Content-Length']), len(body))
+        with zipfile.ZipFile(io.BytesIO(body)) as archive:
+            self.assertIsNone(archive.testzip())
+            self.assertEqual({name: archive.read(name) for name in archive.namelist()}, self.contents)
+
+    def test_range_resumes_download(self):
+        response, full = self.get()
+        partial, body = self.get(HTTP_RANGE='bytes=100-', HTTP_IF_RANGE=response['ETag'])
+        self.assertEqual(partial.status_code, 206)
+        self.assertEqual(partial['Content-Range'], 'bytes 100-%d/%d' % (len(full) - 1, len(full)))
+        self.assertEqual(body, full[100:])
+        # Архив поменялся (другой ETag) - отдается целиком
+        stale, body = self.get(HTTP_RANGE='bytes=100-', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(stale.status_code, 200)
+        self.assertEqual(body, full)
+        unsatisfiable, _ = self.get(HTTP_RANGE='bytes=%d-' % len(full))
+        self.assertEqual(unsatisfiable.status_code, 416)
+
+    def test_too_many_files(self):
+        with mock.patch.object(bundles, 'max_files', 1):
+            response, _ = self.get()
+        self.assertEqual(response.status_code, 413)
+        self.assertIn('info', response.json())
+
+    def test_empty_bundle(self):
+        response, _ = self.get('/api/v1/education/docs/bundle/?ids=999999')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json(), {"info": 'No files to bundle'})
+
+
+def png_bytes(size: tuple = (8, 8), color: tuple = (200, 10, 10)) -> bytes:
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+class ImageIngestTests(TestCase):
+    """ Лимиты приема изображений через API-валидацию и форму админки """
+
+    @staticmethod
+    def png(size: tuple, name: str = 'image.png') -> SimpleUploadedFile:
+        return SimpleUploadedFile(name, png_bytes(size), content_type='image/png')
+
+    def test_rejects_non_images(self):
+        with self.assertRaises(forms.ValidationError):
+            ingestor.ingest(SimpleUploadedFile('image.png', b'<svg></svg>'))
+
+    def test_rejects_by_limits(self):
+        with mock.patch.object(ingestor, 'max_bytes', 64), self.assertRaises(forms.ValidationError):
+            ingestor.ingest(self.png((32, 32)))
+        with mock.patch.object(ingestor, 'max_pixels', 100), self.assertRaises(forms.ValidationError):
+            ingestor.ingest(self.png((32, 32)))
+
+    def test_downscales_large_images(self):
+        with mock.patch.object(ingestor, 'max_side', 16):
+            result = ingestor.ingest(self.png((64, 32)))
+        with Image.open(result) as image:
+            self.assertEqual(image.size, (16, 8))
+
+    def test_admin_field_shows_plain_message(self):
+        with self.assertRaises(forms.ValidationError) as raised:
+            IngestedImageFormField().clean(SimpleUploadedFile('image.png', b'<svg></svg>'))
+        self.assertEqual(raised.exception.messages, ['Upload a valid image (JPEG, PNG, GIF or WebP).'])
+        self.assertEqual(raised.exception.code, 'invalid_image')
+
+
+class TokenCacheTests(TestCase):
+    """ Кэш проверенных токенов: повторный запрос без БД, LRU, сброс при изменении пользователя """
+
+    def setUp(self):
+        token_cache.clear()
+        self.user = User.objects.create_user(username='user@example.com', password='secret12', name='User')
+        self.token = self.user.token
+
+    def authenticate(self, token: str):
+        return JWTAuthentication().authenticate(mock.Mock(headers={"Authorization": f'Bearer {token}'}))[0]
+
+    def test_repeated_token_skips_database(self):
+        self.assertEqual(self.authenticate(self.token).pk, self.user.pk)
+        with self.assertNumQueries(0):
+            user = self.authenticate(self.token)
+        self.assertEqual(user.pk, self.user.pk)
+        # Каждый запрос получает свою копию пользователя
+        user.name = 'Changed'
+        self.assertEqual(self.authenticate(self.token).name, 'User')
+
+    def test_user_change_invalidates_tokens(self):
+        self.authenticate(self.token)
+        self.user.name = 'Renamed'
+        self.user.save()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.authenticate(self.token).name, 'Renamed')
+
+    def test_lru_and_token_lifetime(self):
+        cache = TokenCache(maxsize=2, ttl=60)
+        future = datetime.now() + timedelta(days=1)
+        for token in ('a', 'b'):
+            cache.set(token, self.user, future)
+        cache.get('a')
+        cache.set('c', self.user, future)
+        self.assertIsNone(cache.get('b'))
+        self.assertIsNotNone(cache.get('a'))
+        # Токен с истекшим сроком не кэшируется
+        cache.set('expired', self.user, datetime.now() - timedelta(seconds=1))
+        self.assertIsNone(cache.get('expired'))
+        cache.invalidate_user(self.user.pk)
+        self.assertEqual(cache.stats()["size"], 0)
+
+    def test_invalid_token_is_rejected(self):
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(self.token[:-2] + 'xx')
+
+
+class SigninTests(TestCase):
+    """ Вход только читает таблицу пользователей, регистрация переживает гонку за username """
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='user@example.com', password='secret12', name='User')
+
+    def post(self, path: str, data: dict):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(path, data)
+        writes = [query['sql'] for query in queries.captured_queries
+                  if query['sql'].split(' ', 1)[0] in ('INSERT', 'UPDATE', 'DELETE')]
+        return response, writes
+
+    def test_signin_does_not_write(self):
+        for path in ('/api/v1/auth/signin/', '/api/v1/auth/async/signin/'):
+            response, writes = self.post(path, {"username": 'user@example.com', "password": 'secret12'})
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.json()["token"])
+            self.assertEqual(writes, [])
+
+    def test_unknown_user_is_not_created(self):
+        response, writes = self.post('/api/v1/auth/signin/', {"username": 'new@example.com', "password": 'secret12'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(writes, [])
+        self.assertFalse(User.objects.filter(username='new@example.com').exists())
+
+    def test_concurrent_signup_reports_duplicate(self):
+        data = {"username": 'user@example.com', "password": 'secret12', "name": 'Other'}
+        # Вторая регистрация прошла проверку exists() раньше, чем первая закоммитилась
+        with mock.patch('django.db.models.query.QuerySet.exists', return_value=False):
+            response, _ = self.post('/api/v1/auth/signup/', data)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {"info": 'User with phone/email user@example.com already exists'})
+        self.assertEqual(User.objects.filter(username='user@example.com').count(), 1)
+
+
+class ConditionalGetTests(TestCase):
+    """ 304 по ETag/Last-Modified без сериализации; запись и удаление меняют валидаторы """
+
+    def setUp(self):
+        caches[settings.RESPONSE_CACHE_ALIAS].clear()
+        token_cache.clear()
+        self.user = User.objects.create_user(username='user@example.com', password='secret12', name='User')
+        self.headers = {"HTTP_AUTHORIZATION": f'Bearer {self.user.token}'}
+        with self.captureOnCommitCallbacks(execute=True):
+            self.articles = [Article.objects.create(title=f'Article {i}', text='Text') for i in range(2)]
+
+    def get(self, path='/api/v1/news/all/', **headers):
+        return self.client.get(path, **self.headers, **headers)
+
+    def test_not_modified_skips_serialization(self):
+        first = self.get()
+        self.assertEqual(first.status_code, 200)
+        self.assertTrue(first['ETag'] and first['Last-Modified'])
+        with mock.patch('tlc.views.streaming_list') as view_body:
+            repeated = self.get(HTTP_IF_NONE_MATCH=first['ETag'])
+            by_date = self.get(HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+        view_body.assert_not_called()
+        for response in (repeated, by_date):
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.content, b'')
+            self.assertEqual(response['ETag'], first['ETag'])
+
+    def test_writes_change_etag(self):
+        etag = self.get()['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.articles[0].title = 'Renamed'
+            self.articles[0].save()
+        renamed = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(renamed.status_code, 200)
+        # Удаление не двигает max(updated_at), его ловит count
+        with self.captureOnCommitCallbacks(execute=True):
+            self.articles[1].delete()
+        deleted = self.get(HTTP_IF_NONE_MATCH=renamed['ETag'])
+        self.assertEqual(deleted.status_code, 200)
+        self.assertNotEqual(deleted['ETag'], renamed['ETag'])
+
+    def test_etag_is_per_object(self):
+        first = self.get(f'/api/v1/news/{self.articles[0].pk}/')
+        second = self.get(f'/api/v1/news/{self.articles[1].pk}/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 200)
+        self.assertNotEqual(second['ETag'], first['ETag'])
+
+
+class AboutTests(TestCase):
+    """ "О компании" одним запросом с prefetch фото; смена набора фото сбрасывает кэш """
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        media_settings = override_settings(MEDIA_ROOT=self.media_root)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        # Варианты фото здесь не нужны
+        patcher = mock.patch.object(pipeline, 'schedule')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        caches[settings.RESPONSE_CACHE_ALIAS].clear()
+        token_cache.clear()
+        self.user = User.objects.create_user(username='user@example.com', password='secret12', name='User')
+        self.headers = {"HTTP_AUTHORIZATION": f'Bearer {self.user.token}'}
+        with self.captureOnCommitCallbacks(execute=True):
+            self.photos = []
+            for color in ((255, 0, 0), (0, 255, 0), (0, 0, 255)):
+                photo = AttachmentPhoto()
+                photo.photo.save('photo.png', ContentFile(png_bytes(color=color)), save=True)
+                self.photos.append(photo)
+            self.about = About.objects.create(video='video/about.mp4', text='About')
+            self.about.attaches.set(self.photos[:2])
+            # Фото другой записи не должны попасть в ответ
+            About.objects.create(video='video/other.mp4', text='Other').attaches.set(self.photos[2:])
+
+    def attach_ids(self) -> list:
+        response = self.client.get('/api/v1/about/', **self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["text"], 'About')
+        return sorted(attach["id"] for attach in response.json()["attaches"])
+
+    def test_attaches_of_first_about(self):
+        with self.assertNumQueries(3):
+            self.assertEqual(self.attach_ids(), [photo.pk for photo in self.photos[:2]])
+
+    def test_attach_change_invalidates_cache(self):
+        self.attach_ids()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.about.attaches.remove(self.photos[0])
+        self.assertEqual(self.attach_ids(), [self.photos[1].pk])
+
+
+VARIANTS = {
+    "source": 'products/cas/ab/photo.png', "width": 640, "height": 480, "placeholder": 'data:image/webp;base64,AA==',
+    "webp": {"320": 'variants/products/cas/ab/photo/320.webp'}, "jpeg": {"320": 'variants/products/cas/ab/photo/320.jpg'},
+}
+
+
+class FastSerializerTests(TestCase):
+    """ Быстрый путь values_list() отдает тот же JSON, что и исходные сериализаторы """
+
+    def setUp(self):
+        category = ProductCategory.objects.create(title='Категория')
+        self.products = [
+            Product.objects.create(category=category, title='Товар «1»', summary='Кратко\u2028', text='Текст', top=1,
+                                   photo='products/cas/ab/photo.png', photo_variants=VARIANTS),
+            Product.objects.create(category=category, title=None, summary=None),
+        ]
+        ProductResults.objects.create(product=self.products[0], name='Отзыв', photo_before='products_res_before/a b.png',
+                                      links={"vk": 'https://vk.com/a'})
+        ProductResults.objects.create(product=self.products[0])
+        Article.objects.create(title='Новость', summary='Кратко', text='Текст', photo='news_photos/a.png')
+        Article.objects.create(title='Пусто')
+
+    def request(self, query: str = ''):
+        return Request(RequestFactory().get('/api/v1/?' + query, HTTP_HOST='testserver'))
+
+    def assertSameJSON(self, serializer_class, queryset, query: str = ''):
+        context = {"request": self.request(query)}
+        fast = FastSerializer(serializer_class, context).serialize(queryset)
+        regular = serializer_class(instance=queryset, many=True, context=context).data
+        self.assertEqual(JSONRenderer().render(fast), JSONRenderer().render(regular))
+
+    def test_matches_regular_serializers(self):
+        cases = (
+            (ProductSerializer, Product.objects.order_by('id')),
+            (ProductListSerializer, Product.objects.order_by('id')),
+            (ProductResultSerializer, ProductResults.objects.order_by('id')),
+            (ArticleSerializer, Article.objects.order_by('id')),
+            (ArticleListSerializer, Article.objects.order_by('id')),
+        )
+        for serializer_class, queryset in cases:
+            with self.subTest(serializer=serializer_class.__name__):
+                self.assertSameJSON(serializer_class, queryset)
+
+    def test_matches_sparse_fields(self):
+        for query in ('fields=id,title', 'fields=category,photo_variants', 'fields=id'):
+            with self.subTest(query=query):
+                self.assertSameJSON(ProductListSerializer, Product.objects.order_by('id'), query)
+        rows = FastSerializer(ProductListSerializer, {"request": self.request('fields=id')}).serialize(Product.objects.all())
+        self.assertEqual(list(rows[0]), ['id'])
+
+    def test_reads_columns_without_models(self):
+        context = {"request": self.request()}
+        serializer = FastSerializer(ProductListSerializer, context)
+        with self.assertNumQueries(1):
+            rows = serializer.serialize(Product.objects.order_by('id'))
+        self.assertEqual(rows[0]["category"]["title"], 'Категория')
+
+
+class StreamingTests(TestCase):
+    """ Потоковый JSON побайтно совпадает с JSONRenderer при любом размере буфера """
+
+    items = [
+        {"id": 1, "title": 'Новость «1»', "text": 'строка\u2028разделитель\u2029абзац', "photo": None},
+        {"id": 2, "title": 'emoji \U0001f600', "rate": 0.5, "tags": ['a', 'b'], "nested": {"ok": True}},
+        {"id": 3, "title": '</script>', "text": ''},
+    ]
+
+    def test_matches_json_renderer(self):
+        expected = JSONRenderer().render(self.items)
+        for buffer_size in (1, 16, 1024 * 1024):
+            with self.subTest(buffer_size=buffer_size):
+                chunks = list(iter_json_list(iter(self.items), buffer_size=buffer_size))
+                self.assertEqual(b''.join(chunks), expected)
+        self.assertEqual(len(list(iter_json_list(iter(self.items), buffer_size=1))), len(self.items) + 1)
+        self.assertEqual(b''.join(iter_json_list(iter([]))), JSONRenderer().render([]))
+
+    def test_endpoint_streams_same_bytes(self):
+        token_cache.clear()
+        caches[settings.RESPONSE_CACHE_ALIAS].clear()
+        user = User.objects.create_user(username='user@example.com', password='secret12', name='User')
+        for i in range(5):
+            Article.objects.create(title=f'Новость {i}', summary='Кратко\u2028', text='Текст')
+        response = self.client.get('/api/v1/news/all/', HTTP_AUTHORIZATION=f'Bearer {user.token}')
+        self.assertTrue(response.streaming)
+        body = b''.join(response.streaming_content)
+        request = Request(RequestFactory().get('/api/v1/news/all/'))
+        articles = ArticleSerializer.optimize_queryset(Article.objects.all(), request, extra=('created_at',))
+        expected = ArticleSerializer(instance=articles, many=True, context={"request": request}).data
+        self.assertEqual(body, JSONRenderer().render(expected))
+
+
+class LeaderboardTests(TestCase):
+    """ Топ товаров из кэша совпадает с выборкой из БД после точечных правок сигналами """
+
+    def setUp(self):
+        patcher = mock.patch.object(pipeline, 'schedule')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        caches[settings.RESPONSE_CACHE_ALIAS].clear()
+        token_cache.clear()
+        self.user = User.objects.create_user(username='user@example.com', password='secret12', name='User')
+        self.headers = {"HTTP_AUTHORIZATION": f'Bearer {self.user.token}'}
+        with self.captureOnCommitCallbacks(execute=True):
+            self.categories = [ProductCategory.objects.create(title=f'Категория {i}') for i in range(2)]
+            self.products = [
+                Product.objects.create(category=self.categories[i % 2], title=f'Товар {i}', top=top,
+                                       photo='products/cas/ab/photo.png' if i == 0 else None)
+                for i, top in enumerate((3, 1, None, 2, 1))
+            ]
+
+    def top(self, query: str = '') -> bytes:
+        response = self.client.get('/api/v1/product/top/?' + query, **self.headers)
+        self.assertEqual(response.status_code, 200)
+        return response.content
+
+    def expected(self, category=None, limit: int = 5) -> bytes:
+        products = Product.objects.filter(top__isnull=False).order_by('top', 'id')
+        if category is not None:
+            products = products.filter(category=category)
+        request = Request(RequestFactory().get('/'))
+        return JSONRenderer().render(ProductSerializer(instance=products[:limit], many=True, context={"request": request}).data)
+
+    def test_matches_database(self):
+        self.assertEqual(self.top(), self.expected())
+        self.assertEqual(self.top('limit=2'), self.expected(limit=2))
+        self.assertEqual(self.top(f'category={self.categories[1].pk}'), self.expected(self.categories[1]))
+        self.assertIn(b'http://testserver/media/products/cas/ab/photo.png', self.top())
+
+    def test_writes_update_board_in_place(self):
+        self.top()
+        with self.captureOnCommitCallbacks(execute=True):
+            moved = Product.objects.get(pk=self.products[2].pk)
+            moved.top = 0
+            moved.save()
+            self.products[1].delete()
+            self.categories[0].title = 'Переименована'
+            self.categories[0].save()
+        with mock.patch.object(leaderboard, 'rebuild', side_effect=AssertionError('rebuilt')):
+            self.assertEqual(self.top(), self.expected())
+
+    def test_truncated_board_reads_category_from_database(self):
+        with mock.patch.object(leaderboard, 'max_rows', 2):
+            caches[settings.RESPONSE_CACHE_ALIAS].delete(leaderboard.key)
+            self.assertEqual(self.top('limit=2'), self.expected(limit=2))
+            self.assertEqual(self.top(f'category={self.categories[0].pk}'), self.expected(self.categories[0]))
+
+
+class ImageVariantTests(TestCase):
+    """ Уменьшенные копии WebP/JPEG и плейсхолдер; варианты пишутся, только если файл в поле не сменился """
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        media_settings = override_settings(MEDIA_ROOT=self.media_root)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        for patcher in (
+            # Пути вариантов строятся от MEDIA_ROOT из configs.settings
+            mock.patch.object(settings, 'MEDIA_ROOT', self.media_root),
+            mock.patch.object(pipeline, 'schedule'),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def source(self, name: str, size: tuple, mode: str = 'RGB') -> str:
+        path = os.path.join(self.media_root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        Image.new(mode, size, (10, 120, 200, 128) if mode == 'RGBA' else (10, 120, 200)).save(path)
+        return name
+
+    def test_variants_never_upscale(self):
+        variants = generate_variants(self.media_root, self.source('news_photos/a.png', (1000, 500)), (320, 640, 1280), 16)
+        self.assertEqual((variants["width"], variants["height"]), (1000, 500))
+        self.assertEqual(sorted(variants["webp"]), ['320', '640'])
+        with Image.open(os.path.join(self.media_root, variants["webp"]["320"])) as image:
+            self.assertEqual((image.format, image.size), ('WEBP', (320, 160)))
+        self.assertTrue(variants["placeholder"].startswith('data:image/webp;base64,'))
+        small = generate_variants(self.media_root, self.source('news_photos/b.png', (100, 50)), (320, 640), 16)
+        self.assertEqual(list(small["jpeg"]), ['100'])
+
+    def test_transparent_jpeg_on_white(self):
+        variants = generate_variants(self.media_root, self.source('news_photos/c.png', (400, 400), 'RGBA'), (320,), 16)
+        with Image.open(os.path.join(self.media_root, variants["jpeg"]["320"])) as image:
+            self.assertEqual(image.mode, 'RGB')
+            red, green, blue = image.getpixel((10, 10))
+            self.assertGreater(red, 100)
+
+    def test_generate_updates_row_and_serializer(self):
+        article = Article.objects.create(title='Article', photo=self.source('news_photos/d.png', (800, 400)))
+        pipeline.generate(article, 'photo')
+        article.refresh_from_db()
+        self.assertEqual(article.photo_variants["source"], 'news_photos/d.png')
+        request = Request(RequestFactory().get('/'))
+        data = ArticleListSerializer(instance=article, context={"request": request}).data
+        self.assertTrue(data["photo_variants"]["webp"]["320"].startswith('http://testserver/media/variants/news_photos/d/'))
+
+    def test_stale_result_is_dropped(self):
+        article = Article.objects.create(title='Article', photo=self.source('news_photos/new.png', (400, 200)))
+        variants = generate_variants(self.media_root, self.source('news_photos/old.png', (400, 200)), (320,), 16)
+        pipeline.store(Article, article.pk, 'photo', 'news_photos/old.png', variants, None)
+        article.refresh_from_db()
+        self.assertIsNone(article.photo_variants)
+
+
+class MediaServerTests(TestCase):
+    """ Отдача медиа: Range/If-Range, 304, закрытые папки по токену, X-Accel-Redirect """
+
+    content = bytes(range(256)) * 40
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        for patcher in (
+            mock.patch.object(media_server, 'root', self.media_root),
+            mock.patch.object(media_server, 'protected_prefixes', ('documents/',)),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        for name in ('video/clip.mp4', 'documents/secret.pdf'):
+            os.makedirs(os.path.join(self.media_root, os.path.dirname(name)), exist_ok=True)
+            with open(os.path.join(self.media_root, name), 'wb') as file:
+                file.write(self.content)
+        token_cache.clear()
+        self.user = User.objects.create_user(username='user@example.com', password='secret12', name='User')
+
+    def get(self, path: str = '/media/video/clip.mp4', **headers):
+        response = self.client.get(path, **headers)
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, body
+
+    def test_full_and_conditional(self):
+        response, body = self.get()
+        self.assertEqual((response.status_code, body), (200, self.content))
+        self.assertEqual(response['Content-Type'], 'video/mp4')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        not_modified, _ = self.get(HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_ranges(self):
+        size = len(self.content)
+        for header, start, end in (('bytes=100-199', 100, 199), ('bytes=-10', size - 10, size - 1),
+                                   ('bytes=%d-' % (size - 5), size - 5, size - 1), ('bytes=0-99999', 0, size - 1)):
+            with self.subTest(header=header):
+                response, body = self.get(HTTP_RANGE=header)
+                self.assertEqual(response.status_code, 206)
+                self.assertEqual(response['Content-Range'], 'bytes %d-%d/%d' % (start, end, size))
+                self.assertEqual(body, self.content[start:end + 1])
+        unsatisfiable, _ = self.get(HTTP_RANGE='bytes=%d-' % size)
+        self.assertEqual((unsatisfiable.status_code, unsatisfiable['Content-Range']), (416, 'bytes */%d' % size))
+        # Несколько диапазонов не поддерживаются - весь файл
+        multiple, body = self.get(HTTP_RANGE='bytes=0-1,5-6')
+        self.assertEqual((multiple.status_code, body), (200, self.content))
+
+    def test_if_range(self):
+        etag = self.get()[0]['ETag']
+        matched, body = self.get(HTTP_RANGE='bytes=10-19', HTTP_IF_RANGE=etag)
+        self.assertEqual((matched.status_code, body), (206, self.content[10:20]))
+        stale, body = self.get(HTTP_RANGE='bytes=10-19', HTTP_IF_RANGE='"changed"')
+        self.assertEqual((stale.status_code, body), (200, self.content))
+
+    def test_protected_prefix_requires_token(self):
+        anonymous, _ = self.get('/media/documents/secret.pdf')
+        self.assertEqual((anonymous.status_code, anonymous['WWW-Authenticate']), (401, 'Bearer'))
+        invalid, _ = self.get('/media/documents/secret.pdf', HTTP_AUTHORIZATION='Bearer invalid')
+        self.assertEqual(invalid.status_code, 401)
+        allowed, body = self.get('/media/documents/secret.pdf', HTTP_AUTHORIZATION=f'Bearer {self.user.token}')
+        self.assertEqual((allowed.status_code, body), (200, self.content))
+        self.assertTrue(allowed['Cache-Control'].startswith('private'))
+        self.assertEqual(allowed['Vary'], 'Authorization')
+
+    def test_hidden_and_traversal_paths(self):
+        for path in ('/media/../configs/settings.py', '/media/video/.hidden', '/media/video/', '/media/video'):
+            with self.subTest(path=path):
+                self.assertEqual(self.get(path)[0].status_code, 404)
+
+    def test_accel_redirect(self):
+        with mock.patch.object(media_server, 'accel_prefix', '/protected-media/'):
+            response, body = self.get(HTTP_RANGE='bytes=0-9')
+        self.assertEqual((response.status_code, body), (200, b''))
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/video/clip.mp4')
+        self.assertEqual(response['Content-Type'], 'video/mp4')
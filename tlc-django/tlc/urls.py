@@ -14,12 +14,17 @@ router.register(r'social', SocialView, basename='social')
 router.register(r'product', ProductView, basename='product')
 router.register(r'video', VideoView, basename='video')
 router.register(r'education', EducationView, basename='education')
+router.register(r'uploads', UploadView, basename='uploads')
 
 urlpatterns = [
     # path('auth/send/', reset_password),
     # url(r'^auth/registration/$', TokenViewSet.as_view()),
+    path('auth/async/signin/', async_signin),
     path('about/', get_about),
+    path('bootstrap/', bootstrap),
+    path('search/', search),
     path('support/', support),
+    path('metrics/', metrics),
 ]
 
 urlpatterns += router.urls
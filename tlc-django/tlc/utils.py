@@ -1,21 +1,8 @@
-import smtplib
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
-import os
-
-
 def send_email(m: str, to: str, s: str):
-    msg = MIMEMultipart()
-
-    password = os.environ.get('EMAIL_PASSWORD')
-    msg['From'] = os.environ.get('EMAIL_LOGIN')
-    msg['To'] = to
-    msg['Subject'] = s
-
-    msg.attach(MIMEText(m, 'plain'))
+    """
+    Ставит письмо в очередь на отправку (см. tlc.core.outbox),
+    сама отправка идет в фоне и не держит запрос
+    """
+    from tlc.core.outbox import outbox
 
-    server = smtplib.SMTP('smtp.yandex.ru', 587)
-    server.starttls()
-    server.login(msg['From'], password)
-    server.sendmail(msg['From'], msg['To'], msg.as_string())
-    server.quit()
+    return outbox.enqueue(m, to, s)
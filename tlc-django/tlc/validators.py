@@ -14,3 +14,33 @@ def validate_video_extension(value):
     valid_extensions = ['.mp4', '.avi']
     if not ext.lower() in valid_extensions:
         raise ValidationError([{'info': 'Unsupported video file extension.'}])
+
+
+# Сигнатуры начала файла по расширению: (смещение, байты), подходит любая
+FILE_SIGNATURES = {
+    '.pdf': ((0, b'%PDF-'),),
+    '.doc': ((0, b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'),),
+    '.xls': ((0, b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'),),
+    '.docx': ((0, b'PK\x03\x04'),),
+    '.xlsx': ((0, b'PK\x03\x04'),),
+    '.mp4': ((4, b'ftyp'),),
+    '.avi': ((8, b'AVI '),),
+}
+
+
+def validate_file_content(value):
+    """
+    Сверка содержимого с расширением по первым байтам файла (для .avi - RIFF....AVI).
+    Читает только заголовок, позиция в файле сохраняется
+    """
+    import os
+    from django.core.exceptions import ValidationError
+    signatures = FILE_SIGNATURES.get(os.path.splitext(value.name)[1].lower())
+    if not signatures:
+        return
+    position = value.tell()
+    value.seek(0)
+    header = value.read(16)
+    value.seek(position)
+    if not any(header[offset:offset + len(magic)] == magic for offset, magic in signatures):
+        raise ValidationError([{'info': 'File content does not match its extension.'}])
@@ -5,21 +5,55 @@ from django.shortcuts import render
 # Create your views here.
 from fcm_django.api.rest_framework import FCMDeviceAuthorizedViewSet
 from fcm_django.models import FCMDevice
-from rest_framework import status, generics, viewsets
-from rest_framework.decorators import api_view, permission_classes, action
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework import exceptions, status, generics, viewsets
+from rest_framework.authentication import BasicAuthentication
+from rest_framework.decorators import api_view, authentication_classes, permission_classes, action
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from django.contrib.auth.password_validation import validate_password
 
-from tlc.models import ConfirmCode, User
+from tlc.models import User
 from tlc.serializers import *
 
 from tlc import utils
-
+from configs import settings
+from tlc.core import codes, hashing
+from tlc.core.auth import ClaimsJWTAuthentication, token_cache
+from tlc.core.bundles import bundles
+from tlc.core.budgets import budgets
+from tlc.core.outbox import outbox
+from tlc.core.push import fanout
+from tlc.core.conditional import conditional
+from tlc.core.fast_serializers import fast_data
+from tlc.core.images import pipeline as image_pipeline
+from tlc.core.ingest import ingestor
+from tlc.core.leaderboard import leaderboard
+from tlc.core.pagination import KeysetPagination
+from tlc.core.response_cache import cached_response, response_cache
+from tlc.core.search import engine as search_engine
+from tlc.core.snapshots import snapshot_response, snapshots
+from tlc.core.streaming import streaming_list
+from tlc.core.uploads import uploads
+
+import copy
 import os
 import json
 
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, JsonResponse, QueryDict
+from django.urls import reverse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def is_summary(request) -> bool:
+    """
+    ?view=summary - облегченный режим списка (без полных текстов)
+    """
+    return request.query_params.get('view') == 'summary'
+
 
 class AuthView(viewsets.ViewSet):
     """
@@ -54,15 +88,17 @@ class AuthView(viewsets.ViewSet):
             user = User.objects.get(username=username)
         except Exception:
             return Response({"info": f"there is no user with username {username}"}, status=status.HTTP_400_BAD_REQUEST)
-        confirm_code, _ = ConfirmCode.objects.get_or_create(user=user)
-        confirm_code.save()
+        confirm_code = codes.store.issue(user.pk)
+        if confirm_code is None:
+            return Response({"info": "too many reset codes requested, try again later"},
+                            status=status.HTTP_429_TOO_MANY_REQUESTS)
 
         if re.match(r'^\+7[0-9]{10}$', username):
             # is phone
-            return Response({"info": f"confirm code is send to your phone {confirm_code.code}"}, status=status.HTTP_200_OK)
+            return Response({"info": f"confirm code is send to your phone {confirm_code}"}, status=status.HTTP_200_OK)
         elif re.match(r'^[\w\.-]+@[\w\.-]+(\.[\w]+)+$', username):
             # is email
-            message = f'Ваш код для сброса пароля: {confirm_code.code}'
+            message = f'Ваш код для сброса пароля: {confirm_code}'
             utils.send_email(message, username, 'TLC Сброс пароля')
             return Response({"info": f"confirm code is send to your email {username}"}, status=status.HTTP_200_OK)
         else:
@@ -77,22 +113,55 @@ class AuthView(viewsets.ViewSet):
         username=request.data.get('username')
         user = User.objects.get(username=username)
         confirm_code_data = int(request.data.get('code'))
-        confirm_code = ConfirmCode.objects.filter(user=user).first()
         new_pass = request.data.get('password')
         # try:
         #     validate_password(new_pass)
         # except Exception as e:
         #     return Response({"info": e})
-        if confirm_code is None:
+        result = codes.store.verify(user.pk, confirm_code_data)
+        if result == codes.CODE_MISSING:
             return Response({"info": f"Reset code was not send"}, status=status.HTTP_400_BAD_REQUEST)
-        if confirm_code_data != confirm_code.code:
+        if result == codes.CODE_EXHAUSTED:
+            return Response({"info": f"Too many attempts, request a new code"}, status=status.HTTP_400_BAD_REQUEST)
+        if result != codes.CODE_OK:
             return Response({"info": f"Wrong code"}, status=status.HTTP_400_BAD_REQUEST)
-        confirm_code.delete()
-        user.set_password(new_pass)
+        user.password = hashing.pool.make_password(new_pass)
         user.save()
         return Response({"info": f"Password was reset successfully"}, status=status.HTTP_200_OK)
 
 
+async def async_signin(request):
+    """
+    Асинхронный вход: проверка пароля уходит в пул хэширования,
+    event loop при этом свободен для других запросов
+    """
+    if request.method != 'POST':
+        return JsonResponse({"info": "Method not allowed"}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
+    if request.content_type == 'application/json':
+        try:
+            data = json.loads(request.body)
+        except ValueError:
+            return JsonResponse({"info": "Invalid JSON"}, status=status.HTTP_400_BAD_REQUEST)
+    else:
+        data = request.POST
+    username, password = data.get('username'), data.get('password')
+    if not username or not password:
+        return JsonResponse({"info": "username and password are required"}, status=status.HTTP_400_BAD_REQUEST)
+    user = await sync_to_async(User.objects.filter(username=username).first)()
+    try:
+        is_valid = await hashing.pool.acheck_user_password(user, password)
+    except hashing.HashingUnavailable as e:
+        return JsonResponse(e.detail, status=e.status_code)
+    if not is_valid:
+        return JsonResponse({"info": "Bad username/password"}, status=status.HTTP_400_BAD_REQUEST)
+    data = AuthorizationSerializer(instance=user, context={"request": request}).data
+    return JsonResponse(data, status=status.HTTP_200_OK, json_dumps_params={"ensure_ascii": False})
+
+
+# csrf_exempt в Django 3.2 не умеет оборачивать корутины
+async_signin.csrf_exempt = True
+
+
 class UserView(viewsets.ViewSet):
     """
     Обновление профиля пользователя. Вывод информации о пользователе
@@ -118,17 +187,27 @@ class NewsView(viewsets.ViewSet):
     """
     Получение новостей
     """
+    authentication_classes = (ClaimsJWTAuthentication, BasicAuthentication)
     permission_classes = (IsAuthenticated, )
     serializer_class = ArticleSerializer
 
     @action(methods=['GET'], detail=False, url_path='all', url_name='Get all news', permission_classes=[IsAuthenticated])
+    @conditional('news/all', (Article,), lambda: Article.objects.all())
+    @cached_response('news/all', (Article,))
     def all_news(self, request, *args, **kwargs):
-        articles = Article.objects.all()
-        return Response(ArticleSerializer(instance=articles, many=True, context={"request": request}).data, status=status.HTTP_200_OK)
-
-    @action(methods=['GET'], detail=False, url_path='(?P<id>[^/]+)', url_name='Get article by id', permission_classes=[IsAuthenticated])
+        serializer_class = ArticleListSerializer if is_summary(request) else ArticleSerializer
+        articles = serializer_class.optimize_queryset(Article.objects.all(), request, extra=('created_at',))
+        paginator = KeysetPagination(ordering=('-created_at', '-id'))
+        if paginator.is_requested(request):
+            return paginator.respond(request, self, articles, serializer_class, {"request": request})
+        return streaming_list(serializer_class, articles, {"request": request})
+
+    @action(methods=['GET'], detail=False, url_path=r'(?P<id>\d+)', url_name='Get article by id', permission_classes=[IsAuthenticated])
+    @conditional('news/id', (Article,), lambda id: Article.objects.filter(id=id))
     def get_article(self, request, id, *args, **kwargs):
-        article = Article.objects.get(id=id)
+        article = Article.objects.filter(id=id).first()
+        if article is None:
+            raise exceptions.NotFound({"info": 'Not found'})
         return Response(ArticleSerializer(instance=article, context={"request": request}).data, status=status.HTTP_200_OK)
 
 
@@ -136,36 +215,44 @@ class DocumentsView(viewsets.ViewSet):
     """
     Получение документов
     """
+    authentication_classes = (ClaimsJWTAuthentication, BasicAuthentication)
     permission_classes = (IsAuthenticated, )
     serializer_class = DocumentSerializer
 
     @action(methods=['GET'], detail=False, url_path='all', url_name='Get all documents', permission_classes=permission_classes)
+    @conditional('docs/all', (Document,), lambda: Document.objects.filter(is_educate=False))
+    @cached_response('docs/all', (Document,))
     def all_docs(self, request, *args, **kwargs):
         docs = Document.objects.filter(is_educate=False)
-        return Response(self.serializer_class(instance=docs, many=True, context={"request": request}).data, status=status.HTTP_200_OK)
+        return streaming_list(self.serializer_class, docs, {"request": request})
 
 
 class VideoView(viewsets.ViewSet):
     """
     Получение видео
     """
+    authentication_classes = (ClaimsJWTAuthentication, BasicAuthentication)
     permission_classes = (IsAuthenticated, )
     serializer_class = VideoSerializer
 
     @action(methods=['GET'], detail=False, url_path='all', url_name='Get all videos', permission_classes=permission_classes)
+    @conditional('video/all', (Video,), lambda: Video.objects.filter(is_educate=False))
+    @cached_response('video/all', (Video,))
     def all_videos(self, request, *args, **kwargs):
         videos = Video.objects.filter(is_educate=False)
-        return Response(self.serializer_class(instance=videos, many=True, context={"request": request}).data, status=status.HTTP_200_OK)
+        return streaming_list(self.serializer_class, videos, {"request": request})
 
 
 class ChatView(viewsets.ViewSet):
     """
     Получение чатов
     """
+    authentication_classes = (ClaimsJWTAuthentication, BasicAuthentication)
     permission_classes = (IsAuthenticated, )
     serializer_class = ChatSerializer
 
     @action(methods=['GET'], detail=False, url_path='all', url_name='Get all chats', permission_classes=permission_classes)
+    @snapshot_response('chats')
     def all_chats(self, request, *args, **kwargs):
         chats = Chat.objects.all()
         return Response(self.serializer_class(instance=chats, many=True, context={"request": request}).data, status=status.HTTP_200_OK)
@@ -175,25 +262,144 @@ class SocialView(viewsets.ViewSet):
     """
     Получение соц сетей
     """
+    authentication_classes = (ClaimsJWTAuthentication, BasicAuthentication)
     permission_classes = (IsAuthenticated, )
     serializer_class = SocialSerializer
 
     @action(methods=['GET'], detail=False, url_path='all', url_name='Get all socials', permission_classes=permission_classes)
+    @snapshot_response('social')
     def all_socials(self, request, *args, **kwargs):
         socials = Social.objects.all()
         return Response(self.serializer_class(instance=socials, many=True, context={"request": request}).data, status=status.HTTP_200_OK)
 
 
 @api_view(['GET'])
+@authentication_classes((ClaimsJWTAuthentication, BasicAuthentication))
 @permission_classes((IsAuthenticated,))
+@cached_response('about', (About, AttachmentPhoto))
 def get_about(request):
     """
     Получение информации о компании
     """
-    about = About.objects.first()
+    about = About.objects.prefetch_related('attaches').first()
     return Response(AboutSerializer(instance=about, context={"request": request}).data, status=status.HTTP_200_OK)
 
 
+def plain_request(request, path: str = None) -> Request:
+    """
+    Копия запроса без query-параметров (и с путем path): разделы bootstrap общие
+    для всех, поэтому ?fields= и ?view= вызывающего не попадают ни в ответ, ни в кэш
+    """
+    plain = copy.copy(getattr(request, '_request', request))
+    plain.GET = QueryDict()
+    plain.META = {**plain.META, 'QUERY_STRING': ''}
+    if path is not None:
+        plain.path = plain.path_info = path
+    return Request(plain)
+
+
+def first_news_page(request) -> dict:
+    """ Первая страница news/all в кратком виде; ссылка next продолжает ленту курсором """
+    request = plain_request(request, reverse('news-Get all news'))
+    paginator = KeysetPagination(ordering=('-created_at', '-id'))
+    articles = ArticleListSerializer.optimize_queryset(Article.objects.all(), request, extra=('created_at',))
+    page = paginator.paginate_queryset(articles, request)
+    return paginator.get_paginated_response(
+        ArticleListSerializer(instance=page, many=True, context={"request": request}).data,
+    ).data
+
+
+BOOTSTRAP_SECTIONS = {
+    'news': ((Article,), lambda request: first_news_page(request)),
+    # функция - раздел отдается готовыми байтами из лидерборда
+    'top': lambda request: leaderboard.render(request, ProductSerializer),
+    # строка - раздел берется из JSON-снапшота (tlc.snapshots)
+    'categories': 'categories',
+    'chats': 'chats',
+    'social': 'social',
+    'about': ((About, AttachmentPhoto), lambda request: AboutSerializer(
+        instance=About.objects.prefetch_related('attaches').first(), context={"request": request}).data),
+}
+
+
+@api_view(['GET'])
+@authentication_classes((ClaimsJWTAuthentication, BasicAuthentication))
+@permission_classes((IsAuthenticated,))
+def bootstrap(request):
+    """
+    Все данные для старта приложения одним запросом.
+    ?sections=news,top,categories,chats,social,about,me - какие разделы вернуть (по умолчанию все).
+    Каждый раздел кэшируется отдельно и общий для всех (без ?fields=/?view=),
+    news - первая страница краткой ленты, me (профиль) не кэшируется
+    """
+    available = list(BOOTSTRAP_SECTIONS) + ['me']
+    sections = request.query_params.get('sections')
+    sections = [section.strip() for section in sections.split(',') if section.strip()] if sections else available
+    unknown = [section for section in sections if section not in available]
+    if unknown:
+        return Response({"info": f"Unknown sections: {', '.join(unknown)}"}, status=status.HTTP_400_BAD_REQUEST)
+    renderer = JSONRenderer()
+    parts = []
+    shared = plain_request(request)
+    for section in dict.fromkeys(sections):
+        if section == 'me':
+            content = renderer.render(UserDetailSerializer(instance=request.user, context={"request": request}).data)
+        elif isinstance(BOOTSTRAP_SECTIONS[section], str):
+            content = snapshots.get(BOOTSTRAP_SECTIONS[section]).render(shared)
+        elif callable(BOOTSTRAP_SECTIONS[section]):
+            content = BOOTSTRAP_SECTIONS[section](shared)
+        else:
+            models, build = BOOTSTRAP_SECTIONS[section]
+            content = response_cache.get_or_build(
+                'bootstrap/' + section, models, shared,
+                lambda: renderer.render(build(shared)), vary_on_query=False,
+            )
+        parts.append(b'"' + section.encode('utf-8') + b'":' + content)
+    return HttpResponse(b'{' + b','.join(parts) + b'}', content_type=renderer.media_type)
+
+
+def parse_positive_int(value, default: int, maximum: int = None) -> int:
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return default
+    if value < 1:
+        return default
+    return min(value, maximum) if maximum else value
+
+
+@api_view(['GET'])
+@authentication_classes((ClaimsJWTAuthentication, BasicAuthentication))
+@permission_classes((IsAuthenticated,))
+@cached_response('search', (Product, Article, FAQ))
+def search(request):
+    """
+    Полнотекстовый поиск по товарам, новостям и FAQ.
+    ?q=текст запроса, ?type=product,article,faq (по умолчанию все),
+    ?page=N и ?page_size=M - страница результатов, отсортированных по релевантности
+    """
+    text = request.query_params.get('q', '').strip()
+    if len(text) < 2 or len(text) > 200:
+        return Response({"info": "q must be from 2 to 200 characters"}, status=status.HTTP_400_BAD_REQUEST)
+    kinds = request.query_params.get('type')
+    kinds = [kind.strip() for kind in kinds.split(',') if kind.strip()] if kinds else list(search_engine.indexes)
+    unknown = [kind for kind in kinds if kind not in search_engine.indexes]
+    if unknown:
+        return Response({"info": f"Unknown types: {', '.join(unknown)}"}, status=status.HTTP_400_BAD_REQUEST)
+    page = parse_positive_int(request.query_params.get('page'), 1)
+    page_size = parse_positive_int(request.query_params.get('page_size'), settings.SEARCH_PAGE_SIZE, settings.SEARCH_MAX_PAGE_SIZE)
+    offset = (page - 1) * page_size
+    if offset > settings.SEARCH_MAX_OFFSET:
+        return Response({"info": "Page is too far, refine the query"}, status=status.HTTP_400_BAD_REQUEST)
+    results, has_next = search_engine.search(text, list(dict.fromkeys(kinds)), offset, page_size)
+    url = request.build_absolute_uri()
+    return Response({
+        "next": replace_query_param(url, 'page', page + 1) if has_next else None,
+        "previous": (replace_query_param(url, 'page', page - 1) if page > 2 else remove_query_param(url, 'page')) if page > 1 else None,
+        "results": results,
+    }, status=status.HTTP_200_OK)
+
+
 @api_view(['POST'])
 @permission_classes((IsAuthenticated,))
 def support(request):
@@ -208,52 +414,152 @@ def support(request):
     return Response({"info": "sended successfully"}, status=status.HTTP_200_OK)
 
 
+@api_view(['GET'])
+@permission_classes((IsAdminUser,))
+def metrics(request):
+    """
+    Внутренние метрики процесса (кэши, очереди)
+    """
+    return Response({
+        "jwt_cache": token_cache.stats(),
+        "password_hashing": hashing.pool.stats(),
+        "email_outbox": outbox.stats(),
+        "push_fanout": fanout.stats(),
+        "response_cache": response_cache.stats(),
+        "snapshots": snapshots.stats(),
+        "image_variants": image_pipeline.stats(),
+        "image_ingest": ingestor.stats(),
+        "query_budgets": budgets.stats(),
+    }, status=status.HTTP_200_OK)
+
+
 class ProductView(viewsets.ViewSet):
     """
     Получение соц сетей
     """
+    authentication_classes = (ClaimsJWTAuthentication, BasicAuthentication)
     permission_classes = (IsAuthenticated, )
 
     @action(methods=['GET'], detail=False, url_path='categories', url_name='Get all product categories', permission_classes=permission_classes)
+    @snapshot_response('categories')
     def get_categories(self, request, *args, **kwargs):
         product_categories = ProductCategory.objects.all()
         return Response(ProductCategorySerializer(instance=product_categories, many=True, context={"request": request}).data, status=status.HTTP_200_OK)
 
-    @action(methods=['GET'], detail=False, url_path='categories/(?P<id>[^/]+)', url_name='Get all products in category', permission_classes=permission_classes)
+    @action(methods=['GET'], detail=False, url_path=r'categories/(?P<id>\d+)', url_name='Get all products in category', permission_classes=permission_classes)
+    @conditional('product/categories/id', (Product, ProductCategory), lambda id: Product.objects.filter(category_id=id), ('updated_at', 'category__updated_at'))
+    @cached_response('product/categories/id', (Product, ProductCategory))
     def get_products_cat(self, request, id, *args, **kwargs):
-        products = Product.objects.filter(category = ProductCategory.objects.get(id=id))
-        return Response(ProductSerializer(instance=products, many=True, context={"request": request}).data, status=status.HTTP_200_OK)
-
-    @action(methods=['GET'], detail=False, url_path='results/(?P<id>[^/]+)', url_name='Get results for product', permission_classes=permission_classes)
+        serializer_class = ProductListSerializer if is_summary(request) else ProductSerializer
+        products = serializer_class.optimize_queryset(Product.objects.filter(category_id=id), request)
+        paginator = KeysetPagination(ordering=('id',))
+        if paginator.is_requested(request):
+            return paginator.respond(request, self, products, serializer_class, {"request": request})
+        return Response(fast_data(serializer_class, products, {"request": request}), status=status.HTTP_200_OK)
+
+    @action(methods=['GET'], detail=False, url_path=r'results/(?P<id>\d+)', url_name='Get results for product', permission_classes=permission_classes)
+    @conditional('product/results', (ProductResults,), lambda id: ProductResults.objects.filter(product_id=id))
     def get_results(self, request, id, *args, **kwargs):
-        product_results = ProductResults.objects.filter(product = Product.objects.get(id=id))
-        return Response(ProductResultSerializer(instance=product_results, many=True, context={"request": request}).data, status=status.HTTP_200_OK)
+        product_results = ProductResults.objects.filter(product_id=id)
+        paginator = KeysetPagination(ordering=('id',))
+        if paginator.is_requested(request):
+            return paginator.respond(request, self, product_results, ProductResultSerializer, {"request": request})
+        return streaming_list(ProductResultSerializer, product_results, {"request": request})
 
     @action(methods=['GET'], detail=False, url_path='top', url_name='Get top product', permission_classes=permission_classes)
     def get_top(self, request, *args, **kwargs):
-        products = Product.objects.filter(top__isnull=False).order_by('top')[0:5]
-        return Response(ProductSerializer(instance=products, many=True, context={"request": request}).data, status=status.HTTP_200_OK)
+        """
+        Топ товаров из материализованного лидерборда.
+        ?category=id - топ внутри категории, ?limit=N - сколько вернуть (по умолчанию 5)
+        """
+        serializer_class = ProductListSerializer if is_summary(request) else ProductSerializer
+        category_id = request.query_params.get('category')
+        if category_id is not None and not category_id.isdigit():
+            return Response({"info": "category must be an integer id"}, status=status.HTTP_400_BAD_REQUEST)
+        category_id = int(category_id) if category_id is not None else None
+        limit = parse_positive_int(request.query_params.get('limit'), 5, settings.LEADERBOARD_MAX_LIMIT)
+        if request.accepted_renderer.format != 'json':
+            products = Product.objects.filter(top__isnull=False).order_by('top', 'id')
+            if category_id is not None:
+                products = products.filter(category_id=category_id)
+            return Response(fast_data(serializer_class, products[:limit], {"request": request}), status=status.HTTP_200_OK)
+        return leaderboard.response(request, serializer_class, category_id, limit)
 
 
 class EducationView(viewsets.ViewSet):
     """
     Получение объектов для обучения
     """
+    authentication_classes = (ClaimsJWTAuthentication, BasicAuthentication)
     permission_classes = (IsAuthenticated, )
 
     @action(methods=['GET'], detail=False, url_path='docs', url_name='Get all edu documents', permission_classes=permission_classes)
+    @snapshot_response('education_docs')
     def all_edu_docs(self, request, *args, **kwargs):
         docs = Document.objects.filter(is_educate=True)
         return Response(DocumentSerializer(instance=docs, many=True, context={"request": request}).data, status=status.HTTP_200_OK)
 
+    @action(methods=['GET'], detail=False, url_path='docs/bundle', url_name='Download edu documents as ZIP', permission_classes=permission_classes)
+    def edu_docs_bundle(self, request, *args, **kwargs):
+        """
+        ZIP со всеми документами обучения или с ?ids=1,2,3. Архив собирается на лету,
+        поддерживает докачку (Range)
+        """
+        docs = Document.objects.filter(is_educate=True).only('id', 'title', 'file').order_by('id')
+        ids = request.query_params.get('ids')
+        if ids:
+            if not re.fullmatch(r'\d+(,\d+)*', ids):
+                return Response({"info": "ids must be comma separated integers"}, status=status.HTTP_400_BAD_REQUEST)
+            docs = docs.filter(pk__in=ids.split(','))
+        # На одну запись больше лимита: bundle ответит 413, не читая весь список
+        return bundles.response(request, bundles.bundle(list(docs[:bundles.max_files + 1]), 'file'), 'education.zip')
+
     @action(methods=['GET'], detail=False, url_path='video', url_name='Get all edu videos', permission_classes=permission_classes)
+    @snapshot_response('education_video')
     def all_edu_videos(self, request, *args, **kwargs):
         videos = Video.objects.filter(is_educate=True)
         return Response(VideoSerializer(instance=videos, many=True, context={"request": request}).data, status=status.HTTP_200_OK)
     
     @action(methods=['GET'], detail=False, url_path='faq', url_name='Get all FAQ', permission_classes=permission_classes)
+    @snapshot_response('education_faq')
     def all_edu_faq(self, request, *args, **kwargs):
         faqs = FAQ.objects.all()
         return Response(FAQSerializer(instance=faqs, many=True, context={"request": request}).data, status=status.HTTP_200_OK)
 
 
+
+
+class UploadView(viewsets.ViewSet):
+    """
+    Загрузка больших файлов (видео, документы) частями с докачкой:
+    start -> PUT частей в любом порядке (X-Chunk-SHA256) -> finalize.
+    GET сессии возвращает принятые части, чтобы продолжить после обрыва
+    """
+    permission_classes = (IsAdminUser, )
+
+    @action(methods=['POST'], detail=False, url_path='start', url_name='Start upload', permission_classes=permission_classes)
+    def start_upload(self, request, *args, **kwargs):
+        serializer = UploadSessionSerializer(data=request.data, context={"request": request})
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    @action(methods=['GET'], detail=False, url_path='(?P<id>[^/]+)', url_name='Upload status', permission_classes=permission_classes)
+    def upload_status(self, request, *args, **kwargs):
+        session = uploads.get(kwargs['id'])
+        return Response(UploadSessionSerializer(instance=session, context={"request": request}).data, status=status.HTTP_200_OK)
+
+    @action(methods=['PUT'], detail=False, url_path=r'(?P<id>[^/]+)/chunks/(?P<index>\d+)', url_name='Upload chunk', permission_classes=permission_classes)
+    def upload_chunk(self, request, *args, **kwargs):
+        session = uploads.get(kwargs['id'])
+        index = int(kwargs['index'])
+        # Тело читается из потока кусками, request.data не трогаем
+        uploads.write_chunk(session, index, request.stream, request.headers.get('X-Chunk-SHA256'))
+        return Response({"info": "chunk stored", "index": index}, status=status.HTTP_200_OK)
+
+    @action(methods=['POST'], detail=False, url_path='(?P<id>[^/]+)/finalize', url_name='Finalize upload', permission_classes=permission_classes)
+    def finalize_upload(self, request, *args, **kwargs):
+        session = uploads.get(kwargs['id'])
+        uploads.finalize(session)
+        session.refresh_from_db()
+        return Response(UploadSessionSerializer(instance=session, context={"request": request}).data, status=status.HTTP_200_OK)